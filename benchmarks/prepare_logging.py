@@ -0,0 +1,119 @@
+"""
+Measure overhead of logging on prepare command over large synthetic corpus.
+
+Corpus of ABC files is generated in temporary directory and prepared in place
+once to warm up and once for each of log levels, then records of chatty third
+party libraries are forwarded through logging at each of levels.
+
+Run as ``python benchmarks/prepare_logging.py --files 500``.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Final, List
+
+from loguru import logger
+from typer.testing import CliRunner
+
+from sarada.console import app
+from sarada.logging import setup_logging
+
+levels: Final = ["TRACE", "DEBUG", "INFO", "WARNING"]
+letters: Final = "CDEFGABcdefgab"
+
+
+def make_corpus(path: Path, files: int, notes: int, seed: int = 0) -> None:
+    """
+    Write given number of random single voice tunes in ABC notation.
+    """
+    rng = random.Random(seed)
+    for number in range(files):
+        body = " ".join(
+            "".join(rng.choice(letters) for _ in range(4))
+            for _ in range(notes // 4)
+        )
+        tune = f"X:{number}\nT:Tune {number}\nM:4/4\nL:1/8\nK:C\n{body}|]\n"
+        (path / f"tune-{number:05}.abc").write_text(tune, encoding="utf-8")
+
+
+def time_prepare(corpus: Path, model: Path, level: str) -> float:
+    """
+    Prepare model from corpus in process, returning elapsed time.
+    """
+    arguments = [
+        "--log-level",
+        level,
+        "prepare",
+        str(corpus),
+        str(model),
+        "--parse-workers",
+        "0",
+        "--fingerprint-workers",
+        "0",
+    ]
+    start = time.perf_counter()
+    result = CliRunner().invoke(app, arguments)
+    elapsed = time.perf_counter() - start
+
+    if result.exit_code:
+        raise RuntimeError(f"Prepare failed: {result.output}")
+
+    return elapsed
+
+
+def time_forwarding(records: int, level: str) -> float:
+    """
+    Forward records of third party loggers through logging, returning elapsed time.
+    """
+    setup_logging(level)
+    logger.remove()
+    with open("/dev/null", "w", encoding="utf-8") as devnull:
+        logger.add(devnull, level=level)
+        loggers = [logging.getLogger(name) for name in ("absl", "h5py", "numba")]
+
+        start = time.perf_counter()
+        for number in range(records):
+            loggers[number % len(loggers)].debug("Chatty record %d", number)
+        elapsed = time.perf_counter() - start
+
+        logger.remove()
+
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=500, help="Files in corpus")
+    parser.add_argument("--notes", type=int, default=400, help="Notes in each file")
+    parser.add_argument(
+        "--records", type=int, default=100_000, help="Forwarded third party records"
+    )
+    args = parser.parse_args()
+
+    results: List[str] = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        corpus = Path(tmpdir) / "corpus"
+        corpus.mkdir()
+        make_corpus(corpus, args.files, args.notes)
+        time_prepare(corpus, Path(tmpdir) / "warmup", "WARNING")
+
+        for level in levels:
+            elapsed = time_prepare(corpus, Path(tmpdir) / f"model-{level}", level)
+            results.append(f"prepare   {level:<8} {elapsed:8.2f}s")
+
+    for level in levels:
+        elapsed = time_forwarding(args.records, level)
+        rate = args.records / elapsed
+        results.append(f"forward   {level:<8} {elapsed:8.2f}s {rate:12.0f} records/s")
+
+    print("\n".join(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Causal self-attention model predicting next value at every position of window.
+
+Attention scores are biased linearly by distance between positions instead of
+adding positional encodings, so that model accepts windows of any length and
+keys computed once may be kept while window slides during generation.
+"""
+from __future__ import annotations
+
+import math
+
+from typing import Dict, Final, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import tensorflow
+
+from keras.engine.training import Model
+from numpy.typing import NDArray
+from tensorflow.keras import Sequential, layers, optimizers, utils
+
+heads: Final = 4
+default_units: Final = (128, 128, 128, 128)
+dropout: Final = 0.1
+norm_epsilon: Final = 1e-5
+masked: Final = -1e9
+
+
+def slopes(count: int) -> NDArray[np.float32]:
+    """
+    Return slopes of distance penalty of each attention head.
+
+    >>> slopes(4)
+    array([0.25  , 0.0625, 0.0156, 0.0039], dtype=float32)
+    """
+    rates: NDArray[np.float32] = 2.0 ** (-8.0 / count * np.arange(1, count + 1))
+    return rates.astype(np.float32).round(4)
+
+
+def assemble(output_length: int, units: Sequence[int], learning_rate: float) -> Model:
+    """
+    Create attention model of blocks of given widths, which must be equal.
+    """
+    if len(set(units)) != 1 or units[0] % heads:
+        raise ValueError(
+            f"Attention blocks must be of equal width divisible by {heads}"
+        )
+
+    layer_list = [ValueEmbedding(output_length, units[0], input_shape=(None, 1))]
+    layer_list += [DecoderBlock(width, heads) for width in units]
+    layer_list += [
+        layers.LayerNormalization(epsilon=norm_epsilon),
+        layers.Dense(output_length),
+        layers.Activation("softmax"),
+    ]
+
+    optimizer = optimizers.Adam(learning_rate=learning_rate, clipnorm=0.5)
+
+    model = Sequential(layers=layer_list)
+    model.compile(loss="sparse_categorical_crossentropy", optimizer=optimizer)
+
+    return model
+
+
+def is_attention(model: Model) -> bool:
+    """
+    Check if model is built of attention blocks.
+    """
+    return any(isinstance(layer, DecoderBlock) for layer in model.layers)
+
+
+@utils.register_keras_serializable(package="sarada")
+class ValueEmbedding(layers.Layer):  # type: ignore
+    """
+    Map normalized values back to their numbers and embed them.
+    """
+
+    def __init__(self, size: int, units: int, **kwargs: object) -> None:
+        super().__init__(**kwargs)
+        self.size: Final = size
+        self.units: Final = units
+        self.table = self.add_weight(
+            name="table", shape=(size, units), initializer="random_normal"
+        )
+
+    def call(self, inputs: tensorflow.Tensor) -> tensorflow.Tensor:
+        scaled = tensorflow.round(inputs[..., 0] * max(self.size - 1, 1))
+        indices = tensorflow.clip_by_value(
+            tensorflow.cast(scaled, tensorflow.int32), 0, self.size - 1
+        )
+        return tensorflow.gather(self.table, indices)
+
+    def get_config(self) -> Dict[str, object]:
+        config: Dict[str, object] = super().get_config()
+        config.update(size=self.size, units=self.units)
+        return config
+
+
+@utils.register_keras_serializable(package="sarada")
+class DecoderBlock(layers.Layer):  # type: ignore
+    """
+    Causal multi-head self-attention followed by feed forward layer.
+
+    Both are applied to normalized inputs and added to them.
+    """
+
+    def __init__(self, units: int, heads: int, **kwargs: object) -> None:
+        super().__init__(**kwargs)
+        self.units: Final = units
+        self.heads: Final = heads
+        self.attention_norm = layers.LayerNormalization(epsilon=norm_epsilon)
+        self.query = layers.Dense(units)
+        self.key = layers.Dense(units)
+        self.value = layers.Dense(units)
+        self.output_projection = layers.Dense(units)
+        self.feed_forward_norm = layers.LayerNormalization(epsilon=norm_epsilon)
+        self.expansion = layers.Dense(4 * units, activation="relu")
+        self.contraction = layers.Dense(units)
+        self.dropout = layers.Dropout(dropout)
+        self.slopes = tensorflow.constant(slopes(heads))
+
+    def call(
+        self, inputs: tensorflow.Tensor, training: bool = False
+    ) -> tensorflow.Tensor:
+        normalized = self.attention_norm(inputs)
+        query = self.split(self.query(normalized))
+        key = self.split(self.key(normalized))
+        value = self.split(self.value(normalized))
+
+        positions = tensorflow.range(tensorflow.shape(inputs)[1])
+        distance = tensorflow.cast(
+            positions[:, tensorflow.newaxis] - positions[tensorflow.newaxis, :],
+            tensorflow.float32,
+        )
+        bias = -self.slopes[:, tensorflow.newaxis, tensorflow.newaxis] * distance
+        bias = tensorflow.where(distance < 0, masked, bias)
+
+        scores = tensorflow.einsum("bqhd,bkhd->bhqk", query, key)
+        weights = tensorflow.nn.softmax(
+            scores / math.sqrt(self.units // self.heads) + bias
+        )
+        attended = tensorflow.einsum("bhqk,bkhd->bqhd", weights, value)
+        shape = tensorflow.shape(inputs)
+        merged = tensorflow.reshape(attended, [shape[0], shape[1], self.units])
+        hidden = inputs + self.dropout(
+            self.output_projection(merged), training=training
+        )
+
+        expanded = self.expansion(self.feed_forward_norm(hidden))
+        return hidden + self.dropout(self.contraction(expanded), training=training)
+
+    def split(self, projected: tensorflow.Tensor) -> tensorflow.Tensor:
+        """
+        Divide last axis of projected inputs between heads.
+        """
+        shape = tensorflow.shape(projected)
+        return tensorflow.reshape(
+            projected, [shape[0], shape[1], self.heads, self.units // self.heads]
+        )
+
+    def get_config(self) -> Dict[str, object]:
+        config: Dict[str, object] = super().get_config()
+        config.update(units=self.units, heads=self.heads)
+        return config
+
+
+@utils.register_keras_serializable(package="sarada")
+class LastStep(layers.Layer):  # type: ignore
+    """
+    Keep only prediction of the last position.
+    """
+
+    def call(self, inputs: tensorflow.Tensor) -> tensorflow.Tensor:
+        return inputs[:, -1]
+
+
+class Cache:
+    """
+    Keys and values of recent positions of each sequence, for generation.
+
+    New values are processed using weights of model copied to memory, attending
+    to cached keys of at most window preceding positions, so that each step
+    costs single position instead of whole window.
+
+    Until window is filled, predictions equal ones of model. Afterwards keys of
+    positions shifted out of window are dropped, but keys of deeper blocks were
+    computed while earlier positions were visible, so they still carry
+    information about them. Predictions are then those of sliding window
+    attention over whole sequence, which differ from model given only window,
+    unless it has single block.
+    """
+
+    def __init__(self, model: Model, window: int) -> None:
+        self.window: Final = window
+        embedding, *blocks, norm, dense, _ = model.layers
+        self.size: Final = embedding.size
+        self.table: Final = embedding.table.numpy()
+        self.blocks: Final = [Weights.of(block) for block in blocks]
+        self.norm: Final = tuple(w.numpy() for w in norm.weights)
+        self.dense: Final = tuple(w.numpy() for w in dense.weights)
+        self.slopes: Final = slopes(heads)[:, np.newaxis, np.newaxis]
+        self.keys: List[NDArray[np.float32]] = []
+        self.values: List[NDArray[np.float32]] = []
+        self.length = 0
+
+    def advance(self, values: NDArray[np.float64]) -> NDArray[np.float32]:
+        """
+        Append normalized values to each sequence, predicting following ones.
+
+        Values are given as array of sequences by positions, probabilities of
+        next value are returned for each sequence.
+        """
+        indices = np.clip(np.rint(values * max(self.size - 1, 1)), 0, self.size - 1)
+        hidden = self.table[indices.astype(np.int64)]
+
+        count = values.shape[1]
+        queries = np.arange(self.length, self.length + count)[:, np.newaxis]
+        keys = np.arange(max(self.length - self.window + 1, 0), queries[-1, 0] + 1)
+        distance = (queries - keys).astype(np.float32)
+        bias = np.where(
+            (distance < 0) | (distance >= self.window),
+            np.float32(masked),
+            -self.slopes * distance,
+        )
+
+        for number, weights in enumerate(self.blocks):
+            hidden = self.block(number, weights, hidden, bias)
+
+        self.length += count
+        scores = dense_apply(normalize(hidden[:, -1], *self.norm), *self.dense)
+        probabilities: NDArray[np.float32] = softmax(scores)
+
+        return probabilities
+
+    def block(
+        self,
+        number: int,
+        weights: Weights,
+        hidden: NDArray[np.float32],
+        bias: NDArray[np.float32],
+    ) -> NDArray[np.float32]:
+        """
+        Apply decoder block to new positions, extending its cache.
+        """
+        normalized = normalize(hidden, *weights.attention_norm)
+        query = split(dense_apply(normalized, *weights.query))
+        key = split(dense_apply(normalized, *weights.key))
+        value = split(dense_apply(normalized, *weights.value))
+
+        if number < len(self.keys):
+            # Cache keeps positions still within window of new ones
+            start = self.keys[number].shape[1] - (bias.shape[-1] - key.shape[1])
+            key = np.concatenate([self.keys[number][:, start:], key], axis=1)
+            value = np.concatenate([self.values[number][:, start:], value], axis=1)
+            self.keys[number], self.values[number] = key, value
+        else:
+            self.keys.append(key)
+            self.values.append(value)
+
+        scores = np.einsum("bqhd,bkhd->bhqk", query, key)
+        attention = softmax(scores / math.sqrt(query.shape[-1]) + bias)
+        attended = np.einsum("bhqk,bkhd->bqhd", attention, value)
+        merged = attended.reshape(*attended.shape[:2], -1)
+        hidden = hidden + dense_apply(merged, *weights.output_projection)
+
+        normalized = normalize(hidden, *weights.feed_forward_norm)
+        expanded = np.maximum(dense_apply(normalized, *weights.expansion), 0)
+        return hidden + dense_apply(expanded, *weights.contraction)
+
+    def select(self, rows: NDArray[np.int64]) -> None:
+        """
+        Keep cached sequences of given numbers, in given order.
+        """
+        self.keys = [key[rows] for key in self.keys]
+        self.values = [value[rows] for value in self.values]
+
+
+Pair = Tuple[NDArray[np.float32], NDArray[np.float32]]
+
+
+class Weights(NamedTuple):
+    """Weights of decoder block, as pairs of kernel and bias or scale and shift."""
+
+    attention_norm: Pair
+    query: Pair
+    key: Pair
+    value: Pair
+    output_projection: Pair
+    feed_forward_norm: Pair
+    expansion: Pair
+    contraction: Pair
+
+    @classmethod
+    def of(cls, block: DecoderBlock) -> Weights:
+        return cls(
+            *(
+                (layer.weights[0].numpy(), layer.weights[1].numpy())
+                for layer in (
+                    block.attention_norm,
+                    block.query,
+                    block.key,
+                    block.value,
+                    block.output_projection,
+                    block.feed_forward_norm,
+                    block.expansion,
+                    block.contraction,
+                )
+            )
+        )
+
+
+def split(projected: NDArray[np.float32]) -> NDArray[np.float32]:
+    """
+    Divide last axis between heads.
+    """
+    return projected.reshape(*projected.shape[:2], heads, -1)
+
+
+def dense_apply(
+    inputs: NDArray[np.float32], kernel: NDArray[np.float32], bias: NDArray[np.float32]
+) -> NDArray[np.float32]:
+    result: NDArray[np.float32] = inputs @ kernel + bias
+    return result
+
+
+def normalize(
+    inputs: NDArray[np.float32], scale: NDArray[np.float32], shift: NDArray[np.float32]
+) -> NDArray[np.float32]:
+    mean = inputs.mean(axis=-1, keepdims=True)
+    variance = inputs.var(axis=-1, keepdims=True)
+    result: NDArray[np.float32] = (inputs - mean) / np.sqrt(
+        variance + norm_epsilon
+    ) * scale + shift
+    return result
+
+
+def softmax(scores: NDArray[np.float32]) -> NDArray[np.float32]:
+    weights = np.exp(scores - scores.max(axis=-1, keepdims=True))
+    result: NDArray[np.float32] = weights / weights.sum(axis=-1, keepdims=True)
+    return result
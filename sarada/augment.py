@@ -0,0 +1,149 @@
+"""
+Transformations of notes used to augment training data.
+"""
+from __future__ import annotations
+
+import itertools
+
+from functools import lru_cache, singledispatch
+from typing import Iterable, List, NamedTuple, Sequence
+
+import numpy as np
+
+from loguru import logger
+from numpy.typing import NDArray
+
+from sarada import music21
+from sarada.notebook import (
+    Chord,
+    Musical,
+    Note,
+    Notebook,
+    Pitch,
+    QuarterLength,
+    Rest,
+)
+from sarada.numeris import Numeris, Vocabulary
+
+
+class Transform(NamedTuple):
+    """Transposition by semitones combined with scaling duration by percent."""
+
+    semitones: int = 0
+    scale: int = 100
+
+    def apply(self, musical: Musical) -> Musical:
+        """
+        Transform single note.
+
+        >>> Transform(2, 50).apply(Note(QuarterLength(1.0), Pitch("C4")))
+        Note(duration=0.5, pitch='D4')
+        """
+        return rescale(transpose(musical, self.semitones), self.scale)
+
+
+def transforms(transpositions: int = 0, scales: Iterable[int] = ()) -> List[Transform]:
+    """
+    Create all combinations of transpositions up to given number of semitones
+    and duration scales, including identity.
+
+    >>> transforms(1, [200])
+    [Transform(semitones=-1, scale=100), Transform(semitones=-1, scale=200), \
+Transform(semitones=0, scale=100), Transform(semitones=0, scale=200), \
+Transform(semitones=1, scale=100), Transform(semitones=1, scale=200)]
+    """
+    semitones = range(-transpositions, transpositions + 1)
+    factors = sorted({100, *scales})
+
+    return [Transform(*pair) for pair in itertools.product(semitones, factors)]
+
+
+def numerize(
+    notebook: Notebook, transformations: Sequence[Transform]
+) -> Numeris[Musical]:
+    """
+    Create Numeris which vocabulary is closed under given transformations.
+
+    Values present in notebook keep their order, transformed ones follow them.
+    """
+    present = dict.fromkeys(itertools.chain.from_iterable(notebook.notes))
+    vocabulary = (
+        transform.apply(musical) for musical in present for transform in transformations
+    )
+
+    return notebook.numerize(vocabulary)
+
+
+def table(
+    numeris: Vocabulary[Musical], transformations: Sequence[Transform]
+) -> NDArray[np.int32]:
+    """
+    Map each value to its transformed counterpart, for each of transformations.
+
+    Values which transformation is outside of vocabulary are kept intact, this is
+    only the case for values not present in the original data.
+    """
+    values = numeris.tokens.tolist()
+    result = np.empty((len(transformations), len(values)), dtype=np.int32)
+
+    for row, transform in enumerate(transformations):
+        for idx, value in enumerate(values):
+            result[row, idx] = numeris.mapping.get(transform.apply(value), idx)
+
+    logger.debug(
+        "Created augmentation table for {num} transformations",
+        num=len(transformations),
+    )
+
+    return result
+
+
+@singledispatch
+def transpose(musical: Musical, semitones: int) -> Musical:
+    """
+    Move pitch of musical by given number of semitones.
+    """
+    raise RuntimeError(f"Dispatch failed for {musical}")
+
+
+@transpose.register
+def transpose_note(note: Note, semitones: int) -> Note:
+    return Note(note.duration, transpose_pitch(note.pitch, semitones))
+
+
+@transpose.register
+def transpose_chord(chord: Chord, semitones: int) -> Chord:
+    pitches = tuple(transpose_pitch(pitch, semitones) for pitch in chord.pitch)
+    return Chord(chord.duration, pitches)
+
+
+@transpose.register
+def transpose_rest(rest: Rest, _: int) -> Rest:
+    return rest
+
+
+@lru_cache(maxsize=None)
+def transpose_pitch(pitch: Pitch, semitones: int) -> Pitch:
+    """
+    Move pitch by given number of semitones.
+
+    >>> transpose_pitch(Pitch("B3"), 1)
+    'C4'
+    """
+    if not semitones:
+        return pitch
+
+    return Pitch(str(music21.Pitch(pitch).transpose(semitones)))
+
+
+def rescale(musical: Musical, scale: int) -> Musical:
+    """
+    Change duration of musical by given percent.
+
+    >>> rescale(Rest(QuarterLength(1.0)), 200)
+    Rest(duration=2.0)
+    """
+    if scale == 100:
+        return musical
+
+    return musical._replace(duration=QuarterLength(musical.duration * scale / 100))
@@ -3,40 +3,277 @@ Run application from the command line.
 """
 from __future__ import annotations
 
+import collections
+import contextlib
+import csv
+import multiprocessing
 import os
+import shutil
 import sys
 
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from enum import Enum
+from functools import partial
 from pathlib import Path
-from typing import Final, Iterable
+from typing import (
+    Callable,
+    Deque,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
 
+import numpy as np
 import typer
 
 from loguru import logger
+from numpy.typing import NDArray
 
+from sarada import augment, dataset, distillation, evaluation, metrics, music21
+from sarada import sweep as sweeping
+from sarada.augment import Transform
+from sarada.console import cache
 from sarada.console import config as conf
+from sarada.console import manifest
+from sarada.dataset import Windows
+from sarada.distillation import Distillation
+from sarada.evaluation import Evaluation
+from sarada.fingerprint import Deduplicator
+from sarada.isolation import Isolation, Limits, Quarantine, default_quarantine
 from sarada.logging import setup_logging
-from sarada.neuron import Neuron
-from sarada.notebook import Notebook
-from sarada.parsing import read_scores, store_score
+from sarada.neuron import Neuron, default_learning_rate
+from sarada.notebook import Musical, Musicals, Notebook
+from sarada.notebook import filename as notebook_filename
+from sarada.numeris import Numeris, Vocabulary
+from sarada.parsing import (
+    Extraction,
+    ingest,
+    output_suffixes,
+    prefetch,
+    read_files_notesets,
+    read_score,
+    read_scores,
+    store_score,
+)
+from sarada.sampling import Sampler
+
+R = TypeVar("R")  # pylint: disable=invalid-name
 
 app: Final = typer.Typer()
 
+
+class MetricsFormat(str, Enum):
+    """Formats of exported metrics."""
+
+    JSONL = "jsonl"
+    PROMETHEUS = "prometheus"
+
+
+class ModelKind(str, Enum):
+    """Kinds of neural network."""
+
+    GRU = "gru"
+    GRU_SEQUENCE = "gru-sequence"
+    ATTENTION = "attention"
+
+
+class LogLevel(str, Enum):
+    """Levels of logged messages."""
+
+    TRACE = "TRACE"
+    DEBUG = "DEBUG"
+    INFO = "INFO"
+    WARNING = "WARNING"
+    ERROR = "ERROR"
+
+
+arg_log_level = typer.Option(
+    LogLevel.DEBUG, help="Lowest level of logged messages, higher ones log less"
+)
+arg_metrics = typer.Option(
+    None, "--metrics", help="File to export timings and counters of stages to"
+)
+arg_metrics_format = typer.Option(
+    MetricsFormat.JSONL, help="Format of metrics, JSON lines or Prometheus text"
+)
 arg_music_dir = typer.Argument(..., help="Path to directory containing learnign data")
 arg_model_path = typer.Argument(Path("model/"), help="Path to store model")
+arg_model_paths = typer.Argument(
+    None, help="Paths to models sharing vocabulary, defaults to model/"
+)
 arg_load_model = typer.Option(
     False,
     help="If true model will be loaded from model_path",
 )
 arg_epochs = typer.Option(100, help="Number of epochs to run")
+arg_workers = typer.Option(
+    1, help="Number of threads loading batches from dataset built with build-dataset"
+)
+arg_validation = typer.Option(
+    0.0, help="Fraction of note sets held out for validation, 0 disables validation"
+)
+arg_validation_batches = typer.Option(
+    10, help="Number of batches used for validation in each epoch, 0 for all"
+)
+arg_patience = typer.Option(
+    0, help="Epochs without improvement before stopping, 0 disables early stopping"
+)
+arg_split_seed = typer.Option(0, help="Seed used to select validation note sets")
+arg_teacher_path = typer.Argument(..., help="Path of trained model to distill")
+arg_student_path = typer.Argument(..., help="Path to store distilled model")
+arg_student_units = typer.Option(
+    "64", help="Comma separated numbers of units in recurrent layers of student"
+)
+arg_distillation_temperature = typer.Option(
+    2.0, help="Temperature softening predictions of teacher, higher shares more"
+)
+arg_alpha = typer.Option(
+    0.9, help="Weight of teacher predictions in targets, the rest is true values"
+)
+arg_learning_rate = typer.Option(default_learning_rate, help="Learning rate")
+arg_sweep_dir = typer.Argument(
+    Path("sweep/"), help="Path to store sweep datasets and results"
+)
+arg_space = typer.Option(
+    Path("space.json"), help="JSON file mapping hyperparameters to values to check"
+)
+arg_trials = typer.Option(
+    0, help="Number of randomly selected trials, 0 checks all combinations"
+)
+arg_trial_workers = typer.Option(1, help="Number of trials run in parallel")
+arg_threads = typer.Option(1, help="Number of threads used by each trial")
+arg_warmup = typer.Option(
+    2, help="Epochs before trials worse than median of others are stopped"
+)
+arg_fit_window_size = typer.Option(
+    None, help="Size of window used for fitting instead of the configured one"
+)
+arg_stride = typer.Option(
+    None,
+    help="Distance between starts of windows of note set, defaults to window size "
+    "for models learning all positions and 1 otherwise",
+)
+arg_curriculum = typer.Option(
+    None,
+    help="Comma separated window sizes, epochs are divided evenly between them",
+)
+arg_generate_window_size = typer.Option(
+    None, help="Size of window used for generation instead of the configured one"
+)
+arg_evaluated_model = typer.Argument(..., help="Path of evaluated model")
+arg_accuracy_top_k = typer.Option(
+    "1,5", help="Comma separated k values of reported top k accuracy"
+)
+arg_evaluation_batch_size = typer.Option(
+    256, help="Number of windows evaluated in single forward pass"
+)
+arg_evaluation_output = typer.Option(
+    None, "-o", "--output", help="File to store results of each file in, as TSV"
+)
+arg_shard_size = typer.Option(1_000_000, help="Maximal number of notes in shard")
 arg_recursive = typer.Option(
     False, "--recursive", "-r", help="Search directories recursively"
 )
 arg_windows_size = typer.Option(40, help="Size fo window iterating over datasets")
+arg_kind = typer.Option(
+    ModelKind.GRU,
+    help="Recurrent network, learning last or all positions of windows at once, "
+    "or causal self-attention learning all of them",
+)
+arg_similarity = typer.Option(
+    0.9,
+    help="Similarity from which note sets are dropped as duplicates, 0 disables it",
+)
+arg_fingerprint_workers = typer.Option(
+    1, help="Number of processes computing fingerprints while files are parsed"
+)
+arg_buffer = typer.Option(
+    16, help="Maximal number of parsed note sets waiting to be stored"
+)
+arg_parse_workers = typer.Option(
+    1,
+    help="Number of isolated processes parsing files, 0 parses them in place",
+)
+arg_timeout = typer.Option(120.0, help="Seconds after which parsing of file stops")
+arg_memory_limit = typer.Option(
+    2048, help="Megabytes of memory available to each parsing process, 0 for any"
+)
+arg_quarantine = typer.Option(
+    default_quarantine, help="File listing files which failed to be parsed"
+)
+arg_all_parts = typer.Option(
+    False, "--all-parts", help="Use every part of scores as separate note set"
+)
+arg_instruments = typer.Option(
+    None,
+    "--instrument",
+    help="Use only parts of given instrument, may be repeated, implies --all-parts",
+)
+arg_transpose = typer.Option(
+    0, help="Augment training data transposing it by up to given number of semitones"
+)
+arg_scale = typer.Option(
+    None, help="Augment training data scaling durations by comma separated percents"
+)
 arg_generate_name = typer.Option(
     Path("out.midi"), "-o", "--output", help="Name of generated file"
 )
+arg_generate_formats = typer.Option(
+    "midi",
+    "--format",
+    help="Comma separated formats of generated files: midi, musicxml or tokens",
+)
+arg_writers = typer.Option(
+    1, help="Number of processes writing files while generation continues"
+)
 arg_generate_length = typer.Option(120, help="Length of generated sequence in notes")
 arc_generate_number = typer.Option(1, help="Number of files to generate")
+arg_generate_stream = typer.Option(
+    False, "--stream", help="Print notes to stdout as soon as they are generated"
+)
+arg_temperature = typer.Option(
+    0.0, help="Sampling temperature, zero always picks most probable note"
+)
+arg_top_k = typer.Option(0, help="Sample only from k most probable notes, 0 for all")
+arg_top_p = typer.Option(
+    1.0, help="Sample only from most probable notes of given cumulative probability"
+)
+arg_repetition_penalty = typer.Option(
+    1.0, help="Penalty applied to notes repeated within last window"
+)
+arg_seed = typer.Option(None, help="Random seed for reproducible generation")
+arg_prime = typer.Option(
+    None, help="Musical file which ending is used to start generated sequence"
+)
+arg_ensemble = typer.Option(
+    False,
+    help="Average predictions of all models instead of generating files for each",
+)
+arg_beam_width = typer.Option(
+    1, help="Number of candidates kept by beam search, 1 disables beam search"
+)
+
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    log_level: LogLevel = arg_log_level,
+    metrics_path: Optional[Path] = arg_metrics,
+    metrics_format: MetricsFormat = arg_metrics_format,
+) -> None:
+    """
+    Generate music using neural networks trained on musical files.
+    """
+    setup_logging(log_level.value)
+
+    if metrics_path is not None:
+        finish = metrics.setup_metrics(metrics_path, metrics_format.value)
+        ctx.call_on_close(finish)
 
 
 @app.command()
@@ -45,100 +282,832 @@ def prepare(
     model_path: Path = arg_model_path,
     recursive: bool = arg_recursive,
     window_size: int = arg_windows_size,
+    similarity: float = arg_similarity,
+    fingerprint_workers: int = arg_fingerprint_workers,
+    buffer: int = arg_buffer,
+    parse_workers: int = arg_parse_workers,
+    timeout: float = arg_timeout,
+    memory_limit: int = arg_memory_limit,
+    quarantine: Path = arg_quarantine,
+    all_parts: bool = arg_all_parts,
+    instruments: Optional[List[str]] = arg_instruments,
+    transpose: int = arg_transpose,
+    scale: Optional[str] = arg_scale,
+    kind: ModelKind = arg_kind,
 ) -> None:
     """
     Initialize model directory and prepare data for it.
     """
-    setup_logging()
-
     if window_size <= 0:
         logger.error("Window size must be positive")
         raise typer.Exit(1)
 
+    if transpose < 0:
+        logger.error("Transposition must not be negative")
+        raise typer.Exit(1)
+
+    if not 0 <= similarity <= 1:
+        logger.error("Similarity must be in range [0, 1]")
+        raise typer.Exit(1)
+
+    try:
+        scales = positive_integers(scale) if scale else []
+    except ValueError as ex:
+        logger.error("Invalid scales: {ex}", ex=str(ex))
+        raise typer.Exit(1) from ex
+
+    if timeout < 0 or memory_limit < 0:
+        logger.error("Limits must not be negative")
+        raise typer.Exit(1)
+
     if model_path.exists():
         logger.error("Provided path already exists, aborting preparing model")
         raise typer.Exit(1)
 
+    isolation = parsing_isolation(parse_workers, timeout, memory_limit, quarantine)
+
+    os.mkdir(model_path)
     try:
-        notes = read_scores(music_dir, recursive)
+        ingested = ingest(
+            music_dir,
+            model_path,
+            recursive,
+            deduplicator(similarity),
+            fingerprint_workers,
+            buffer,
+            Extraction(all_parts, tuple(instruments or ())),
+            isolation,
+        )
     except IOError as ex:
+        shutil.rmtree(model_path)
         logger.error(str(ex))
         sys.exit(1)
 
-    if not notes:
+    if not ingested.notesets:
+        shutil.rmtree(model_path)
         logger.error("No data was found")
         raise typer.Exit(1)
 
     logger.info("Processing datasets")
 
-    os.mkdir(model_path)
-    notes.store(model_path)
-    numeris = notes.numerize()
+    config: conf.ConfigData = {"iterations": 0, "window_size": window_size}
+    if transpose or scales:
+        config["transpositions"] = transpose
+        config["scales"] = scales
 
-    model = Neuron(input_length=window_size, output_length=numeris.distinct_size)
-    model.save(model_path / "model")
+    numeris = vocabulary(Notebook(notes=[ingested.distinct]), config)
 
-    config: conf.ConfigData = {"iterations": 0, "window_size": window_size}
-    conf.store(config, model_path)
+    model = Neuron(
+        input_length=window_size,
+        output_length=numeris.distinct_size,
+        kind=kind.value,
+    )
+    manifest.commit(model_path, model, config, vocabulary_digest(numeris))
 
     logger.info("Initialized model at path {path}", path=str(model_path))
 
 
+@app.command()
+def build_dataset(
+    model_path: Path = arg_model_path,
+    shard_size: int = arg_shard_size,
+) -> None:
+    """
+    Encode model data into shards used by fit instead of rebuilding windows.
+    """
+    if shard_size <= 0:
+        logger.error("Shard size must be positive")
+        raise typer.Exit(1)
+
+    config: Final = manifest.config(model_path)
+    numeris = vocabulary(Notebook.read(model_path), config)
+    table = augmentation_table(numeris, config)
+
+    dataset.build(numeris, model_path, config["window_size"], shard_size, table)
+
+
 @app.command()
 def fit(
     model_path: Path = arg_model_path,
     epochs: int = arg_epochs,
+    workers: int = arg_workers,
+    validation: float = arg_validation,
+    validation_batches: int = arg_validation_batches,
+    patience: int = arg_patience,
+    split_seed: int = arg_split_seed,
+    window_size: Optional[int] = arg_fit_window_size,
+    curriculum: Optional[str] = arg_curriculum,
+    stride: Optional[int] = arg_stride,
 ) -> None:
     """
     Start fitting model with provided source directory.
     """
-    setup_logging()
-    config: Final = conf.read(model_path)
-    window_size: Final[int] = config["window_size"]
+    if not 0 <= validation < 1:
+        logger.error("Validation fraction must be in range [0, 1)")
+        raise typer.Exit(1)
 
-    notebook = Notebook.read(model_path)
-    numeris = notebook.numerize()
-    model = Neuron.load(
-        model_path / "model",
-        input_length=window_size,
-        output_length=numeris.distinct_size,
+    config: Final = manifest.config(model_path)
+
+    try:
+        sizes = positive_integers(
+            curriculum or str(window_size or config["window_size"])
+        )
+    except ValueError as ex:
+        logger.error("Invalid window sizes: {ex}", ex=str(ex))
+        raise typer.Exit(1) from ex
+
+    if epochs < len(sizes):
+        logger.error("Each of window sizes requires at least one epoch")
+        raise typer.Exit(1)
+
+    if stride is not None and stride <= 0:
+        logger.error("Stride must be positive")
+        raise typer.Exit(1)
+
+    windows: Optional[Windows] = None
+    digest: Optional[str] = None
+    if dataset.exists(model_path):
+        windows = dataset.read(model_path)
+        output_length = windows.distinct_size
+    else:
+        state = model_state(model_path, config)
+        numeris = state.vocabulary
+        table = augmentation_table(numeris, config)
+        output_length = numeris.distinct_size
+        digest = state.digest
+
+    try:
+        if manifest.exists(model_path):
+            manifest.validate(model_path, manifest.read(model_path))
+        model = Neuron.load(
+            manifest.model_location(model_path),
+            input_length=config["window_size"],
+            output_length=output_length,
+        )
+    except ValueError as ex:
+        logger.error(str(ex))
+        raise typer.Exit(1) from ex
+
+    best_loss = float("inf")
+    for size, stage_epochs in zip(sizes, stages(epochs, len(sizes))):
+        logger.info("Fitting with window size {size}", size=size)
+
+        try:
+            stage_model = model.resized(size)
+            if windows is not None:
+                stage_windows = windows.resized(size)
+            else:
+                stage_windows = dataset.encoded(
+                    state.tokens,
+                    state.starts,
+                    numeris.distinct_size,
+                    size,
+                    augmentation=table,
+                )
+        except ValueError as ex:
+            logger.error(str(ex))
+            raise typer.Exit(1) from ex
+
+        data, held = stage_windows.split(validation, split_seed)
+        if validation and not held:
+            logger.warning("Not enough data to hold out for validation")
+
+        stage_stride = stride or (size if model.sequential else 1)
+        if stage_stride > 1:
+            logger.info("Starting windows every {num} values", num=stage_stride)
+            data, held = data.strided(stage_stride), held.strided(stage_stride)
+
+        progress = stage_model.learn(
+            data,
+            epochs=stage_epochs,
+            workers=workers,
+            validation=held if held else None,
+            validation_batches=validation_batches,
+            patience=patience,
+            checkpoint=manifest.checkpoint_location(model_path),
+        )
+
+        if progress.best_loss < best_loss:
+            best_loss = progress.best_loss
+            config["best_epoch"] = config["iterations"] + progress.best_epoch
+        config["iterations"] += progress.epochs
+
+    manifest.commit(model_path, model, config, digest)
+
+
+@app.command()
+def verify(model_path: Path = arg_model_path) -> None:
+    """
+    Compare checksums of model files with ones recorded in manifest.
+    """
+    try:
+        broken = manifest.verify(model_path, manifest.read(model_path))
+    except (IOError, ValueError) as ex:
+        logger.error("Could not read manifest: {ex}", ex=str(ex))
+        raise typer.Exit(1) from ex
+
+    for name in broken:
+        logger.error("Checksum of {name} does not match", name=name)
+    if broken:
+        raise typer.Exit(1)
+
+    logger.info("All model files match manifest")
+
+
+@app.command()
+def distill(
+    teacher_path: Path = arg_teacher_path,
+    student_path: Path = arg_student_path,
+    units: str = arg_student_units,
+    epochs: int = arg_epochs,
+    workers: int = arg_workers,
+    validation: float = arg_validation,
+    validation_batches: int = arg_validation_batches,
+    patience: int = arg_patience,
+    split_seed: int = arg_split_seed,
+    temperature: float = arg_distillation_temperature,
+    alpha: float = arg_alpha,
+    learning_rate: float = arg_learning_rate,
+) -> None:
+    """
+    Train smaller model to reproduce predictions of model stored in teacher path.
+
+    Teacher predictions are computed once and cached in teacher directory, so
+    following epochs and students only read them.
+    """
+    try:
+        layers = positive_integers(units)
+    except ValueError as ex:
+        logger.error("Invalid units: {ex}", ex=str(ex))
+        raise typer.Exit(1) from ex
+
+    if not 0 <= validation < 1:
+        logger.error("Validation fraction must be in range [0, 1)")
+        raise typer.Exit(1)
+
+    if temperature <= 0 or not 0 <= alpha <= 1:
+        logger.error("Temperature must be positive and alpha in range [0, 1]")
+        raise typer.Exit(1)
+
+    if student_path.exists():
+        logger.error("Provided path already exists, aborting distillation")
+        raise typer.Exit(1)
+
+    try:
+        config, numeris, teacher = load(teacher_path)
+    except ValueError as ex:
+        logger.error(str(ex))
+        raise typer.Exit(1) from ex
+
+    if dataset.exists(teacher_path):
+        windows = dataset.read(teacher_path)
+    else:
+        state = model_state(teacher_path, config)
+        windows = dataset.encoded(
+            state.tokens, state.starts, numeris.distinct_size, config["window_size"]
+        )
+    data, held = windows.split(validation, split_seed)
+    if validation and not held:
+        logger.warning("Not enough data to hold out for validation")
+
+    targets = distillation.teacher_targets(teacher, data, teacher_path)
+
+    os.mkdir(student_path)
+    shutil.copy(teacher_path / notebook_filename, student_path / notebook_filename)
+    student = Neuron(
+        config["window_size"],
+        numeris.distinct_size,
+        units=layers,
+        learning_rate=learning_rate,
+    )
+    progress = student.learn(
+        Distillation(data, targets, temperature, alpha, seed=split_seed),
+        epochs=epochs,
+        workers=workers,
+        validation=held if held else None,
+        validation_batches=validation_batches,
+        patience=patience,
+        checkpoint=manifest.checkpoint_location(student_path),
     )
+    student_config = config.copy()
+    student_config["iterations"] = progress.epochs
+    student_config["best_epoch"] = progress.best_epoch
+    manifest.commit(student_path, student, student_config, vocabulary_digest(numeris))
 
-    series = numeris.make_series(window_size=window_size)
-    model.learn(series, epochs=epochs)
-    model.save(model_path / "model")
+    teacher_time = distillation.step_time(teacher)
+    student_time = distillation.step_time(student)
+    logger.info(
+        "Student predicts in {student:.2f}ms instead of {teacher:.2f}ms, "
+        "{speedup:.1f} times faster",
+        student=student_time * 1000,
+        teacher=teacher_time * 1000,
+        speedup=teacher_time / student_time,
+    )
 
-    config["iterations"] += epochs
-    conf.store(config, model_path)
+
+@app.command()
+def sweep(
+    music_dir: Path = arg_music_dir,
+    sweep_dir: Path = arg_sweep_dir,
+    space: Path = arg_space,
+    trials: int = arg_trials,
+    epochs: int = arg_epochs,
+    workers: int = arg_trial_workers,
+    threads: int = arg_threads,
+    validation: float = arg_validation,
+    warmup: int = arg_warmup,
+    recursive: bool = arg_recursive,
+    similarity: float = arg_similarity,
+    fingerprint_workers: int = arg_fingerprint_workers,
+    all_parts: bool = arg_all_parts,
+    instruments: Optional[List[str]] = arg_instruments,
+) -> None:
+    """
+    Train models for many sets of hyperparameters and compare them.
+    """
+    if workers <= 0 or threads <= 0:
+        logger.error("Number of workers and threads must be positive")
+        raise typer.Exit(1)
+
+    if not 0 <= similarity <= 1:
+        logger.error("Similarity must be in range [0, 1]")
+        raise typer.Exit(1)
+
+    if sweep_dir.exists():
+        logger.error("Provided path already exists, aborting sweep")
+        raise typer.Exit(1)
+
+    try:
+        trial_list = sweeping.make_trials(sweeping.read_space(space), trials)
+    except (IOError, ValueError) as ex:
+        logger.error("Could not read search space: {ex}", ex=str(ex))
+        raise typer.Exit(1) from ex
+
+    if not trial_list:
+        raise typer.BadParameter("Search space has no trials", param_hint="--space")
+
+    notes = read_scores(
+        music_dir,
+        recursive,
+        deduplicator(similarity),
+        fingerprint_workers,
+        Extraction(all_parts, tuple(instruments or ())),
+    )
+    if not notes:
+        logger.error("No data was found")
+        raise typer.Exit(1)
+
+    os.mkdir(sweep_dir)
+    sweeping.prepare(notes, sweep_dir, trial_list)
+    results = sweeping.run(
+        sweep_dir, trial_list, epochs, workers, threads, validation, warmup
+    )
+
+    best = min(results, key=sweeping.rank)
+    logger.info("Best trial: {trial}", trial=best.trial)
 
 
 @app.command()
 def generate(
-    model_path: Path = arg_model_path,
+    model_paths: Optional[List[Path]] = arg_model_paths,
     output: Path = arg_generate_name,
+    formats: str = arg_generate_formats,
+    writers: int = arg_writers,
     length: int = arg_generate_length,
     count: int = arc_generate_number,
+    stream: bool = arg_generate_stream,
+    temperature: float = arg_temperature,
+    top_k: int = arg_top_k,
+    top_p: float = arg_top_p,
+    repetition_penalty: float = arg_repetition_penalty,
+    seed: Optional[int] = arg_seed,
+    beam_width: int = arg_beam_width,
+    prime: Optional[Path] = arg_prime,
+    ensemble: bool = arg_ensemble,
+    window_size: Optional[int] = arg_generate_window_size,
 ) -> None:
     """
     Generate sequence from model.
     """
-    setup_logging()
-    config: Final = conf.read(model_path)
-    window_size: Final[int] = config["window_size"]
+    try:
+        sampler = Sampler(temperature, top_k, top_p, repetition_penalty, seed)
+    except ValueError as ex:
+        logger.error(str(ex))
+        raise typer.Exit(1) from ex
+
+    if beam_width <= 0:
+        logger.error("Beam width must be positive")
+        raise typer.Exit(1)
+
+    try:
+        format_list = output_formats(formats)
+    except ValueError as ex:
+        logger.error(str(ex))
+        raise typer.Exit(1) from ex
+
+    if beam_width > 1 and stream:
+        logger.error("Beam search result can not be streamed")
+        raise typer.Exit(1)
+
+    if not model_paths:
+        model_paths = [arg_model_path.default]
+
+    if window_size is not None and window_size <= 0:
+        logger.error("Window size must be positive")
+        raise typer.Exit(1)
+
+    try:
+        loaded = [load(model_path, window_size) for model_path in model_paths]
+    except ValueError as ex:
+        logger.error(str(ex))
+        raise typer.Exit(1) from ex
+
+    numeris = loaded[0][1]
+    if any(other.mapping != numeris.mapping for _, other, _ in loaded):
+        logger.error("Models do not share vocabulary")
+        raise typer.Exit(1)
+
+    models = [model for _, _, model in loaded]
+    if ensemble:
+        runs = [(output, Neuron.ensemble(models))]
+    elif len(models) > 1:
+        names = (path.name for path in model_paths)
+        runs = [(tagged(output, name), model) for name, model in zip(names, models)]
+    else:
+        runs = [(output, models[0])]
+
+    primer: List[float] = []
+    if prime is not None:
+        try:
+            primer = numeris.numerize(read_score(prime), skip_unknown=True)
+        except (IOError, music21.Music21Exception) as ex:
+            logger.error("Could not read primer: {ex}", ex=str(ex))
+            raise typer.Exit(1) from ex
+
+        if not primer:
+            logger.warning("Primer contains no known notes, starting from noise")
+
+    def scores() -> Iterator[Tuple[Musicals, Path]]:
+        for run_output, model in runs:
+            for path in filenames(run_output, count):
+                with metrics.span("generate"):
+                    if stream:
+                        values = model.stream(length, sampler, primer)
+                        pitches = list(echo_notes(values, numeris))
+                    elif beam_width > 1:
+                        sequence = model.beam_search(
+                            length, beam_width, sampler.rng, primer
+                        )
+                        pitches = numeris.denumerize(sequence)
+                    else:
+                        sequence = model.generate(length, sampler, primer)
+                        pitches = numeris.denumerize(sequence)
+
+                metrics.count("generated_notes", len(pitches))
+                yield pitches, path
+
+    store_scores(scores(), format_list, writers)
+
+
+def store_scores(
+    scores: Iterable[Tuple[Musicals, Path]], formats: Sequence[str], writers: int
+) -> None:
+    """
+    Write each score in all formats as soon as it is generated.
+
+    With positive number of writers generation and writing form a pipeline,
+    scores being written by worker processes while following ones are generated.
+    At most two scores per writer wait in queue, so that generation is held back
+    instead of piling scores up in memory when writing is slower.
+    """
+    stored = 0
+    with metrics.stage("generation"):
+        if writers <= 0:
+            for pitches, path in scores:
+                stored += len(store_score(pitches, path, formats))
+        else:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                max_workers=writers, mp_context=context
+            ) as executor:
+                tasks = (partial(store_score, *score, formats) for score in scores)
+                for paths in bounded_map(executor, tasks, 2 * writers):
+                    stored += len(paths)
+
+        metrics.count("written_files", stored)
+    logger.info("Stored {num} files", num=stored)
+
+
+def bounded_map(
+    executor: Executor, tasks: Iterable[Callable[[], R]], depth: int
+) -> Iterator[R]:
+    """
+    Run tasks in executor yielding their results in order.
+
+    Following tasks are taken only while fewer than depth of them are pending,
+    errors are raised as soon as failed task is reached.
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> with ThreadPoolExecutor(2) as executor:
+    ...     list(bounded_map(executor, [lambda: 1, lambda: 2, lambda: 3], 2))
+    [1, 2, 3]
+    """
+    pending: Deque[Future[R]] = collections.deque()
+    for task in tasks:
+        pending.append(executor.submit(task))
+        while len(pending) >= depth:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+@app.command()
+def evaluate(
+    model_path: Path = arg_evaluated_model,
+    music_dir: Path = arg_music_dir,
+    recursive: bool = arg_recursive,
+    top_k: str = arg_accuracy_top_k,
+    batch_size: int = arg_evaluation_batch_size,
+    window_size: Optional[int] = arg_generate_window_size,
+    buffer: int = arg_buffer,
+    parse_workers: int = arg_parse_workers,
+    timeout: float = arg_timeout,
+    memory_limit: int = arg_memory_limit,
+    quarantine: Path = arg_quarantine,
+    all_parts: bool = arg_all_parts,
+    instruments: Optional[List[str]] = arg_instruments,
+    output: Optional[Path] = arg_evaluation_output,
+) -> None:
+    """
+    Measure perplexity and accuracy of model on files it was not trained on.
+    """
+    try:
+        top_k_values = positive_integers(top_k)
+    except ValueError as ex:
+        logger.error("Invalid top k values: {ex}", ex=str(ex))
+        raise typer.Exit(1) from ex
+
+    if batch_size <= 0:
+        logger.error("Batch size must be positive")
+        raise typer.Exit(1)
+
+    if timeout < 0 or memory_limit < 0:
+        logger.error("Limits must not be negative")
+        raise typer.Exit(1)
+
+    try:
+        _, numeris, model = load(model_path, window_size)
+    except ValueError as ex:
+        logger.error(str(ex))
+        raise typer.Exit(1) from ex
+
+    isolation = parsing_isolation(parse_workers, timeout, memory_limit, quarantine)
+    extraction = Extraction(all_parts, tuple(instruments or ()))
+    files = prefetch(
+        read_files_notesets(music_dir, recursive, extraction, isolation), buffer
+    )
+
+    with contextlib.ExitStack() as stack:
+        table = None
+        if output is not None:
+            datafile = stack.enter_context(
+                open(output, "w", encoding="utf-8", newline="")
+            )
+            table = csv.writer(datafile, delimiter="\t")
+            table.writerow(
+                [
+                    "file",
+                    "tokens",
+                    "unknown",
+                    "perplexity",
+                    "log_likelihood",
+                    *(f"top_{k}" for k in top_k_values),
+                ]
+            )
+
+        total = Evaluation()
+        with metrics.stage("evaluation"):
+            for path, notesets in files:
+                result = evaluation.evaluate(
+                    model, numeris, notesets, top_k_values, batch_size
+                )
+                report(str(path), result, top_k_values)
+                if table is not None:
+                    table.writerow(evaluation_row(str(path), result, top_k_values))
+                total = total.merge(result)
+
+        report("Overall", total, top_k_values)
+        if table is not None:
+            table.writerow(evaluation_row("overall", total, top_k_values))
+
+
+def report(name: str, result: Evaluation, top_k: Sequence[int]) -> None:
+    """
+    Log results of evaluation.
+    """
+    accuracies = ", ".join(
+        f"top-{k} accuracy {result.accuracy(i):.4f}" for i, k in enumerate(top_k)
+    )
+    logger.info(
+        "{name}: perplexity {perplexity:.4f}, log likelihood {mean:.4f} per token, "
+        "{accuracies} over {tokens} tokens, {unknown} unknown skipped",
+        name=name,
+        perplexity=result.perplexity,
+        mean=result.mean_log_likelihood,
+        accuracies=accuracies,
+        tokens=result.tokens,
+        unknown=result.unknown,
+    )
+
+
+def evaluation_row(name: str, result: Evaluation, top_k: Sequence[int]) -> List[object]:
+    """
+    Return results of evaluation as row of table.
+    """
+    return [
+        name,
+        result.tokens,
+        result.unknown,
+        result.perplexity,
+        result.mean_log_likelihood,
+        *(result.accuracy(i) for i in range(len(top_k))),
+    ]
+
+
+def load(
+    model_path: Path, window_size: Optional[int] = None
+) -> Tuple[conf.ConfigData, Vocabulary[Musical], Neuron]:
+    """
+    Read configuration, data and model stored in model directory.
+
+    Model uses window size from configuration unless other is provided.
+    Directories described by manifest are validated against it first, so that
+    model trained on other vocabulary is never loaded.
+    """
+    if not manifest.exists(model_path):
+        config = conf.read(model_path)
+        numeris = model_state(model_path, config).vocabulary
+        location = model_path / manifest.legacy_model_dirname
+    else:
+        # Manifest is read once, as it may be replaced by fit in the meantime
+        data = manifest.read(model_path)
+        manifest.validate(model_path, data)
+        config = data["config"]
+        state = model_state(model_path, config)
+        numeris = state.vocabulary
+        location = model_path / data["model"]
+
+        known = data["vocabulary"] in ("", state.digest)
+        if not known or data["architecture"]["outputs"] != numeris.distinct_size:
+            raise ValueError(f"Vocabulary of {model_path} does not match its model")
 
-    notebook = Notebook.read(model_path)
-    numeris = notebook.numerize()
     model = Neuron.load(
-        model_path / "model",
-        input_length=window_size,
+        location,
+        input_length=window_size or config["window_size"],
         output_length=numeris.distinct_size,
     )
 
-    for path in filenames(output, count):
-        sequence = model.generate(length)
-        pitches = numeris.denumerize(sequence)
+    return config, numeris, model
+
+
+def echo_notes(
+    values: Iterable[float], numeris: Vocabulary[Musical]
+) -> Iterator[Musical]:
+    """
+    Decode generated values and print them as soon as they are available.
+    """
+    for value in values:
+        musical = numeris.denormalize_value(value)
+        typer.echo(musical)
+
+        yield musical
+
+
+def parsing_isolation(
+    workers: int, timeout: float, memory_limit: int, quarantine: Path
+) -> Optional[Isolation]:
+    """
+    Create settings of isolated parsing, no workers parse files in place.
+
+    >>> parsing_isolation(0, 60, 0, Path("quarantine.json")) is None
+    True
+    """
+    if workers <= 0:
+        return None
+
+    return Isolation(workers, Limits(timeout, memory_limit), Quarantine(quarantine))
+
+
+def deduplicator(similarity: float) -> Optional[Deduplicator]:
+    """
+    Create deduplicator dropping note sets of given similarity, 0 disables it.
+
+    >>> deduplicator(0.0) is None
+    True
+    """
+    return Deduplicator(similarity) if similarity else None
+
+
+def model_state(model_path: Path, config: conf.ConfigData) -> cache.State:
+    """
+    Read vocabulary and encoded data of model, cached unless notebook changed.
+
+    Vocabulary contains values of notebook in order, followed by ones added by
+    augmentation, as created by vocabulary.
+    """
+    state = cache.read(model_path, config)
+    if state is None:
+        numeris = vocabulary(Notebook.read(model_path), config)
+        state = cache.store(model_path, config, numeris)
+
+    return state
+
 
-        store_score(pitches, path)
+def vocabulary_digest(numeris: Vocabulary[Musical]) -> str:
+    """
+    Hash values of vocabulary in order of their numbers.
+    """
+    return manifest.digest(numeris.tokens)
+
+
+def vocabulary(notebook: Notebook, config: conf.ConfigData) -> Numeris[Musical]:
+    """
+    Create Numeris closed under augmentation configured for model.
+    """
+    return augment.numerize(notebook, augmentation(config))
+
+
+def augmentation(config: conf.ConfigData) -> List[Transform]:
+    """
+    Return transformations configured for model.
+
+    >>> augmentation({"iterations": 0, "window_size": 5})
+    [Transform(semitones=0, scale=100)]
+    """
+    return augment.transforms(config.get("transpositions", 0), config.get("scales", []))
+
+
+def augmentation_table(
+    numeris: Vocabulary[Musical], config: conf.ConfigData
+) -> Optional[NDArray[np.int32]]:
+    """
+    Create augmentation table, unless there is nothing to augment.
+    """
+    transformations = augmentation(config)
+    if len(transformations) == 1:
+        return None
+
+    return augment.table(numeris, transformations)
+
+
+def positive_integers(text: str) -> List[int]:
+    """
+    Parse comma separated list of positive integers.
+
+    >>> positive_integers("20,40, 80")
+    [20, 40, 80]
+    """
+    values = [int(value) for value in text.split(",")]
+    if any(value <= 0 for value in values):
+        raise ValueError("Values must be positive")
+
+    return values
+
+
+def output_formats(text: str) -> List[str]:
+    """
+    Parse comma separated list of output formats.
+
+    >>> output_formats("midi, tokens")
+    ['midi', 'tokens']
+    """
+    formats = [value.strip() for value in text.split(",")]
+    unknown = [value for value in formats if value not in output_suffixes]
+    if unknown:
+        raise ValueError(f"Unknown output formats: {', '.join(unknown)}")
+
+    return list(dict.fromkeys(formats))
+
+
+def stages(epochs: int, count: int) -> List[int]:
+    """
+    Divide epochs between given number of stages.
+
+    >>> stages(10, 3)
+    [3, 3, 4]
+    """
+    return [epochs // count] * (count - 1) + [epochs - epochs // count * (count - 1)]
+
+
+def tagged(path: Path, tag: str) -> Path:
+    """
+    Mark filename with given tag.
+
+    >>> str(tagged(Path("out/a.mid"), "model"))
+    'out/a-model.mid'
+    """
+    return path.with_name(f"{path.stem}-{tag}{path.suffix}")
 
 
 def filenames(path: Path, count: int) -> Iterable[Path]:
@@ -0,0 +1,254 @@
+"""
+Vocabulary and encoded data of model directory cached for repeated commands.
+
+Cache is stored as plain arrays which are memory mapped when read, so that
+commands run against unchanged model skip reading whole notebook and building
+vocabulary from it. It is identified by size and modification time of notebook
+along with configured augmentation, which decide vocabulary.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+
+from fractions import Fraction
+from pathlib import Path
+from typing import (
+    Dict,
+    Final,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypedDict,
+    cast,
+)
+
+import numpy as np
+
+from loguru import logger
+from numpy.typing import NDArray
+
+from sarada import dataset
+from sarada.console import config as conf
+from sarada.console import manifest
+from sarada.notebook import Chord, Musical, Note, Pitch, QuarterLength, Rest
+from sarada.notebook import filename as notebook_filename
+from sarada.numeris import Numeris, Vocabulary
+
+dirname: Final = "cache"
+meta_filename: Final = "cache.json"
+format_version: Final = 1
+arrays: Final = ("kinds", "numerators", "denominators", "pitches", "tokens", "starts")
+
+
+class CacheMeta(TypedDict):
+    version: int
+    key: str
+    distinct_size: int
+    vocabulary: str
+
+
+class State(NamedTuple):
+    """Vocabulary of model along with its data encoded as numbers."""
+
+    vocabulary: Vocabulary[Musical]
+    digest: str
+    tokens: NDArray[np.int32]
+    starts: NDArray[np.int64]
+
+
+class Columns(NamedTuple):
+    """Values of vocabulary as arrays, durations as fractions."""
+
+    kinds: NDArray[np.int8]
+    numerators: NDArray[np.int64]
+    denominators: NDArray[np.int64]
+    pitches: NDArray[np.str_]
+
+
+def key(path: Path, config: conf.ConfigData) -> str:
+    """
+    Identify notebook and augmentation of model directory.
+    """
+    stat = (path / notebook_filename).stat()
+    described = {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "transpositions": config.get("transpositions", 0),
+        "scales": config.get("scales", []),
+    }
+
+    return hashlib.sha256(json.dumps(described).encode()).hexdigest()
+
+
+def read(path: Path, config: conf.ConfigData) -> Optional[State]:
+    """
+    Open cache of model directory, unless it is missing or outdated.
+    """
+    directory = path / dirname
+    try:
+        with open(directory / meta_filename, "r", encoding="utf-8") as datafile:
+            meta: CacheMeta = json.load(datafile)
+    except (IOError, ValueError):
+        return None
+
+    if meta.get("version") != format_version or meta.get("key") != key(path, config):
+        logger.debug("Cache of {path} is outdated", path=str(path))
+        return None
+
+    try:
+        loaded = {
+            name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in arrays
+        }
+    except (IOError, ValueError):
+        # Replaced by other command in the meantime
+        return None
+    values = decode(
+        Columns(
+            loaded["kinds"],
+            loaded["numerators"],
+            loaded["denominators"],
+            loaded["pitches"],
+        )
+    )
+    logger.debug("Read {num} values from cache", num=meta["distinct_size"])
+
+    return State(
+        Vocabulary(values),
+        meta["vocabulary"],
+        loaded["tokens"],
+        loaded["starts"],
+    )
+
+
+def store(path: Path, config: conf.ConfigData, numeris: Numeris[Musical]) -> State:
+    """
+    Cache vocabulary and data of numeris, returning them.
+
+    Values which can not be represented as arrays leave model without cache.
+    """
+    values: List[Musical] = numeris.tokens.tolist()
+    digest = manifest.digest(values)
+    tokens, starts = dataset.flatten(numeris)
+    state = State(numeris, digest, tokens, starts)
+
+    columns = encode(values)
+    if columns is None:
+        logger.debug("Vocabulary of {path} can not be cached", path=str(path))
+        return state
+
+    meta: CacheMeta = {
+        "version": format_version,
+        "key": key(path, config),
+        "distinct_size": numeris.distinct_size,
+        "vocabulary": digest,
+    }
+
+    try:
+        write(path, meta, [*columns, tokens, starts])
+    except OSError as ex:
+        logger.debug("Could not cache {path}: {ex}", path=str(path), ex=str(ex))
+        return state
+
+    logger.debug("Cached {num} values of {path}", num=len(values), path=str(path))
+
+    return state
+
+
+def write(path: Path, meta: CacheMeta, contents: List[NDArray[np.generic]]) -> None:
+    """
+    Replace cache directory with one containing given arrays.
+
+    Arrays are written under temporary name first, so readers never see them
+    partial.
+    """
+    temporary = path / f"{dirname}.tmp"
+    if temporary.exists():
+        shutil.rmtree(temporary)
+    temporary.mkdir()
+    for name, array in zip(arrays, contents):
+        np.save(temporary / f"{name}.npy", array)
+    with open(temporary / meta_filename, "w", encoding="utf-8") as datafile:
+        json.dump(meta, datafile)
+
+    if (path / dirname).exists():
+        shutil.rmtree(path / dirname)
+    temporary.rename(path / dirname)
+
+
+def encode(values: Iterable[Musical]) -> Optional[Columns]:
+    """
+    Represent values as arrays, None unless they are decoded back the same.
+
+    >>> encode([Note(QuarterLength(0.5), Pitch("C4"))]).pitches
+    array(['C4'], dtype='<U2')
+    """
+    values = list(values)
+    kinds = np.zeros(len(values), dtype=np.int8)
+    numerators = np.zeros(len(values), dtype=np.int64)
+    denominators = np.ones(len(values), dtype=np.int64)
+    pitches: List[str] = []
+
+    for i, value in enumerate(values):
+        fraction = Fraction(value.duration)
+        numerators[i], denominators[i] = fraction.numerator, fraction.denominator
+        if isinstance(value, Note):
+            pitches.append(value.pitch)
+        elif isinstance(value, Chord):
+            kinds[i] = 1
+            pitches.append(".".join(value.pitch))
+        else:
+            kinds[i] = 2
+            pitches.append("")
+
+    columns = Columns(kinds, numerators, denominators, np.array(pitches, dtype=str))
+    decoded = decode(columns)
+    if decoded != values or list(map(repr, decoded)) != list(map(repr, values)):
+        return None
+
+    return columns
+
+
+def decode(columns: Columns) -> List[Musical]:
+    """
+    Recreate values represented by arrays.
+
+    Durations representable as floats are floats, as in notebook.
+
+    >>> decode(encode([Rest(QuarterLength(1.0)), Chord(Fraction(1, 3), ("C4",))]))
+    [Rest(duration=1.0), Chord(duration=Fraction(1, 3), pitch=('C4',))]
+    """
+    values: List[Musical] = []
+    lengths: Dict[Tuple[int, int], QuarterLength] = {}
+    for kind, numerator, denominator, pitch in zip(
+        *(array.tolist() for array in columns)
+    ):
+        length = lengths.get((numerator, denominator))
+        if length is None:
+            length = lengths[numerator, denominator] = duration(numerator, denominator)
+
+        if kind == 0:
+            values.append(Note(length, Pitch(pitch)))
+        elif kind == 1:
+            values.append(Chord(length, tuple(map(Pitch, pitch.split(".")))))
+        else:
+            values.append(Rest(length))
+
+    return values
+
+
+def duration(numerator: int, denominator: int) -> QuarterLength:
+    """
+    Create duration of given fraction, float when it is exact, as music21 does.
+
+    >>> duration(3, 2), duration(2, 3)
+    (1.5, Fraction(2, 3))
+    """
+    fraction = Fraction(numerator, denominator)
+    if fraction.denominator & (fraction.denominator - 1) == 0:
+        return QuarterLength(float(fraction))
+
+    return cast(QuarterLength, fraction)
@@ -6,16 +6,22 @@ from __future__ import annotations
 import json
 
 from pathlib import Path
-from typing import TypedDict
+from typing import List, TypedDict
 
 filename = "config.json"
 
 
-class ConfigData(TypedDict):
+class RequiredConfigData(TypedDict):
     iterations: int
     window_size: int
 
 
+class ConfigData(RequiredConfigData, total=False):
+    best_epoch: int
+    transpositions: int
+    scales: List[int]
+
+
 def read(path: Path) -> ConfigData:
     with open(path / filename, "r", encoding="utf-8") as datafile:
         data: ConfigData = json.load(datafile)
@@ -24,5 +30,7 @@ def read(path: Path) -> ConfigData:
 
 
 def store(data: ConfigData, path: Path) -> None:
-    with open(path / filename, "w", encoding="utf-8") as datafile:
+    temporary = path / f"{filename}.tmp"
+    with open(temporary, "w", encoding="utf-8") as datafile:
         json.dump(data, datafile)
+    temporary.replace(path / filename)
@@ -0,0 +1,229 @@
+"""
+Versioned layout of model directory described by manifest.
+
+Each saved model is stored as new version in its own directory, and manifest
+listing it along with configuration, architecture, vocabulary hash and
+checksums of files is replaced atomically afterwards. Readers holding previous
+manifest keep loading previous version, which is retained until the next one
+replaces it.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+
+from pathlib import Path
+from typing import Dict, Final, Iterable, List, Optional, TypedDict
+
+from loguru import logger
+
+from sarada.console import config as conf
+from sarada.neuron import Architecture, Neuron
+from sarada.notebook import filename as notebook_filename
+
+filename: Final = "manifest.json"
+format_name: Final = "sarada-model"
+format_version: Final = 1
+versions_dirname: Final = "versions"
+checkpoint_dirname: Final = "checkpoint"
+legacy_model_dirname: Final = "model"
+kept_versions: Final = 2
+
+
+class FileEntry(TypedDict):
+    size: int
+    sha256: str
+
+
+class ManifestData(TypedDict):
+    format: str
+    version: int
+    revision: int
+    model: str
+    config: conf.ConfigData
+    architecture: Architecture
+    vocabulary: str
+    files: Dict[str, FileEntry]
+
+
+def exists(path: Path) -> bool:
+    """
+    Check if model directory is described by manifest.
+    """
+    return (path / filename).exists()
+
+
+def read(path: Path) -> ManifestData:
+    """
+    Read manifest of model directory, checking its format.
+    """
+    with open(path / filename, "r", encoding="utf-8") as datafile:
+        data: ManifestData = json.load(datafile)
+
+    if data.get("format") != format_name or data.get("version") != format_version:
+        raise ValueError(
+            f"Unsupported model format {data.get('format')} {data.get('version')}"
+        )
+
+    return data
+
+
+def validate(path: Path, data: ManifestData) -> None:
+    """
+    Check that files listed in manifest are present and of recorded sizes.
+
+    Only metadata of files is read, so validation is fast regardless of model
+    size. Use verify to compare checksums as well.
+    """
+    for name, entry in data["files"].items():
+        filepath = path / name
+        if not filepath.is_file():
+            raise ValueError(f"Model file {name} is missing")
+        if filepath.stat().st_size != entry["size"]:
+            raise ValueError(f"Model file {name} has unexpected size")
+
+
+def verify(path: Path, data: ManifestData) -> List[str]:
+    """
+    Return names of files listed in manifest which do not match their checksums.
+    """
+    return [
+        name
+        for name, entry in data["files"].items()
+        if not (path / name).is_file() or checksum(path / name) != entry["sha256"]
+    ]
+
+
+def config(path: Path) -> conf.ConfigData:
+    """
+    Read configuration of model, from manifest unless directory predates it.
+    """
+    if exists(path):
+        return read(path)["config"]
+
+    return conf.read(path)
+
+
+def model_location(path: Path) -> Path:
+    """
+    Return directory of current model version.
+    """
+    if exists(path):
+        return path / read(path)["model"]
+
+    return path / legacy_model_dirname
+
+
+def checkpoint_location(path: Path) -> Path:
+    """
+    Return directory of checkpoint saved while fitting model.
+
+    >>> str(checkpoint_location(Path("model")))
+    'model/checkpoint'
+    """
+    return path / checkpoint_dirname
+
+
+def commit(
+    path: Path,
+    neuron: Neuron,
+    config_data: conf.ConfigData,
+    vocabulary: Optional[str] = None,
+) -> ManifestData:
+    """
+    Save model as new version and atomically replace manifest to point at it.
+
+    Vocabulary hash is kept from previous manifest unless provided. Versions
+    older than kept ones are removed afterwards.
+    """
+    previous = read(path) if exists(path) else None
+    if vocabulary is None:
+        vocabulary = previous["vocabulary"] if previous is not None else ""
+
+    versions = path / versions_dirname
+    versions.mkdir(exist_ok=True)
+    revision = max((int(v.name) for v in revisions(versions)), default=0) + 1
+    target = versions / f"{revision:05}"
+    temporary = target.with_suffix(".tmp")
+    if temporary.exists():
+        shutil.rmtree(temporary)
+
+    neuron.save(temporary / legacy_model_dirname)
+    temporary.rename(target)
+
+    model = target / legacy_model_dirname
+    files = [path / notebook_filename]
+    files += sorted(f for f in model.rglob("*") if f.is_file())
+    data: ManifestData = {
+        "format": format_name,
+        "version": format_version,
+        "revision": revision,
+        "model": str(model.relative_to(path)),
+        "config": config_data,
+        "architecture": neuron.architecture(),
+        "vocabulary": vocabulary,
+        "files": {str(f.relative_to(path)): entry(f) for f in files if f.exists()},
+    }
+    atomic_write(path / filename, json.dumps(data, indent=2))
+
+    for old in revisions(versions)[:-kept_versions]:
+        shutil.rmtree(old)
+
+    logger.info("Committed model version {revision}", revision=revision)
+
+    return data
+
+
+def entry(path: Path) -> FileEntry:
+    """
+    Describe file by its size and checksum.
+    """
+    return {"size": path.stat().st_size, "sha256": checksum(path)}
+
+
+def revisions(versions: Path) -> List[Path]:
+    """
+    List directories of complete versions, oldest first.
+    """
+    return sorted(
+        (v for v in versions.iterdir() if v.is_dir() and v.name.isdigit()),
+        key=lambda v: int(v.name),
+    )
+
+
+def atomic_write(path: Path, text: str) -> None:
+    """
+    Write file under temporary name and rename it, so readers never see it partial.
+    """
+    temporary = path.with_suffix(path.suffix + ".tmp")
+    with open(temporary, "w", encoding="utf-8") as datafile:
+        datafile.write(text)
+        datafile.flush()
+        os.fsync(datafile.fileno())
+    temporary.replace(path)
+
+
+def checksum(path: Path) -> str:
+    """
+    Compute SHA-256 digest of file, reading it in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as datafile:
+        for chunk in iter(lambda: datafile.read(2**20), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def digest(values: Iterable[object]) -> str:
+    """
+    Hash vocabulary given as values in order of their numbers.
+
+    >>> digest(["a", "b"]) == digest(["a", "b"])
+    True
+    >>> digest(["a", "b"]) == digest(["b", "a"])
+    False
+    """
+    return hashlib.sha256("\n".join(map(repr, values)).encode()).hexdigest()
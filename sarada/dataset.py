@@ -0,0 +1,441 @@
+"""
+Encoded training data stored in binary shards.
+"""
+from __future__ import annotations
+
+import json
+import math
+import shutil
+
+from pathlib import Path
+from typing import Final, Iterator, List, Optional, Tuple, TypedDict
+
+import numpy as np
+
+from loguru import logger
+from numpy.typing import NDArray
+from tensorflow.keras import utils
+
+from sarada import metrics
+from sarada.numeris import Numeris, T, holdout
+
+dirname: Final = "dataset"
+index_filename: Final = "index.npy"
+meta_filename: Final = "dataset.json"
+augmentation_filename: Final = "augmentation.npy"
+
+Batch = Tuple[NDArray[np.float64], NDArray[np.number]]
+
+
+class DatasetMeta(TypedDict):
+    distinct_size: int
+    window_size: int
+    shards: int
+    notesets: int
+
+
+def exists(path: Path) -> bool:
+    """
+    Check if model directory contains built dataset.
+    """
+    return (path / dirname / meta_filename).exists()
+
+
+def encode(
+    numeris: Numeris[T], window_size: int, shard_size: int
+) -> Iterator[Tuple[NDArray[np.int32], NDArray[np.int64]]]:
+    """
+    Generate shards of encoded data along with index of windows they contain.
+
+    Each note set is kept whole within single shard, so windows never cross note
+    set boundaries. Index contains shard number, offset and note set number for
+    each window.
+    """
+    shard: List[NDArray[np.int32]] = []
+    shard_length = 0
+    shard_count = 0
+    index: List[NDArray[np.int64]] = []
+
+    for number, dataset in enumerate(numeris.data):
+        tokens = np.fromiter(
+            (numeris.mapping[value] for value in dataset),
+            dtype=np.int32,
+            count=len(dataset),
+        )
+
+        if shard and shard_length + len(tokens) > shard_size:
+            yield concatenate(shard, index)
+            shard, shard_length, shard_count, index = [], 0, shard_count + 1, []
+
+        offsets = shard_length + np.arange(max(len(tokens) - window_size, 0))
+        shards = np.full_like(offsets, shard_count)
+        notesets = np.full_like(offsets, number)
+        index.append(np.stack([shards, offsets, notesets], axis=1))
+
+        shard.append(tokens)
+        shard_length += len(tokens)
+
+    yield concatenate(shard, index)
+
+
+def concatenate(
+    tokens: List[NDArray[np.int32]], index: List[NDArray[np.int64]]
+) -> Tuple[NDArray[np.int32], NDArray[np.int64]]:
+    """
+    Join parts of shard and its index.
+    """
+    shard = np.concatenate(tokens) if tokens else np.empty(0, dtype=np.int32)
+    offsets = np.concatenate(index) if index else np.empty((0, 3), dtype=np.int64)
+
+    return shard, offsets
+
+
+def build(
+    numeris: Numeris[T],
+    path: Path,
+    window_size: int,
+    shard_size: int,
+    augmentation: Optional[NDArray[np.int32]] = None,
+) -> None:
+    """
+    Store encoded data in shards along with index of all windows they contain.
+
+    Augmentation table, if provided, is stored along and applied when reading.
+    """
+    directory = path / dirname
+    if directory.exists():
+        shutil.rmtree(directory)
+    directory.mkdir()
+
+    logger.info("Building dataset in {path}", path=str(directory))
+
+    index: List[NDArray[np.int64]] = []
+    with metrics.stage("build"):
+        shards = encode(numeris, window_size, shard_size)
+        for number, (shard, part) in enumerate(shards):
+            with metrics.span("store"):
+                np.save(directory / shard_filename(number), shard)
+            index.append(part)
+
+        np.save(directory / index_filename, np.concatenate(index))
+
+    if augmentation is not None:
+        np.save(directory / augmentation_filename, augmentation)
+
+    meta: DatasetMeta = {
+        "distinct_size": numeris.distinct_size,
+        "window_size": window_size,
+        "shards": len(index),
+        "notesets": len(numeris.data),
+    }
+    with open(directory / meta_filename, "w", encoding="utf-8") as datafile:
+        json.dump(meta, datafile)
+
+    logger.info(
+        "Stored {windows} windows in {shards} shards",
+        windows=sum(len(part) for part in index),
+        shards=meta["shards"],
+    )
+
+
+def windows(
+    numeris: Numeris[T],
+    window_size: int,
+    batch_size: int = 64,
+    seed: Optional[int] = None,
+    augmentation: Optional[NDArray[np.int32]] = None,
+) -> Windows:
+    """
+    Encode data in memory as single shard.
+    """
+    tokens, starts = flatten(numeris)
+
+    return encoded(
+        tokens,
+        starts,
+        numeris.distinct_size,
+        window_size,
+        batch_size=batch_size,
+        seed=seed,
+        augmentation=augmentation,
+    )
+
+
+def flatten(numeris: Numeris[T]) -> Tuple[NDArray[np.int32], NDArray[np.int64]]:
+    """
+    Encode all note sets as one array, along with positions they start at.
+
+    >>> flatten(Numeris([[1, 2, 3], [3]]))
+    (array([0, 1, 2, 2], dtype=int32), array([0, 3, 4]))
+    """
+    tokens = np.fromiter(
+        (numeris.mapping[value] for dataset in numeris.data for value in dataset),
+        dtype=np.int32,
+    )
+    starts = np.cumsum([0, *map(len, numeris.data)], dtype=np.int64)
+
+    return tokens, starts
+
+
+def encoded(
+    tokens: NDArray[np.int32],
+    starts: NDArray[np.int64],
+    distinct_size: int,
+    window_size: int,
+    batch_size: int = 64,
+    seed: Optional[int] = None,
+    augmentation: Optional[NDArray[np.int32]] = None,
+) -> Windows:
+    """
+    Create windows of data already encoded as single shard.
+
+    Note set of given number spans tokens from its start to start of the next.
+
+    >>> encoded(np.arange(7), np.array([0, 4, 7]), 7, 2).index[:, 1]
+    array([0, 1, 4])
+    """
+    lengths = np.diff(starts)
+    counts = np.maximum(lengths - window_size, 0)
+    notesets = np.repeat(np.arange(len(lengths)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    offsets = starts[notesets] + np.arange(len(notesets)) - first
+
+    return Windows(
+        [tokens],
+        np.stack([np.zeros_like(offsets), offsets, notesets], axis=1),
+        distinct_size=distinct_size,
+        window_size=window_size,
+        notesets=len(lengths),
+        batch_size=batch_size,
+        seed=seed,
+        augmentation=augmentation,
+    )
+
+
+def shard_filename(number: int) -> str:
+    """
+    Return name of file containing shard of given number.
+
+    >>> shard_filename(3)
+    'shard-00003.npy'
+    """
+    return f"shard-{number:05}.npy"
+
+
+def read(path: Path, batch_size: int = 64, seed: Optional[int] = None) -> Windows:
+    """
+    Open dataset stored in model directory without loading it into memory.
+    """
+    directory = path / dirname
+
+    with open(directory / meta_filename, "r", encoding="utf-8") as datafile:
+        meta: DatasetMeta = json.load(datafile)
+
+    shards = [
+        np.load(directory / shard_filename(i), mmap_mode="r")
+        for i in range(meta["shards"])
+    ]
+    index = np.load(directory / index_filename, mmap_mode="r")
+
+    augmentation = None
+    if (directory / augmentation_filename).exists():
+        augmentation = np.load(directory / augmentation_filename)
+
+    logger.debug("Opened dataset of {num} windows", num=len(index))
+
+    return Windows(
+        shards,
+        index,
+        distinct_size=meta["distinct_size"],
+        window_size=meta["window_size"],
+        notesets=meta["notesets"],
+        batch_size=batch_size,
+        seed=seed,
+        augmentation=augmentation,
+    )
+
+
+class Windows(utils.Sequence):  # type: ignore
+    """
+    Batches of randomly ordered windows read from shards by index.
+
+    As a keras Sequence batches may be loaded by several workers in parallel.
+    Inputs contain last context values of each window, by default whole window.
+
+    Given augmentation table, mapping values for each of transformations, every
+    window is transformed using randomly selected one.
+
+    Sequential windows have numbers of values following each position of window
+    as targets, instead of encoded value following the whole window.
+    """
+
+    def __init__(
+        self,
+        shards: List[NDArray[np.int32]],
+        index: NDArray[np.int64],
+        distinct_size: int,
+        window_size: int,
+        notesets: int,
+        batch_size: int = 64,
+        seed: Optional[int] = None,
+        context: Optional[int] = None,
+        augmentation: Optional[NDArray[np.int32]] = None,
+        sequences: bool = False,
+    ) -> None:
+        super().__init__()
+        self.shards: Final = shards
+        self.index: Final = index
+        self.distinct_size: Final = distinct_size
+        self.window_size: Final = window_size
+        self.notesets: Final = notesets
+        self.context: Final = window_size if context is None else context
+        self.augmentation: Final = augmentation
+        self.sequences: Final = sequences
+        self.batch_size: Final = batch_size
+        self.rng: Final = np.random.default_rng(seed)
+        self.order = self.rng.permutation(len(index))
+
+    def __len__(self) -> int:
+        return math.ceil(len(self.index) / self.batch_size)
+
+    def __getitem__(self, idx: int) -> Batch:
+        with metrics.span("series"):
+            batch = self.batch(idx)
+
+        metrics.count("windows", len(batch[0]))
+        return batch
+
+    def batch(self, idx: int) -> Batch:
+        """
+        Read batch of given number, transforming and encoding its windows.
+        """
+        start = idx * self.batch_size
+        tokens = self.tokens(self.order[start : start + self.batch_size])
+
+        if self.augmentation is not None:
+            chosen = self.rng.integers(len(self.augmentation), size=len(tokens))
+            tokens = self.augmentation[chosen[:, np.newaxis], tokens]
+
+        inputs = tokens[:, :-1, np.newaxis] / max(self.distinct_size - 1, 1)
+        if self.sequences:
+            return inputs, tokens[:, 1:]
+
+        outputs = np.zeros((len(tokens), self.distinct_size), dtype=np.float32)
+        outputs[np.arange(len(tokens)), tokens[:, -1]] = 1
+
+        return inputs, outputs
+
+    def tokens(self, positions: NDArray[np.int64]) -> NDArray[np.int32]:
+        """
+        Gather windows at given positions of index, each followed by its target.
+
+        Only last context values of each window are kept.
+
+        >>> windows = Windows([np.arange(6)], np.array([[0, 0, 0], [0, 1, 0]]), 6, 4, 1)
+        >>> windows.tokens(np.array([1]))
+        array([[1, 2, 3, 4, 5]])
+        """
+        skip = self.window_size - self.context
+        end = self.window_size + 1
+        tokens: NDArray[np.int32] = np.stack(
+            [
+                self.shards[s][offset + skip : offset + end]
+                for s, offset, _ in self.index[positions]
+            ]
+        )
+
+        return tokens
+
+    def split(
+        self, fraction: float, seed: Optional[int] = None
+    ) -> Tuple[Windows, Windows]:
+        """
+        Divide windows in two, second containing given fraction of note sets.
+
+        Whole note sets are held out, so that no values are shared between them.
+        Held out windows are not augmented.
+        """
+        selected = list(holdout(self.notesets, fraction, seed))
+        held = np.isin(self.index[:, 2], selected)
+
+        kept = self.derive(self.index[~held], self.context, self.augmentation)
+
+        return kept, self.derive(self.index[held], self.context)
+
+    def resized(self, context: int) -> Windows:
+        """
+        Create windows using only last context values of each stored window.
+
+        >>> windows = Windows([np.arange(6)], np.array([[0, 0, 0]]), 6, 4, 1)
+        >>> windows.resized(2)[0][0].ravel()
+        array([0.4, 0.6])
+        """
+        if not 0 < context <= self.window_size:
+            raise ValueError(
+                f"Window size must be in range [1, {self.window_size}], "
+                "rebuild dataset to use longer windows"
+            )
+
+        return self.derive(self.index, context, self.augmentation)
+
+    def strided(self, stride: int) -> Windows:
+        """
+        Create windows starting every stride positions of each note set.
+
+        With stride equal to window size sequential windows do not overlap, so
+        each value is target once.
+
+        >>> index = np.array([[0, 0, 0], [0, 1, 0], [0, 2, 0], [0, 5, 1]])
+        >>> Windows([np.arange(8)], index, 8, 2, 2).strided(2).index[:, 1]
+        array([0, 2, 5])
+        """
+        if stride <= 0:
+            raise ValueError("Stride must be positive")
+
+        notesets = self.index[:, 2]
+        starts = np.flatnonzero(np.diff(notesets, prepend=-1))
+        first = np.repeat(starts, np.diff(starts, append=len(notesets)))
+        selected = (np.arange(len(notesets)) - first) % stride == 0
+
+        return self.derive(self.index[selected], self.context, self.augmentation)
+
+    def sequential(self) -> Windows:
+        """
+        Create windows with targets following each position.
+
+        >>> windows = Windows([np.arange(6)], np.array([[0, 0, 0]]), 6, 4, 1)
+        >>> windows.sequential()[0][1]
+        array([[1, 2, 3, 4]])
+        """
+        return self.derive(self.index, self.context, self.augmentation, sequences=True)
+
+    def derive(
+        self,
+        index: NDArray[np.int64],
+        context: int,
+        augmentation: Optional[NDArray[np.int32]] = None,
+        sequences: Optional[bool] = None,
+    ) -> Windows:
+        """
+        Create windows sharing shards, using given index, context and augmentation.
+
+        Kind of targets is kept unless given.
+        """
+        return Windows(
+            self.shards,
+            index,
+            distinct_size=self.distinct_size,
+            window_size=self.window_size,
+            notesets=self.notesets,
+            batch_size=self.batch_size,
+            seed=int(self.rng.integers(2**32)),
+            context=context,
+            augmentation=augmentation,
+            sequences=self.sequences if sequences is None else sequences,
+        )
+
+    def on_epoch_end(self) -> None:
+        """
+        Shuffle windows between epochs.
+        """
+        self.order = self.rng.permutation(len(self.index))
@@ -0,0 +1,247 @@
+"""
+Train small student models on predictions of larger teacher models.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+
+from pathlib import Path
+from typing import Final, Iterable, Optional, Tuple, TypedDict
+
+import numpy as np
+
+from loguru import logger
+from numpy.typing import NDArray
+
+from sarada import metrics
+from sarada.dataset import Windows
+from sarada.neuron import Neuron
+from sarada.sampling import epsilon
+
+dirname: Final = "distillation"
+targets_filename: Final = "teacher.npy"
+meta_filename: Final = "teacher.json"
+
+
+class TargetsMeta(TypedDict):
+    teacher: str
+    windows: str
+    data: str
+    distinct_size: int
+
+
+def teacher_targets(
+    teacher: Neuron, windows: Windows, path: Path, batch_size: int = 256
+) -> NDArray[np.float16]:
+    """
+    Return log probabilities predicted by teacher for each of windows.
+
+    Predictions are stored in teacher directory as memory mapped array, along
+    with hashes of teacher weights, windows and data they were computed for, so
+    that teacher runs once for all epochs and students using the same windows.
+    """
+    directory = path / dirname
+    meta: TargetsMeta = {
+        "teacher": digest(teacher.model.get_weights()),
+        "windows": digest([windows.index]),
+        "data": digest(windows.shards),
+        "distinct_size": windows.distinct_size,
+    }
+
+    if (directory / meta_filename).exists():
+        with open(directory / meta_filename, "r", encoding="utf-8") as datafile:
+            cached: TargetsMeta = json.load(datafile)
+        if cached == meta:
+            logger.info("Reusing teacher predictions in {path}", path=str(directory))
+            cached_targets: NDArray[np.float16] = np.load(
+                directory / targets_filename, mmap_mode="r"
+            )
+            return cached_targets
+
+    directory.mkdir(exist_ok=True)
+    (directory / meta_filename).unlink(missing_ok=True)
+
+    logger.info("Caching teacher predictions of {num} windows", num=len(windows.index))
+    stored = np.lib.format.open_memmap(
+        directory / targets_filename,
+        mode="w+",
+        dtype=np.float16,
+        shape=(len(windows.index), windows.distinct_size),
+    )
+    with metrics.stage("targets"):
+        for start in range(0, len(windows.index), batch_size):
+            positions = np.arange(start, min(start + batch_size, len(windows.index)))
+            tokens = windows.tokens(positions)
+            with metrics.span("teacher"):
+                states = teacher.normalize(tokens[:, :-1, None])
+                probabilities = teacher.predict(states)
+            stored[positions] = np.log(np.maximum(probabilities, epsilon))
+        stored.flush()
+
+    # Written last, so that interrupted caching is never reused
+    with open(directory / meta_filename, "w", encoding="utf-8") as datafile:
+        json.dump(meta, datafile)
+
+    targets: NDArray[np.float16] = stored
+    return targets
+
+
+def digest(arrays: Iterable[NDArray[np.generic]]) -> str:
+    """
+    Hash contents of arrays.
+
+    >>> digest([np.zeros(2)]) == digest([np.zeros(2)]) != digest([np.ones(2)])
+    True
+    """
+    hashed = hashlib.sha256()
+    for array in arrays:
+        hashed.update(np.ascontiguousarray(array).tobytes())
+
+    return hashed.hexdigest()
+
+
+def soften(
+    log_probabilities: NDArray[np.floating], temperature: float
+) -> NDArray[np.float32]:
+    """
+    Turn log probabilities into probabilities of given temperature.
+
+    Higher temperature flattens distribution, exposing what teacher considers
+    similar to the most probable value.
+
+    >>> soften(np.log(np.array([[0.2, 0.8]])), 2.0).round(2)
+    array([[0.33, 0.67]], dtype=float32)
+    """
+    scaled = log_probabilities.astype(np.float32) / temperature
+    weights = np.exp(scaled - scaled.max(axis=-1, keepdims=True))
+    softened: NDArray[np.float32] = weights / weights.sum(axis=-1, keepdims=True)
+
+    return softened
+
+
+class Distillation(Windows):
+    """
+    Windows with targets mixing softened teacher predictions and true values.
+
+    Targets are given for each window of index, in the same order, unless rows
+    of targets are given for each window. Derived windows, such as split or
+    strided ones, keep teacher predictions of their windows.
+    """
+
+    def __init__(
+        self,
+        windows: Windows,
+        targets: NDArray[np.float16],
+        temperature: float = 2.0,
+        alpha: float = 0.9,
+        seed: Optional[int] = None,
+        rows: Optional[NDArray[np.int64]] = None,
+    ) -> None:
+        if windows.augmentation is not None or windows.sequences:
+            raise ValueError("Teacher predictions do not match augmented windows")
+        if rows is None:
+            rows = np.arange(len(windows.index))
+        if len(rows) != len(windows.index):
+            raise ValueError("Teacher predictions are required for each window")
+
+        super().__init__(
+            windows.shards,
+            windows.index,
+            distinct_size=windows.distinct_size,
+            window_size=windows.window_size,
+            notesets=windows.notesets,
+            batch_size=windows.batch_size,
+            seed=seed,
+            context=windows.context,
+        )
+        self.targets: Final = targets
+        self.rows: Final = rows
+        self.temperature: Final = temperature
+        self.alpha: Final = alpha
+
+    def batch(self, idx: int) -> Tuple[NDArray[np.float64], NDArray[np.float32]]:
+        """
+        Read batch of given number along with teacher predictions for it.
+        """
+        start = idx * self.batch_size
+        # Sorted, so that memory mapped targets are read sequentially
+        positions = np.sort(self.order[start : start + self.batch_size])
+        tokens = self.tokens(positions)
+
+        inputs = tokens[:, :-1, np.newaxis] / max(self.distinct_size - 1, 1)
+        targets = self.targets[self.rows[positions]]
+        outputs = self.alpha * soften(targets, self.temperature)
+        outputs[np.arange(len(tokens)), tokens[:, -1]] += 1 - self.alpha
+
+        return inputs, outputs
+
+    def derive(
+        self,
+        index: NDArray[np.int64],
+        context: int,
+        augmentation: Optional[NDArray[np.int32]] = None,
+        sequences: Optional[bool] = None,
+    ) -> Distillation:
+        """
+        Create windows of given index, along with teacher predictions for them.
+
+        Index must consist of windows of this one, which can not be augmented nor
+        sequential, as teacher predicted only value following each window.
+        """
+        windows = Windows(
+            self.shards,
+            index,
+            distinct_size=self.distinct_size,
+            window_size=self.window_size,
+            notesets=self.notesets,
+            batch_size=self.batch_size,
+            context=context,
+            augmentation=augmentation,
+            sequences=bool(sequences),
+        )
+        seed = int(self.rng.integers(2**32))
+
+        return Distillation(
+            windows,
+            self.targets,
+            self.temperature,
+            self.alpha,
+            seed=seed,
+            rows=self.rows[self.positions(index)],
+        )
+
+    def positions(self, index: NDArray[np.int64]) -> NDArray[np.int64]:
+        """
+        Find positions of windows in index, by their shard and offset.
+
+        >>> windows = Windows([np.arange(9)], np.array([[0, 0, 0], [0, 4, 0]]), 9, 2, 1)
+        >>> Distillation(windows, np.zeros((2, 9))).positions(np.array([[0, 4, 0]]))
+        array([1])
+        """
+        span = int(self.index[:, 1].max(initial=0)) + 1
+        keys = self.index[:, 0] * span + self.index[:, 1]
+        wanted = index[:, 0] * span + index[:, 1]
+
+        order = np.argsort(keys, kind="stable")
+        found = np.minimum(np.searchsorted(keys[order], wanted), len(keys) - 1)
+        positions: NDArray[np.int64] = order[found]
+        if len(wanted) and not np.array_equal(keys[positions], wanted):
+            raise ValueError("Derived windows must be part of distilled ones")
+
+        return positions
+
+
+def step_time(neuron: Neuron, steps: int = 50) -> float:
+    """
+    Measure mean time of predicting single value, as during generation.
+    """
+    state = np.random.default_rng(0).random((1, neuron.input_length, 1))
+    neuron.predict(state)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        neuron.predict(state)
+
+    return (time.perf_counter() - start) / steps
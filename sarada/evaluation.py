@@ -0,0 +1,162 @@
+"""
+Measure how well model predicts note sets it was not trained on.
+"""
+from __future__ import annotations
+
+import itertools
+import math
+
+from typing import Iterable, Iterator, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from numpy.lib.stride_tricks import sliding_window_view
+from numpy.typing import NDArray
+
+from sarada import metrics
+from sarada.neuron import Neuron
+from sarada.notebook import Musical, NoteSet
+from sarada.numeris import Vocabulary
+from sarada.sampling import epsilon
+
+
+class Evaluation(NamedTuple):
+    """Totals of predictions over evaluated windows."""
+
+    tokens: int = 0
+    log_likelihood: float = 0.0
+    correct: Tuple[int, ...] = ()
+    unknown: int = 0
+
+    def merge(self, other: Evaluation) -> Evaluation:
+        """
+        Sum totals of two evaluations.
+
+        >>> Evaluation(2, -1.0, (1,), 0).merge(Evaluation(1, -0.5, (1,), 3))
+        Evaluation(tokens=3, log_likelihood=-1.5, correct=(2,), unknown=3)
+        """
+        pairs = itertools.zip_longest(self.correct, other.correct, fillvalue=0)
+
+        return Evaluation(
+            self.tokens + other.tokens,
+            self.log_likelihood + other.log_likelihood,
+            tuple(a + b for a, b in pairs),
+            self.unknown + other.unknown,
+        )
+
+    @property
+    def mean_log_likelihood(self) -> float:
+        """Average natural logarithm of probability of each predicted token."""
+        return self.log_likelihood / self.tokens if self.tokens else math.nan
+
+    @property
+    def perplexity(self) -> float:
+        """
+        Exponent of negated mean log likelihood, the lower the better.
+
+        >>> Evaluation(2, 2 * math.log(0.25), (1,)).perplexity
+        4.0
+        """
+        return math.exp(-self.mean_log_likelihood) if self.tokens else math.nan
+
+    def accuracy(self, position: int) -> float:
+        """
+        Return fraction of tokens predicted among top k, for k at given position.
+        """
+        return self.correct[position] / self.tokens if self.tokens else math.nan
+
+
+def encode(
+    notesets: Iterable[NoteSet], numeris: Vocabulary[Musical]
+) -> Iterator[Tuple[NDArray[np.int64], int]]:
+    """
+    Replace notes by numbers of model, yielding them with count of unknown ones.
+
+    Notes outside of vocabulary are skipped, as model can not predict them.
+    """
+    for noteset in notesets:
+        keys = [numeris.mapping.get(note) for note in noteset.notes]
+        known = [key for key in keys if key is not None]
+        yield np.array(known, dtype=np.int64), len(keys) - len(known)
+
+
+def batches(
+    sequences: Iterable[NDArray[np.int64]], window_size: int, batch_size: int
+) -> Iterator[NDArray[np.int64]]:
+    """
+    Stream windows of sequences, each followed by its target, in batches.
+
+    Windows are views of sequences until they are gathered in batch, so memory
+    does not depend on length of sequences.
+
+    >>> [b.tolist() for b in batches([np.arange(4), np.arange(3)], 2, 2)]
+    [[[0, 1, 2], [1, 2, 3]], [[0, 1, 2]]]
+    """
+    pending: List[NDArray[np.int64]] = []
+    count = 0
+    for sequence in sequences:
+        if len(sequence) <= window_size:
+            continue
+
+        windows = sliding_window_view(sequence, window_size + 1)
+        while len(windows):
+            taken = windows[: batch_size - count]
+            windows = windows[len(taken) :]
+            pending.append(taken)
+            count += len(taken)
+            if count == batch_size:
+                yield np.concatenate(pending)
+                pending, count = [], 0
+
+    if pending:
+        yield np.concatenate(pending)
+
+
+def evaluate(
+    neuron: Neuron,
+    numeris: Vocabulary[Musical],
+    notesets: Iterable[NoteSet],
+    top_k: Sequence[int] = (1, 5),
+    batch_size: int = 256,
+) -> Evaluation:
+    """
+    Predict last value of every window of note sets, summing up results.
+
+    Windows are as long as model input, whole batch is evaluated in single
+    forward pass.
+    """
+    unknown = 0
+
+    def known() -> Iterator[NDArray[np.int64]]:
+        nonlocal unknown
+        for sequence, missing in encode(notesets, numeris):
+            unknown += missing
+            yield sequence
+
+    result = Evaluation(correct=(0,) * len(top_k))
+    for batch in batches(known(), neuron.input_length, batch_size):
+        with metrics.span("evaluate"):
+            result = result.merge(score(neuron, batch, top_k))
+
+    metrics.count("evaluated_tokens", result.tokens)
+
+    return result._replace(unknown=unknown)
+
+
+def score(neuron: Neuron, batch: NDArray[np.int64], top_k: Sequence[int]) -> Evaluation:
+    """
+    Evaluate predictions of last value in each window of batch.
+    """
+    inputs = neuron.normalize(batch[:, :-1])[..., np.newaxis]
+    targets = batch[:, -1]
+
+    probabilities = neuron.predict(inputs)
+    expected = probabilities[np.arange(len(batch)), targets]
+    # Rank of target is number of values predicted as more probable
+    ranks = (probabilities > expected[:, np.newaxis]).sum(axis=-1)
+
+    return Evaluation(
+        tokens=len(batch),
+        log_likelihood=float(np.log(np.maximum(expected, epsilon)).sum()),
+        correct=tuple(int((ranks < k).sum()) for k in top_k),
+    )
@@ -0,0 +1,252 @@
+"""
+Detect duplicated note sets using exact hashes and MinHash signatures.
+"""
+from __future__ import annotations
+
+import collections
+import hashlib
+import multiprocessing
+import struct
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from fractions import Fraction
+from functools import lru_cache
+from typing import (
+    Deque,
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Set,
+    Tuple,
+)
+
+import numpy as np
+
+from loguru import logger
+from numpy.typing import NDArray
+
+from sarada import music21
+from sarada.notebook import Chord, Musical, Musicals, Note, NoteSet
+
+shingle_size: Final = 4
+max_denominator: Final = 1024
+permutations: Final = 64
+bands: Final = 16
+
+_seeds: Final = np.random.default_rng(0).integers(
+    0, np.iinfo(np.uint64).max, size=permutations, dtype=np.uint64, endpoint=True
+)
+
+
+class Fingerprint(NamedTuple):
+    """Exact digest and MinHash signature of single note set."""
+
+    digest: bytes
+    signature: NDArray[np.uint64]
+
+
+def fingerprint(notes: Musicals, size: int = shingle_size) -> Fingerprint:
+    """
+    Compute fingerprint of note set from its shingles, n-grams of notes.
+
+    Hashes are stable between processes, unlike builtin hash, and computed from
+    canonical encoding of notes, so that the same music read from files of
+    different formats has the same fingerprint.
+
+    >>> from sarada.notebook import Rest
+    >>> notes = [Rest(1.0), Rest(0.5)] * 4
+    >>> similarity(fingerprint(notes), fingerprint(notes[1:]))
+    1.0
+    """
+    encoded = [encode(musical) for musical in notes]
+    digest = hashlib.blake2b(b"".join(encoded), digest_size=16).digest()
+
+    count = max(len(notes) - size + 1, 1)
+    shingles = np.fromiter(
+        (stable_hash(b"".join(encoded[i : i + size])) for i in range(count)),
+        dtype=np.uint64,
+        count=count,
+    )
+    hashes = mix(shingles ^ _seeds[:, np.newaxis])
+
+    return Fingerprint(digest, hashes.min(axis=1))
+
+
+def stable_hash(data: bytes) -> int:
+    """
+    Hash bytes into 64 bit integer.
+    """
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+@lru_cache(maxsize=None)
+def encode(musical: Musical) -> bytes:
+    """
+    Pack kind of value, its duration as fraction and MIDI numbers of its pitches.
+
+    Spellings of the same sound, enharmonic pitches, order of chord pitches and
+    durations stored either as floats or fractions, are packed the same.
+
+    >>> from sarada.notebook import Pitch, QuarterLength
+    >>> sharp = Note(QuarterLength(0.5), Pitch("C#4"))
+    >>> encode(sharp) == encode(Note(Fraction(1, 2), Pitch("D-4")))
+    True
+    """
+    duration = Fraction(musical.duration).limit_denominator(max_denominator)
+    if isinstance(musical, Note):
+        kind, pitches = 0, [midi(musical.pitch)]
+    elif isinstance(musical, Chord):
+        kind, pitches = 1, sorted(map(midi, musical.pitch))
+    else:
+        kind, pitches = 2, []
+
+    return struct.pack(
+        f"<BqqH{len(pitches)}h",
+        kind,
+        duration.numerator,
+        duration.denominator,
+        len(pitches),
+        *pitches,
+    )
+
+
+@lru_cache(maxsize=None)
+def midi(pitch: str) -> int:
+    """
+    Return MIDI number of pitch given by its name.
+
+    >>> midi("C4"), midi("B#3")
+    (60, 60)
+    """
+    number: int = music21.Pitch(pitch).midi
+    return number
+
+
+def mix(values: NDArray[np.uint64]) -> NDArray[np.uint64]:
+    """
+    Scramble bits of values, acting as independent hash for each seed.
+
+    This is the finalizer of SplitMix64 generator, multiplication wraps around.
+
+    >>> mix(np.array([0, 1], dtype=np.uint64))
+    array([                  0, 6238072747940578789], dtype=uint64)
+    """
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    mixed: NDArray[np.uint64] = values ^ (values >> np.uint64(31))
+    return mixed
+
+
+def similarity(first: Fingerprint, second: Fingerprint) -> float:
+    """
+    Estimate Jaccard similarity of shingles of two note sets.
+    """
+    return float(np.mean(first.signature == second.signature))
+
+
+class Deduplicator:
+    """
+    Remember fingerprints of accepted note sets and reject similar ones.
+
+    Candidates for near duplicates are found using locality sensitive hashing of
+    signature bands, so only small number of fingerprints is compared.
+    """
+
+    def __init__(self, threshold: float = 0.9) -> None:
+        if not 0 < threshold <= 1:
+            raise ValueError("Similarity threshold must be in range (0, 1]")
+
+        self.threshold: Final = threshold
+        self.digests: Final[Set[bytes]] = set()
+        self.buckets: Final[Dict[Tuple[int, bytes], List[int]]] = {}
+        self.fingerprints: Final[List[Fingerprint]] = []
+        self.exact = 0
+        self.near = 0
+
+    def add(self, print_: Fingerprint) -> bool:
+        """
+        Remember fingerprint unless it duplicates already known one.
+
+        Returns whether note set should be kept.
+        """
+        if print_.digest in self.digests:
+            self.exact += 1
+            return False
+
+        keys = [
+            (band, chunk.tobytes())
+            for band, chunk in enumerate(np.split(print_.signature, bands))
+        ]
+        candidates = {idx for key in keys for idx in self.buckets.get(key, [])}
+        if any(
+            similarity(print_, self.fingerprints[idx]) >= self.threshold
+            for idx in candidates
+        ):
+            self.near += 1
+            return False
+
+        self.digests.add(print_.digest)
+        for key in keys:
+            self.buckets.setdefault(key, []).append(len(self.fingerprints))
+        self.fingerprints.append(print_)
+
+        return True
+
+
+def deduplicate(
+    notesets: Iterable[NoteSet],
+    deduplicator: Deduplicator,
+    workers: int = 1,
+) -> Iterator[NoteSet]:
+    """
+    Yield note sets which are not duplicates of previous ones.
+
+    Fingerprints are computed by worker processes while following note sets are
+    parsed, with no workers they are computed in place. Order is preserved.
+    """
+    total = 0
+    if workers <= 0:
+        for noteset in notesets:
+            total += 1
+            if deduplicator.add(fingerprint(noteset.notes)):
+                yield noteset
+    else:
+        context = multiprocessing.get_context("spawn")
+        pending: Deque[Tuple[NoteSet, Future[Fingerprint]]] = collections.deque()
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            for noteset in notesets:
+                total += 1
+                future = executor.submit(fingerprint, noteset.notes)
+                pending.append((noteset, future))
+                while len(pending) > 2 * workers:
+                    yield from accepted(pending.popleft(), deduplicator)
+
+            while pending:
+                yield from accepted(pending.popleft(), deduplicator)
+
+    logger.info(
+        "Removed {exact} exact and {near} near duplicates of {total} note sets",
+        exact=deduplicator.exact,
+        near=deduplicator.near,
+        total=total,
+    )
+
+
+def accepted(
+    item: Tuple[NoteSet, Future[Fingerprint]], deduplicator: Deduplicator
+) -> Iterator[NoteSet]:
+    """
+    Yield note set if its fingerprint is accepted by deduplicator.
+    """
+    noteset, future = item
+    if deduplicator.add(future.result()):
+        yield noteset
+    else:
+        logger.trace(
+            "Dropping duplicated note set of {num} notes", num=len(noteset.notes)
+        )
@@ -0,0 +1,337 @@
+"""
+Process files in isolated worker processes guarded by time and memory limits.
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import resource
+import time
+
+from multiprocessing.connection import Connection, wait
+from multiprocessing.context import SpawnContext
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    Final,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypedDict,
+    TypeVar,
+    cast,
+)
+
+from loguru import logger
+
+from sarada import metrics
+
+R = TypeVar("R")  # pylint: disable=invalid-name
+
+default_quarantine: Final = (
+    Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser()
+    / "sarada"
+    / "quarantine.json"
+)
+
+
+class Limits(NamedTuple):
+    """Resources each file may use, zero disables limit."""
+
+    timeout: float = 60.0
+    memory: int = 0
+
+
+class Isolation(NamedTuple):
+    """Settings of isolated processing."""
+
+    workers: int = 1
+    limits: Limits = Limits()
+    quarantine: Optional[Quarantine] = None
+
+
+Reply = Tuple[bool, object, metrics.Snapshot]
+
+
+class Failure(NamedTuple):
+    """File which could not be processed."""
+
+    path: Path
+    reason: str
+    elapsed: float
+
+
+class QuarantineEntry(TypedDict):
+    reason: str
+    size: int
+    mtime: int
+
+
+class Quarantine:
+    """
+    Persisted list of files which failed to be processed.
+
+    Files are identified by absolute path, size and modification time, so that
+    modified files are processed again.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path: Final = path
+        self.entries: Dict[str, QuarantineEntry] = {}
+
+        if path.exists():
+            with open(path, "r", encoding="utf-8") as datafile:
+                self.entries = json.load(datafile)
+
+    def __contains__(self, filepath: object) -> bool:
+        if not isinstance(filepath, Path):
+            return False
+
+        entry = self.entries.get(str(filepath.resolve()))
+        return entry is not None and entry == self.entry(filepath, entry["reason"])
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, filepath: Path, reason: str) -> None:
+        """
+        Add file to quarantine and store it immediately.
+        """
+        self.entries[str(filepath.resolve())] = self.entry(filepath, reason)
+        self.store()
+
+    def store(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as datafile:
+            json.dump(self.entries, datafile, indent=2)
+
+    @staticmethod
+    def entry(filepath: Path, reason: str) -> QuarantineEntry:
+        stat = filepath.stat()
+        return {"reason": reason, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def serve(
+    connection: Connection[Reply, Optional[Path]],
+    function: Callable[[Path], R],
+    memory: int,
+) -> None:
+    """
+    Apply function to paths received through connection until None is received.
+
+    Readiness is reported first, so that time spent on startup does not count
+    towards limits of files. Worker exits after running out of memory, as it may
+    be unusable afterwards. Metrics collected while processing each file are
+    sent along with its result.
+    """
+    if memory:
+        limit = memory * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    connection.send((True, None, metrics.take()))
+
+    while True:
+        path: Optional[Path] = connection.recv()
+        if path is None:
+            return
+
+        try:
+            result = function(path)
+        except MemoryError:
+            reason = f"memory limit of {memory} MB exceeded"
+            connection.send((False, reason, metrics.take()))
+            return
+        except Exception as ex:  # pylint: disable=broad-except
+            connection.send((False, f"{type(ex).__name__}: {ex}", metrics.take()))
+            continue
+
+        connection.send((True, result, metrics.take()))
+
+
+class Worker(Generic[R]):
+    """
+    Single worker process, restarted whenever it fails.
+    """
+
+    def __init__(
+        self, context: SpawnContext, function: Callable[[Path], R], limits: Limits
+    ) -> None:
+        self.context: Final = context
+        self.function: Final = function
+        self.limits: Final = limits
+        self.task: Optional[Tuple[int, Path]] = None
+        self.started = 0.0
+        self.connection, child = context.Pipe()
+        self.process = self.start(child)
+
+    def start(
+        self, child: Connection[Reply, Optional[Path]]
+    ) -> multiprocessing.process.BaseProcess:
+        process = self.context.Process(
+            target=serve,
+            args=(child, self.function, self.limits.memory),
+            daemon=True,
+        )
+        process.start()
+        child.close()
+
+        return process
+
+    def submit(self, number: int, path: Path) -> None:
+        self.task = (number, path)
+        self.started = time.monotonic()
+        self.connection.send(path)
+
+    def deadline(self) -> float:
+        return self.started + self.limits.timeout if self.limits.timeout else 1e300
+
+    def restart(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+        self.connection, child = self.context.Pipe()
+        self.process = self.start(child)
+        self.wait_ready()
+
+    def wait_ready(self) -> None:
+        """
+        Block until worker process finishes starting.
+        """
+        self.connection.recv()
+
+    def stop(self) -> None:
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.connection.close()
+
+
+def isolated_map(
+    function: Callable[[Path], R],
+    paths: Iterable[Path],
+    isolation: Isolation = Isolation(),
+    stage: str = "process",
+) -> Iterator[R]:
+    """
+    Apply function to each path in worker processes, yielding results in order.
+
+    Time spent on each successfully processed file is recorded as span of given
+    stage, and number of them as files. Metrics collected by workers are merged
+    into ones of this process.
+
+    Files exceeding limits or raising errors are skipped and added to
+    quarantine, quarantined ones are skipped without processing. Function must
+    be picklable, as workers are spawned.
+    """
+    workers, limits, quarantine = isolation
+    context = multiprocessing.get_context("spawn")
+    pool = [Worker(context, function, limits) for _ in range(workers)]
+    for worker in pool:
+        worker.wait_ready()
+    idle = list(pool)
+    busy: List[Worker[R]] = []
+    tasks = enumerate(paths)
+    task = next(tasks, None)
+    results: Dict[int, Optional[R]] = {}
+    expected = 0
+    failures: List[Failure] = []
+    skipped = 0
+
+    try:
+        while True:
+            while idle and task is not None and task[0] < expected + 4 * workers:
+                number, path = task
+                if quarantine is not None and path in quarantine:
+                    logger.debug("Skipping quarantined {path}", path=str(path))
+                    skipped += 1
+                    results[number] = None
+                else:
+                    worker = idle.pop()
+                    worker.submit(number, path)
+                    busy.append(worker)
+                task = next(tasks, None)
+
+            while expected in results:
+                result = results.pop(expected)
+                expected += 1
+                if result is not None:
+                    yield result
+
+            if not busy:
+                if task is None:
+                    break
+                continue
+
+            timeout = max(min(w.deadline() for w in busy) - time.monotonic(), 0)
+            ready = wait([w.connection for w in busy], timeout=min(timeout, 3600))
+            now = time.monotonic()
+
+            for worker in list(busy):
+                number, path = cast(Tuple[int, Path], worker.task)
+                if worker.connection in ready:
+                    try:
+                        succeeded, value, collected = worker.connection.recv()
+                        metrics.merge(collected)
+                    except EOFError:
+                        succeeded, value = False, "worker process died"
+                elif now >= worker.deadline():
+                    succeeded, value = False, f"timeout of {limits.timeout}s exceeded"
+                else:
+                    continue
+
+                busy.remove(worker)
+                idle.append(worker)
+
+                if succeeded:
+                    results[number] = cast(R, value)
+                    metrics.observe(stage, now - worker.started)
+                    metrics.count("files")
+                    continue
+
+                results[number] = None
+                failures.append(Failure(path, str(value), now - worker.started))
+                logger.warning(
+                    "Quarantining {path}: {reason}", path=str(path), reason=value
+                )
+                if quarantine is not None:
+                    quarantine.add(path, str(value))
+                worker.restart()
+    finally:
+        for worker in pool:
+            worker.stop()
+
+    summarize(failures, skipped)
+
+
+def summarize(failures: List[Failure], skipped: int) -> None:
+    """
+    Log files which failed and time lost on them.
+    """
+    if skipped:
+        logger.info("Skipped {num} quarantined files", num=skipped)
+
+    if not failures:
+        return
+
+    logger.warning(
+        "Failed to process {num} files, losing {elapsed:.1f}s:",
+        num=len(failures),
+        elapsed=sum(failure.elapsed for failure in failures),
+    )
+    for failure in failures:
+        logger.warning(
+            "  {path} after {elapsed:.1f}s: {reason}",
+            path=str(failure.path),
+            elapsed=failure.elapsed,
+            reason=failure.reason,
+        )
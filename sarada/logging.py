@@ -5,23 +5,50 @@ from __future__ import annotations
 
 import logging
 import os
+import sys
+import time
 
+from functools import lru_cache
 from types import FrameType
-from typing import Optional
+from typing import Dict, Final, Iterable, Optional, Tuple, Union
 
 from loguru import logger
 
+muted: Final = ("absl",)
+
+
+@lru_cache(maxsize=None)
+def loguru_level(name: str, number: int) -> Union[str, int]:
+    """
+    Return loguru level corresponding to logging one, looked up once per level.
+
+    >>> loguru_level("WARNING", 30)
+    'WARNING'
+    >>> loguru_level("Level 5", 5)
+    5
+    """
+    try:
+        return logger.level(name).name
+    except ValueError:
+        return number
+
 
 class InterceptHandler(logging.Handler):
     """Intercept logs from logging and forward to loguru sinks."""
 
+    def __init__(
+        self, level: Union[int, str] = logging.NOTSET, ignored: Iterable[str] = muted
+    ) -> None:
+        super().__init__(level)
+        self.ignored: Final[Tuple[str, ...]] = tuple(ignored)
+
     def emit(self, record):  # type: ignore
         """Log emited logs with loguru sinks."""
-        # Get corresponding Loguru level if it exists
-        try:
-            level = logger.level(record.levelname).name
-        except ValueError:
-            level = record.levelno
+        # Drop records of muted loggers before doing any work on them
+        if record.name.startswith(self.ignored):
+            return
+
+        level = loguru_level(record.levelname, record.levelno)
 
         # Find caller from where originated the logged message
         frame: Optional[FrameType] = logging.currentframe()
@@ -35,21 +62,78 @@ class InterceptHandler(logging.Handler):
         )
 
 
-def setup_logging() -> None:
+class Summary:
+    """
+    Accumulate counts of repeated events and log them at given interval.
+
+    Used instead of logging each of many events in loops, so that cost of
+    logging does not grow with amount of data. Used as context manager, final
+    counts are logged on exit.
+
+    >>> with Summary("Yielded {series} series of {datasets} datasets") as summary:
+    ...     summary.add(series=3, datasets=1)
+    ...     summary.add(series=2, datasets=1)
+    >>> summary.counts
+    {'series': 5, 'datasets': 2}
+    """
+
+    def __init__(
+        self, message: str, level: str = "DEBUG", interval: float = 10.0
+    ) -> None:
+        self.message: Final = message
+        self.level: Final = level
+        self.interval: Final = interval
+        self.counts: Final[Dict[str, int]] = {}
+        self.last = time.monotonic()
+
+    def add(self, **counts: int) -> None:
+        """
+        Increase counts, logging them if interval passed since last time.
+        """
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+        now = time.monotonic()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Log current counts, unless there are none.
+        """
+        if self.counts:
+            logger.log(self.level, self.message, **self.counts)
+
+    def __enter__(self) -> Summary:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.flush()
+
+
+def setup_logging(level: str = "DEBUG") -> None:
     """
     Configure logging.
 
     Effects:
+    - Log to standard error records of given level and above
     - Capture warning to logs
-    - Enforce third party logs
+    - Enforce third party logs, filtering them by level before forwarding
     """
     os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
+    logger.remove()
+    logger.add(sys.stderr, level=level)
+    threshold = logger.level(level).no
+
     logging.captureWarnings(True)
-    logging.root.handlers = [InterceptHandler()]
+    logging.root.handlers = [InterceptHandler(threshold)]
+    logging.root.setLevel(threshold)
 
     for name in logging.root.manager.loggerDict.keys():
         logging.getLogger(name).handlers = []
         logging.getLogger(name).propagate = True
 
-    logger.disable("absl")
+    for name in muted:
+        logger.disable(name)
@@ -0,0 +1,305 @@
+"""
+Timing spans and counters of pipeline stages, exported through loguru.
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from typing import (
+    Callable,
+    Dict,
+    Final,
+    Iterator,
+    List,
+    Literal,
+    NamedTuple,
+)
+
+from loguru import logger
+
+Format = Literal["jsonl", "prometheus"]
+
+prefix: Final = "sarada"
+
+
+class Span(NamedTuple):
+    """Aggregated durations of single stage."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    longest: float = 0.0
+
+    def add(self, seconds: float) -> Span:
+        """
+        Include another duration.
+
+        >>> Span().add(2.0).add(1.0)
+        Span(calls=2, seconds=3.0, longest=2.0)
+        """
+        return Span(self.calls + 1, self.seconds + seconds, max(self.longest, seconds))
+
+    def merge(self, other: Span) -> Span:
+        """
+        Include durations aggregated elsewhere.
+
+        >>> Span(1, 2.0, 2.0).merge(Span(2, 1.5, 1.0))
+        Span(calls=3, seconds=3.5, longest=2.0)
+        """
+        return Span(
+            self.calls + other.calls,
+            self.seconds + other.seconds,
+            max(self.longest, other.longest),
+        )
+
+
+class Snapshot(NamedTuple):
+    """Spans and counters collected by registry."""
+
+    spans: Dict[str, Span]
+    counters: Dict[str, float]
+
+
+class Registry:
+    """
+    Collect spans and counters, safe to use from many threads.
+
+    Spans are only aggregated, as they are measured in hot loops as well. Stages
+    wrap whole steps of commands, each of them is emitted as structured loguru
+    record at TRACE level when it finishes, carrying spans and counters collected
+    during it in extra data, so sinks may pick them up without parsing messages.
+    """
+
+    def __init__(self) -> None:
+        self.spans: Final[Dict[str, Span]] = {}
+        self.counters: Final[Dict[str, float]] = {}
+        self.lock: Final = threading.Lock()
+
+    def count(self, name: str, value: float = 1) -> None:
+        """
+        Increase counter by given value.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Record duration of stage measured elsewhere.
+        """
+        with self.lock:
+            self.spans[name] = self.spans.get(name, Span()).add(seconds)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """
+        Measure time spent in block of code as stage of given name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Measure step of command as span, emitting event once it finishes.
+        """
+        before = self.snapshot()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(name, seconds)
+            spans, counters = self.since(before)
+            event = {
+                "type": "stage",
+                "name": name,
+                "seconds": seconds,
+                "spans": {key: span._asdict() for key, span in spans.items()},
+                "counters": counters,
+            }
+            logger.bind(metric=event).log(
+                "TRACE", "Stage {name} took {seconds:.3f}s", name=name, seconds=seconds
+            )
+
+    def snapshot(self) -> Snapshot:
+        """
+        Return copy of current state.
+        """
+        with self.lock:
+            return Snapshot(dict(self.spans), dict(self.counters))
+
+    def since(self, before: Snapshot) -> Snapshot:
+        """
+        Return spans and counters collected after snapshot was taken.
+
+        Longest duration of span is the longest one overall.
+
+        >>> registry = Registry()
+        >>> registry.count("files")
+        >>> before = registry.snapshot()
+        >>> registry.count("files", 2)
+        >>> registry.since(before).counters
+        {'files': 2}
+        """
+        spans, counters = self.snapshot()
+        return Snapshot(
+            {
+                name: Span(
+                    span.calls - before.spans.get(name, Span()).calls,
+                    span.seconds - before.spans.get(name, Span()).seconds,
+                    span.longest,
+                )
+                for name, span in spans.items()
+                if span.calls != before.spans.get(name, Span()).calls
+            },
+            {
+                name: value - before.counters.get(name, 0)
+                for name, value in counters.items()
+                if value != before.counters.get(name, 0)
+            },
+        )
+
+    def take(self) -> Snapshot:
+        """
+        Return current state and start collecting anew.
+
+        Used by worker processes to send what they collected to parent process.
+        """
+        with self.lock:
+            taken = Snapshot(dict(self.spans), dict(self.counters))
+            self.spans.clear()
+            self.counters.clear()
+
+        return taken
+
+    def merge(self, snapshot: Snapshot) -> None:
+        """
+        Include spans and counters collected by other registry.
+
+        >>> registry = Registry()
+        >>> registry.merge(Snapshot({"parse": Span(1, 2.0, 2.0)}, {"notes": 3}))
+        >>> registry.spans["parse"], registry.counters["notes"]
+        (Span(calls=1, seconds=2.0, longest=2.0), 3)
+        """
+        with self.lock:
+            for name, span in snapshot.spans.items():
+                self.spans[name] = self.spans.get(name, Span()).merge(span)
+            for name, value in snapshot.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> Dict[str, object]:
+        """
+        Return current state as single event.
+        """
+        with self.lock:
+            return {
+                "type": "summary",
+                "spans": {name: span._asdict() for name, span in self.spans.items()},
+                "counters": dict(self.counters),
+            }
+
+    def prometheus(self) -> str:
+        """
+        Format current state in Prometheus text exposition format.
+
+        >>> registry = Registry()
+        >>> registry.count("files", 3)
+        >>> print(registry.prometheus())
+        # TYPE sarada_files_total counter
+        sarada_files_total 3
+        <BLANKLINE>
+        """
+        lines: List[str] = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines += [
+                    f"# TYPE {prefix}_{name}_total counter",
+                    f"{prefix}_{name}_total {value:g}",
+                ]
+
+            if self.spans:
+                for metric in ("seconds", "calls"):
+                    lines.append(f"# TYPE {prefix}_span_{metric}_total counter")
+                    lines += [
+                        f'{prefix}_span_{metric}_total{{stage="{name}"}} '
+                        f"{getattr(span, metric):g}"
+                        for name, span in sorted(self.spans.items())
+                    ]
+                lines.append(f"# TYPE {prefix}_span_longest_seconds gauge")
+                lines += [
+                    f'{prefix}_span_longest_seconds{{stage="{name}"}} {span.longest:g}'
+                    for name, span in sorted(self.spans.items())
+                ]
+
+        return "\n".join(lines) + "\n"
+
+
+registry: Final = Registry()
+count: Final = registry.count
+observe: Final = registry.observe
+span: Final = registry.span
+stage: Final = registry.stage
+take: Final = registry.take
+merge: Final = registry.merge
+
+
+class JsonLines:
+    """
+    Loguru sink appending metric events to file as JSON lines.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.datafile: Final = open(  # pylint: disable=consider-using-with
+            path, "a", encoding="utf-8"
+        )
+
+    def __call__(self, message: object) -> None:
+        record = getattr(message, "record")
+        event = {"time": record["time"].timestamp(), **record["extra"]["metric"]}
+        self.datafile.write(json.dumps(event) + "\n")
+
+    def close(self) -> None:
+        self.datafile.close()
+
+
+def setup_metrics(path: Path, format_: Format = "jsonl") -> Callable[[], None]:
+    """
+    Start exporting metrics to given file, return function finishing export.
+
+    JSON lines receive event of each stage as it finishes and summary event at
+    the end, Prometheus file is written once at the end, replaced atomically.
+    """
+    if format_ == "prometheus":
+        return partial(store_prometheus, path)
+
+    sink = JsonLines(path)
+    handler = logger.add(
+        sink,
+        level="TRACE",
+        format="{message}",
+        filter=lambda record: "metric" in record["extra"],
+        catch=False,
+    )
+
+    def finish() -> None:
+        logger.bind(metric=registry.summary()).log("TRACE", "Metrics summary")
+        logger.remove(handler)
+        sink.close()
+
+    return finish
+
+
+def store_prometheus(path: Path) -> None:
+    """
+    Write current state of metrics in Prometheus text file.
+    """
+    temporary = path.with_suffix(path.suffix + ".tmp")
+    temporary.write_text(registry.prometheus(), encoding="utf-8")
+    temporary.replace(path)
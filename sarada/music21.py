@@ -5,11 +5,13 @@ from __future__ import annotations
 
 # pylint: disable=useless-suppression,import-error
 from music21.chord import Chord
+from music21.exceptions21 import Music21Exception
 from music21.humdrum.spineParser import MiscTandem, SpineComment
 from music21.instrument import Instrument
 from music21.layout import LayoutBase
 from music21.note import GeneralNote, Note, Rest
-from music21.stream import Stream
+from music21.pitch import Pitch
+from music21.stream import Part, Score, Stream
 from music21.stream.iterator import StreamIterator
 
 __all__ = [
@@ -18,8 +20,12 @@ __all__ = [
     "Instrument",
     "LayoutBase",
     "MiscTandem",
+    "Music21Exception",
     "Note",
+    "Part",
+    "Pitch",
     "Rest",
+    "Score",
     "SpineComment",
     "Stream",
     "StreamIterator",
@@ -3,11 +3,24 @@ Learning and generating data.
 """
 from __future__ import annotations
 
-import itertools
-import random
+import asyncio
 
 from pathlib import Path
-from typing import Final, Iterable, List, Optional, Tuple
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TypedDict,
+    Union,
+)
 
 import keras
 import numpy as np
@@ -18,7 +31,32 @@ from loguru import logger
 from numpy.typing import NDArray
 from tensorflow.keras import Sequential, callbacks, layers, optimizers
 
+from sarada import attention, metrics
+from sarada.dataset import Windows
 from sarada.numeris import Series
+from sarada.sampling import Sampler, epsilon
+
+batch_size: Final = 64
+default_units: Final = (256, 512, 256)
+default_learning_rate: Final = 1e-5
+kinds: Final = ("gru", "gru-sequence", "attention")
+
+Predictor = Callable[[NDArray[np.float64], NDArray[np.int64]], NDArray[np.float32]]
+
+
+class Progress(NamedTuple):
+    """Summary of finished learning."""
+
+    epochs: int
+    best_epoch: int
+    best_loss: float
+
+
+class Architecture(TypedDict):
+    kind: str
+    units: List[int]
+    inputs: int
+    outputs: int
 
 
 class Neuron:
@@ -26,65 +64,197 @@ class Neuron:
     Manages model, it's inputs and data generetion.
     """
 
-    def __init__(self, input_length: int, output_length: int, model: Model = None):
+    def __init__(
+        self,
+        input_length: int,
+        output_length: int,
+        model: Model = None,
+        units: Optional[Sequence[int]] = None,
+        learning_rate: float = default_learning_rate,
+        kind: str = "gru",
+    ):
+        if kind not in kinds:
+            raise ValueError(f"Unknown model kind {kind}")
+
+        if units is None:
+            units = attention.default_units if kind == "attention" else default_units
+
         self.input_length: Final = input_length
         self.output_length: Final = output_length
+        self.kind: Final = kind
+        self.sequential: Final = kind != "gru"
+        self.units: Final = tuple(units)
+        self.learning_rate: Final = learning_rate
         self._model: Optional[Model] = model
 
-    def learn(self, dataset: Iterable[Series], epochs: int = 100) -> None:
+    def learn(
+        self,
+        dataset: Union[Iterable[Series], Windows],
+        epochs: int = 100,
+        workers: int = 1,
+        validation: Union[Iterable[Series], Windows, None] = None,
+        validation_batches: int = 0,
+        patience: int = 0,
+        checkpoint: Path = Path("checkpoint"),
+        extra_callbacks: Sequence[callbacks.Callback] = (),
+    ) -> Progress:
         """
         Begin model learning with provided data.
 
-        Learning process is saved during the process.
+        Data is either converted to arrays in memory or, in case of windows read
+        from dataset shards, loaded batch by batch by given number of workers.
+
+        When validation data is provided, validation loss is monitored instead of
+        training loss. It is evaluated on at most validation_batches batches per
+        epoch, all of them if zero or there are fewer. Positive patience enables
+        early stopping and lowering learning rate once monitored loss stops
+        improving.
+
+        Sequential models learn to predict value following each position of
+        windows, which is why they require windows.
+
+        Learning process is saved during the process in checkpoint directory.
         """
-        filepath = "checkpoint"
+        if self.sequential:
+            if not isinstance(dataset, Windows):
+                raise ValueError("Sequential models learn only from windows")
+            dataset = dataset.sequential()
+            if isinstance(validation, Windows):
+                validation = validation.sequential()
 
-        inputs, outputs = self.prepare_dataset(dataset)
+        filepath = str(checkpoint)
+        monitor = "loss" if validation is None else "val_loss"
 
         logger.debug("Initializing fitting checkpoint as {f}", f=filepath)
 
-        checkpoint = callbacks.ModelCheckpoint(
-            filepath, monitor="loss", verbose=0, save_best_only=True, mode="min"
-        )
+        recorder = Recorder(monitor)
+        callback_list = [
+            recorder,
+            callbacks.ModelCheckpoint(
+                filepath, monitor=monitor, verbose=0, save_best_only=True, mode="min"
+            ),
+            *extra_callbacks,
+        ]
+
+        if patience > 0:
+            logger.debug("Stopping early after {num} epochs", num=patience)
+            callback_list += [
+                callbacks.EarlyStopping(
+                    monitor=monitor, patience=patience, restore_best_weights=True
+                ),
+                callbacks.ReduceLROnPlateau(
+                    monitor=monitor, factor=0.5, patience=max(patience // 2, 1)
+                ),
+            ]
+
+        validation_steps = None
+        if isinstance(validation, Windows):
+            validation_steps = min(validation_batches, len(validation)) or None
 
         logger.debug("Starting fitting model")
-        self.model.fit(
-            inputs, outputs, epochs=epochs, batch_size=64, callbacks=[checkpoint]
-        )
+        with metrics.stage("fit"):
+            if isinstance(dataset, Windows):
+                history = self.model.fit(
+                    dataset,
+                    epochs=epochs,
+                    workers=workers,
+                    validation_data=validation,
+                    validation_steps=validation_steps,
+                    callbacks=callback_list,
+                )
+            else:
+                inputs, outputs = self.prepare_dataset(dataset)
+                validation_data = None
+                if validation is not None and not isinstance(validation, Windows):
+                    validation_data = self.prepare_dataset(
+                        validation, limit=validation_batches * batch_size
+                    )
+
+                history = self.model.fit(
+                    inputs,
+                    outputs,
+                    epochs=epochs,
+                    batch_size=batch_size,
+                    validation_data=validation_data,
+                    callbacks=callback_list,
+                )
         logger.info("Model fitting finished")
 
+        epochs = len(history.epoch)
+        metrics.count("epochs", epochs)
+
+        losses = recorder.losses
+        if not losses:
+            logger.warning("No epoch reported {monitor}", monitor=monitor)
+            return Progress(epochs=epochs, best_epoch=0, best_loss=float("nan"))
+
+        best = min(losses, key=losses.__getitem__)
+
+        logger.info(
+            "Best {monitor} {loss} after epoch {epoch}",
+            monitor=monitor,
+            loss=losses[best],
+            epoch=best + 1,
+        )
+
+        return Progress(epochs=epochs, best_epoch=best + 1, best_loss=losses[best])
+
     def assemble(self) -> Model:
         """
         Create neuron network model.
+
+        Model accepts windows of any length, input length is only a default.
+        Sequential models predict value following each position of window.
         """
         if not tensorflow.config.list_physical_devices("GPU"):
             logger.warning("No GPU detected")
 
         logger.debug("Creating initial model")
+        if self.kind == "attention":
+            return attention.assemble(
+                self.output_length, self.units, self.learning_rate
+            )
+
         layer_list = [
-            layers.GRU(256, input_shape=(self.input_length, 1), return_sequences=True),
-            layers.Dropout(0.2),
-            layers.GRU(512, return_sequences=True),
-            layers.Dropout(0.2),
-            layers.GRU(256),
-            layers.Dense(256),
+            layers.GRU(
+                self.units[0],
+                input_shape=(None, 1),
+                return_sequences=len(self.units) > 1 or self.sequential,
+            )
+        ]
+        for i, width in enumerate(self.units[1:], start=2):
+            layer_list += [
+                layers.Dropout(0.2),
+                layers.GRU(
+                    width, return_sequences=i < len(self.units) or self.sequential
+                ),
+            ]
+
+        layer_list += [
+            layers.Dense(self.units[-1]),
             layers.Dropout(0.2),
             layers.Dense(self.output_length),
             layers.Activation("softmax"),
         ]
 
-        optimizer = optimizers.Adam(learning_rate=1e-5, clipnorm=0.5)
+        optimizer = optimizers.Adam(learning_rate=self.learning_rate, clipnorm=0.5)
+
+        loss = "categorical_crossentropy"
+        if self.sequential:
+            loss = "sparse_categorical_crossentropy"
 
         model = Sequential(layers=layer_list)
-        model.compile(loss="categorical_crossentropy", optimizer=optimizer)
+        model.compile(loss=loss, optimizer=optimizer)
 
         return model
 
     def prepare_dataset(
-        self, dataset: Iterable[Series]
+        self, dataset: Iterable[Series], limit: int = 0
     ) -> Tuple[NDArray[np.float64], NDArray[np.float64]]:
         """
         Convert series to size appriopriate for the learning mechanism.
+
+        Given positive limit, random subset of at most that many series is used.
         """
         logger.debug("Preparing dataset")
         input_list = []
@@ -97,36 +267,205 @@ class Neuron:
         inputs = np.reshape(input_list, (len(input_list), self.input_length, 1))
         outputs = np.array(output_list)
 
+        if 0 < limit < len(inputs):
+            selected = np.random.default_rng().choice(len(inputs), limit, replace=False)
+            inputs, outputs = inputs[selected], outputs[selected]
+
         logger.debug("Inputs size: {shape}", shape=inputs.shape)
         logger.debug("Outputs size: {shape}", shape=outputs.shape)
 
         return inputs, outputs
 
-    def generate(self, length: int) -> List[float]:
+    def generate(
+        self,
+        length: int,
+        sampler: Optional[Sampler] = None,
+        primer: Sequence[float] = (),
+    ) -> List[float]:
         """
         Generate sequence of requested length musing model.
         """
+        return list(self.stream(length, sampler, primer))
+
+    def stream(
+        self,
+        length: int,
+        sampler: Optional[Sampler] = None,
+        primer: Sequence[float] = (),
+    ) -> Iterator[float]:
+        """
+        Yield values of generated sequence as soon as each of them is predicted.
+
+        Values are picked by provided sampler, greedily by default. Initial window
+        is filled with the end of primer, missing values are random and are
+        discarded after they are shifted out of window.
+        """
         logger.info("Generating data")
         logger.debug("Attempting to generate series of {} values", length)
 
-        inset = [random.random() for _ in itertools.repeat(None, self.input_length)]
+        if sampler is None:
+            sampler = Sampler()
 
-        results: List[float] = []
-        for i in range(length + self.input_length):
-            state = np.reshape(inset, (1, self.input_length, 1))
+        inset = self.initial_window(sampler.rng, primer)
+        warmup = self.input_length - len(primer[-self.input_length :])
+        history: List[int] = []
+        predict = self.predictor()
+        rows = np.zeros(1, dtype=np.int64)
 
-            prediction = self.model.predict(state)
+        for i in range(length + warmup):
+            prediction = predict(np.array([inset]), rows)
 
-            idx: int = int(np.argmax(prediction))
+            recent = np.array([history[-self.input_length :]], dtype=np.int64)
+            idx: int = int(sampler.sample(prediction, recent)[0])
+            history.append(idx)
 
             inset = inset[1:]
-            normalized_output = idx / self.output_length
+            normalized_output = float(self.normalize(idx))
             inset.append(normalized_output)
 
-            if i >= self.input_length:
-                results.append(normalized_output)
+            if i >= warmup:
+                yield normalized_output
+
+    async def astream(
+        self,
+        length: int,
+        sampler: Optional[Sampler] = None,
+        primer: Sequence[float] = (),
+    ) -> AsyncIterator[float]:
+        """
+        Asynchronous variant of stream, running predictions outside of event loop.
+        """
+        values = self.stream(length, sampler, primer)
+        while (value := await asyncio.to_thread(next, values, None)) is not None:
+            yield value
+
+    def beam_search(
+        self,
+        length: int,
+        beam_width: int,
+        rng: Optional[np.random.Generator] = None,
+        primer: Sequence[float] = (),
+    ) -> List[float]:
+        """
+        Generate most likely sequence found keeping beam_width best candidates.
+
+        Candidates are scored by cumulative log probability, all of them being
+        evaluated in single batched forward pass per step. Warm up over random
+        part of initial window is not scored.
+        """
+        logger.info("Generating data using beam search")
+        logger.debug(
+            "Attempting to generate series of {length} values with {width} beams",
+            length=length,
+            width=beam_width,
+        )
+
+        if beam_width <= 0:
+            raise ValueError("Beam width must be positive")
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        windows = np.array([self.initial_window(rng, primer)])
+        warmup = self.input_length - len(primer[-self.input_length :])
+        sequences = np.empty((1, 0), dtype=np.int64)
+        scores = np.zeros(1)
+        beams = np.zeros(1, dtype=np.int64)
+        predict = self.predictor()
+
+        for i in range(length + warmup):
+            if i == warmup:
+                scores = np.zeros(len(scores))
+
+            prediction = predict(windows, beams)
+            candidates = (scores[:, np.newaxis] + np.log(prediction + epsilon)).ravel()
+
+            width = min(beam_width, len(candidates))
+            best = np.argpartition(-candidates, width - 1)[:width]
+            best = best[np.argsort(-candidates[best])]
+            beams, indices = np.divmod(best, self.output_length)
+
+            scores = candidates[best]
+            normalized = self.normalize(indices)
+            windows = np.concatenate(
+                [windows[beams, 1:], normalized[:, np.newaxis]], axis=1
+            )
+            sequences = np.concatenate(
+                [sequences[beams], indices[:, np.newaxis]], axis=1
+            )
+
+        logger.debug("Best sequence log probability: {score}", score=scores[0])
+
+        best_sequence: List[float] = self.normalize(sequences[0, warmup:]).tolist()
 
-        return results
+        return best_sequence
+
+    def normalize(
+        self, indices: Union[int, NDArray[np.integer]]
+    ) -> NDArray[np.float64]:
+        """
+        Scale indices of outputs to range [0, 1], the same way as Numeris does.
+
+        >>> Neuron(4, 5).normalize(np.array([0, 2, 4]))
+        array([0. , 0.5, 1. ])
+        """
+        normalized: NDArray[np.float64] = np.divide(
+            indices, max(self.output_length - 1, 1), dtype=np.float64
+        )
+
+        return normalized
+
+    def initial_window(
+        self, rng: np.random.Generator, primer: Sequence[float] = ()
+    ) -> List[float]:
+        """
+        Create window of input length ending with primer and padded with noise.
+        """
+        primer = list(primer[-self.input_length :])
+        noise = list(rng.random(self.input_length - len(primer)))
+
+        return noise + primer
+
+    def predict(self, states: NDArray[np.float64]) -> NDArray[np.float32]:
+        """
+        Run single forward pass over batch of states.
+
+        Skips batching machinery of predict, which has significant per call overhead
+        that dominates when generating values one by one.
+        """
+        prediction: NDArray[np.float32] = self.model.predict_on_batch(states)
+
+        # Sequential models predict following value of every position
+        if prediction.ndim == 3:
+            prediction = prediction[:, -1]
+
+        return prediction
+
+    def predictor(self) -> Predictor:
+        """
+        Create function predicting values following windows of consecutive calls.
+
+        Each call receives windows shifted by one value since the previous call,
+        along with numbers of previous windows they continue. Attention models
+        process only the new value of each window, keeping keys and values of
+        previous ones in cache, so they attend to sliding windows of whole
+        sequence instead of predicting from each window alone.
+        """
+        if self.kind != "attention":
+            return lambda windows, rows: self.predict(windows[..., np.newaxis])
+
+        cache = attention.Cache(self.model, self.input_length)
+
+        def predict(
+            windows: NDArray[np.float64], rows: NDArray[np.int64]
+        ) -> NDArray[np.float32]:
+            if not cache.length:
+                return cache.advance(windows)
+
+            cache.select(rows)
+            return cache.advance(windows[:, -1:])
+
+        return predict
 
     def save(self, path: Path) -> None:
         """
@@ -151,16 +490,96 @@ class Neuron:
         logger.debug("Loaded model input size: {num}", num=input_shape)
         logger.debug("Loaded model output size: {num}", num=output_shape)
 
-        if input_shape[1] != input_length or output_shape[1] != output_length:
+        fixed_length = input_shape[1] is not None
+        if (fixed_length and input_shape[1] != input_length) or (
+            output_shape[-1] != output_length
+        ):
             raise ValueError(
-                f"Model has {input_shape[1]} inputs and {output_shape[1]} outputs. "
+                f"Model has {input_shape[1]} inputs and {output_shape[-1]} outputs. "
                 f"Expected {input_length} inputs and {output_length} outputs."
             )
 
-        instance = cls(input_length, output_length, model=model)
+        kind = "gru-sequence" if len(output_shape) == 3 else "gru"
+        if attention.is_attention(model):
+            kind = "attention"
+        instance = cls(input_length, output_length, model=model, kind=kind)
 
         return instance
 
+    def resized(self, input_length: int) -> Neuron:
+        """
+        Create instance sharing the same model using windows of different length.
+        """
+        fixed_length = self.model.input_shape[1]
+        if fixed_length is not None and fixed_length != input_length:
+            raise ValueError(f"Model accepts only windows of length {fixed_length}")
+
+        return Neuron(
+            input_length,
+            self.output_length,
+            model=self.model,
+            units=self.units,
+            learning_rate=self.learning_rate,
+            kind=self.kind,
+        )
+
+    @classmethod
+    def ensemble(cls, neurons: Sequence[Neuron]) -> Neuron:
+        """
+        Combine models into single one averaging their predictions.
+
+        Models must share outputs, each of them receives the end of the longest
+        input window, so whole ensemble is evaluated in single forward pass.
+        """
+        if len({neuron.output_length for neuron in neurons}) != 1:
+            raise ValueError("Ensembled models must have the same output length")
+
+        input_length = max(neuron.input_length for neuron in neurons)
+        output_length = neurons[0].output_length
+
+        logger.info("Ensembling {num} models", num=len(neurons))
+
+        inputs = keras.Input(shape=(input_length, 1))
+        outputs = []
+        for i, neuron in enumerate(neurons):
+            cropping = layers.Cropping1D((input_length - neuron.input_length, 0))
+            # Wrapped to make names unique, as models usually share default one
+            member = keras.Model(
+                inputs=neuron.model.inputs,
+                outputs=neuron.model.outputs,
+                name=f"member_{i}",
+            )
+            predicted = member(cropping(inputs))
+            if neuron.sequential:
+                predicted = attention.LastStep()(predicted)
+            outputs.append(predicted)
+
+        output = layers.Average()(outputs) if len(outputs) > 1 else outputs[0]
+
+        model = keras.Model(inputs=inputs, outputs=output)
+
+        return cls(input_length, output_length, model=model)
+
+    def architecture(self) -> Architecture:
+        """
+        Describe layers of model, as stored in model manifest.
+
+        >>> Neuron(10, 5, units=(8, 4)).architecture()["units"]
+        [8, 4]
+        """
+        units = [
+            int(layer.units)
+            for layer in self.model.layers
+            if isinstance(layer, (layers.GRU, attention.DecoderBlock))
+        ]
+
+        return {
+            "kind": self.kind,
+            "units": units,
+            "inputs": self.input_length,
+            "outputs": self.output_length,
+        }
+
     @property
     def model(self) -> Model:
         """Lazily created model instance."""
@@ -168,3 +587,21 @@ class Neuron:
             self._model = self.assemble()
 
         return self._model
+
+
+class Recorder(callbacks.Callback):  # type: ignore
+    """
+    Collect monitored loss of each epoch reporting it.
+    """
+
+    def __init__(self, monitor: str) -> None:
+        super().__init__()
+        self.monitor: Final = monitor
+        self.losses: Dict[int, float] = {}
+
+    def on_epoch_end(self, epoch: int, logs: Optional[Dict[str, float]] = None) -> None:
+        """
+        Record loss of finished epoch, if present.
+        """
+        if logs is not None and self.monitor in logs:
+            self.losses[epoch] = float(logs[self.monitor])
@@ -6,11 +6,21 @@ from __future__ import annotations
 import pickle
 
 from pathlib import Path
-from typing import Final, Iterable, List, NamedTuple, NewType, Optional, Tuple, Union
+from typing import (
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    NewType,
+    Optional,
+    Tuple,
+    Union,
+)
 
 from loguru import logger
 
-from sarada import music21
+from sarada import metrics, music21
 from sarada.numeris import Numeris
 
 Key = NewType("Key", int)
@@ -19,6 +29,7 @@ QuarterLength = NewType("QuarterLength", float)
 Score = Iterable[music21.GeneralNote]
 
 filename: Final = "notebook.dat"
+format_header: Final = {"format": "sarada-notebook", "version": 3}
 
 
 class Note(NamedTuple):
@@ -39,69 +50,100 @@ Musical = Union[Note, Chord, Rest]
 Musicals = List[Musical]
 
 
+class NoteSet(NamedTuple):
+    """Notes of single part tagged with name of its instrument."""
+
+    tag: str
+    notes: Musicals
+
+
 class Notebook:
     """
     Storage for keeping sets of notes efficiently.
 
     Allows for storage of notes, pitch values to be exact, and perform further
-    operations on them, such as for normalization.
+    operations on them, such as for normalization. Each set of notes is tagged
+    with instrument it was played by, if known.
     """
 
-    def __init__(self, *, notes: Optional[List[Musicals]] = None) -> None:
+    def __init__(
+        self,
+        *,
+        notes: Optional[List[Musicals]] = None,
+        tags: Optional[List[str]] = None,
+    ) -> None:
         if notes is None:
             notes = []
+        if tags is None:
+            tags = [""] * len(notes)
 
         self.notes: List[Musicals] = notes
+        self.tags: List[str] = tags
 
-    def add(self, notes: Score) -> None:
+    def add(self, notes: Score, tag: str = "") -> None:
         """
         Add set of notes to processed data.
         """
-        noteset: Musicals = []
-        musical: Musical
-        for note in notes:
-            if isinstance(note, music21.Note):
-                pitch = Pitch(str(note.pitch))
-                duration = QuarterLength(note.duration.quarterLength)
-                musical = Note(duration, pitch)
-            elif isinstance(note, music21.Chord):
-                pitches = tuple(Pitch(str(n.pitch)) for n in note.notes)
-                duration = QuarterLength(note.duration.quarterLength)
-                musical = Chord(duration, pitches)
-            elif isinstance(note, music21.Rest):
-                duration = QuarterLength(note.duration.quarterLength)
-                musical = Rest(duration)
-            else:
-                logger.debug("Ignoring note {note}", note=str(note))
-                continue
-
-            noteset.append(musical)
-
-        logger.debug("Adding noteset of {} notes", len(noteset))
+        noteset = to_musicals(notes)
         self.notes.append(noteset)
+        self.tags.append(tag)
 
-    def numerize(self) -> Numeris[Musical]:
+    def extend(self, notesets: Iterable[NoteSet]) -> None:
+        """
+        Add note sets already converted to musicals.
+        """
+        for tag, notes in notesets:
+            self.notes.append(notes)
+            self.tags.append(tag)
+
+    def numerize(self, vocabulary: Iterable[Musical] = ()) -> Numeris[Musical]:
         """
         Create new Numeris from current state of Notebook.
         """
-        return Numeris[Musical](self.notes)
+        with metrics.stage("numerize"):
+            return Numeris[Musical](self.notes, vocabulary)
 
     @classmethod
     def read(cls, path: Path) -> Notebook:
         """
         Read notebook data from model folder.
         """
+        notebook = cls()
+        notebook.extend(cls.iterate(path))
+
+        return notebook
+
+    @staticmethod
+    def iterate(path: Path) -> Iterator[NoteSet]:
+        """
+        Read note sets stored in model folder one by one.
+
+        Notebooks stored by previous versions, as single list or without tags,
+        are read as well.
+        """
         with open(path / filename, "rb") as datafile:
-            notes: List[Musicals] = pickle.load(datafile)
+            header = pickle.load(datafile)
+            if isinstance(header, list):
+                yield from (NoteSet("", notes) for notes in header)
+                return
 
-        return cls(notes=notes)
+            if header not in (format_header, {**format_header, "version": 2}):
+                raise ValueError(f"Unsupported notebook format: {header}")
+
+            while True:
+                try:
+                    entry: Union[NoteSet, Musicals] = pickle.load(datafile)
+                except EOFError:
+                    return
+                yield entry if isinstance(entry, NoteSet) else NoteSet("", entry)
 
     def store(self, path: Path) -> None:
         """
         Save notebook content in model folder.
         """
-        with open(path / filename, "wb") as datafile:
-            pickle.dump(self.notes, datafile)
+        with NotebookWriter(path) as writer:
+            for noteset in zip(self.tags, self.notes):
+                writer.append(NoteSet(*noteset))
 
     def __str__(self) -> str:
         return f"<{ self.__class__.__name__ } containing { len(self) } note sets>"
@@ -113,4 +155,68 @@ class Notebook:
         if not isinstance(obj, Notebook):
             return False
 
-        return self.notes == obj.notes
+        return self.notes == obj.notes and self.tags == obj.tags
+
+
+class NotebookWriter:
+    """
+    Append note sets to notebook in model folder as soon as they are available.
+
+    Note sets are pickled separately after format header, so that neither
+    writing nor reading requires whole notebook to be kept in memory.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.datafile: Final = open(  # pylint: disable=consider-using-with
+            path / filename, "wb"
+        )
+        pickle.dump(format_header, self.datafile)
+        self.count = 0
+
+    def append(self, noteset: NoteSet) -> None:
+        """
+        Write single note set.
+        """
+        with metrics.span("store"):
+            pickle.dump(noteset, self.datafile)
+        self.count += 1
+
+    def close(self) -> None:
+        self.datafile.close()
+
+    def __enter__(self) -> NotebookWriter:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+
+def to_musicals(notes: Score) -> Musicals:
+    """
+    Convert music21 notes to musicals, ignoring unsupported ones.
+    """
+    noteset: Musicals = []
+    musical: Musical
+    ignored = 0
+    for note in notes:
+        if isinstance(note, music21.Note):
+            pitch = Pitch(str(note.pitch))
+            duration = QuarterLength(note.duration.quarterLength)
+            musical = Note(duration, pitch)
+        elif isinstance(note, music21.Chord):
+            pitches = tuple(Pitch(str(n.pitch)) for n in note.notes)
+            duration = QuarterLength(note.duration.quarterLength)
+            musical = Chord(duration, pitches)
+        elif isinstance(note, music21.Rest):
+            duration = QuarterLength(note.duration.quarterLength)
+            musical = Rest(duration)
+        else:
+            ignored += 1
+            continue
+
+        noteset.append(musical)
+
+    if ignored:
+        logger.trace("Ignored {num} elements other than notes", num=ignored)
+
+    return noteset
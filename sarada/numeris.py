@@ -12,100 +12,80 @@ from typing import (
     List,
     Mapping,
     NamedTuple,
+    Optional,
+    Sequence,
+    Set,
     Tuple,
     TypeVar,
+    Union,
 )
 
+import numpy as np
+
 from loguru import logger
+from numpy.typing import NDArray
+
+from sarada import metrics
+from sarada.logging import Summary
 
 T = TypeVar("T")  # pylint: disable=invalid-name
 
 Dataset = Tuple[Tuple[T, ...], ...]
 
 
-class Numeris(Generic[T]):
+class Vocabulary(Generic[T]):
     """
-    Keep order of numeric data and allows to perform operation on those.
+    Distinct values in order of numbers representing them.
 
-    Most notably allows to change values back and forth into ordered numerics.
+    Mapping of values to their numbers is built when first needed, so that
+    vocabulary restored from its values alone is usable without it.
     """
 
-    def __init__(self, data: List[List[T]]):
-        self.data: Final[Dataset[T]] = tuple(tuple(d) for d in data)
-        mapping: Final[Dict[T, int]] = {}
-        reverse_mapping: Final[Dict[int, T]] = {}
-
-        for dataset in self.data:
-            for key in dataset:
-                mapping.setdefault(key, len(mapping))
-                reverse_mapping.setdefault(mapping[key], key)
+    def __init__(self, values: Iterable[T]):
+        # Filled one by one, as values may be tuples numpy would unpack
+        values = list(values)
+        tokens: NDArray[np.object_] = np.empty(len(values), dtype=object)
+        for numeric, value in enumerate(values):
+            tokens[numeric] = value
+        self.tokens: Final = tokens
+        self._mapping: Optional[Mapping[T, int]] = None
 
-        self.mapping: Final[Mapping[T, int]] = mapping
-        self.reverse_mapping: Final[Mapping[int, T]] = reverse_mapping
-
-        logger.debug("Found {size} distinct values", size=self.distinct_size)
-
-    def make_series(self, window_size: int = 100) -> Iterator[Series]:
+    @property
+    def mapping(self) -> Mapping[T, int]:
         """
-        Generate series of overlapping datasets from data using crawling windows.
+        Map values to their numbers.
 
-        Resulting data will contain input and output where output will be input shifted
-        by one. For instance "abcdefg" with window size 5 will generate 2 datasets, one
-        with input 'abcde' and output 'bcdef' and second with input 'bcdef' and output
-        'cdefg'. Then it replaces these values with ordered numeric values using
-        numerization functions and normalizes them.
-
-        >>> numeris = Numeris(["abcde"])
-        >>> series = numeris.make_series(window_size=3)
-
-        >>> next(series)
-        Series(input=[0.0, 0.25, 0.5], output=[0, 0, 0, 1, 0])
-
-        >>> next(series)
-        Series(input=[0.25, 0.5, 0.75], output=[0, 0, 0, 0, 1])
-
-        >>> next(series)
-        Traceback (most recent call last):
-            ...
-        StopIteration
+        >>> Vocabulary("abc").mapping
+        {'a': 0, 'b': 1, 'c': 2}
         """
-        processed = 0
-        ommited = 0
-        for dataset in self.data:
-            numerized = self.numerize(dataset)
-            idx = 0
-            for idx in range(0, len(numerized) - window_size):
-                ins = numerized[idx : idx + window_size]
-                out = self.categorize(dataset[idx + window_size])
-                yield Series(input=ins, output=out)
-
-                processed += 1
-
-            if idx:
-                logger.debug(
-                    "Current dataset yielded {num} series, moving to next", num=idx
-                )
-            else:
-                ommited += 1
-                logger.debug(
-                    "Dataset of size {size} too short, ommiting", size=len(numerized)
-                )
+        if self._mapping is None:
+            values: List[T] = self.tokens.tolist()
+            self._mapping = {value: numeric for numeric, value in enumerate(values)}
 
-        logger.info("Yielded {num} series of data total", num=processed)
-        if ommited:
-            logger.warning("Dataset were ommited: {num} in total", num=ommited)
+        return self._mapping
 
-    def numerize(self, dataset: Iterable[T]) -> List[float]:
+    def numerize(self, dataset: Iterable[T], skip_unknown: bool = False) -> List[float]:
         """
         Replace values in iterable with corresponding normalized number values.
 
+        Unless skip_unknown is set, values not present in data raise KeyError.
+
         >>> numeris = Numeris(["abcde"])
         >>> numeris.numerize(["a", "b", "c", "d", "e"])
         [0.0, 0.25, 0.5, 0.75, 1.0]
+
+        >>> numeris.numerize(["a", "x", "e"], skip_unknown=True)
+        [0.0, 1.0]
         """
+        if skip_unknown:
+            known = [x for x in dataset if x in self.mapping]
+            return [self.normalize_value(x) for x in known]
+
         return [self.normalize_value(x) for x in dataset]
 
-    def denumerize(self, numerized: Iterable[float]) -> List[T]:
+    def denumerize(
+        self, numerized: Union[Sequence[float], NDArray[np.float64]]
+    ) -> List[T]:
         """
         Replace values in iterable containing normalized dataset with original values.
 
@@ -113,12 +93,27 @@ class Numeris(Generic[T]):
         >>> numeris.denumerize([0.0, 0.25, 0.5])
         ['a', 'b', 'c']
         """
-        values = [self.denormalize_value(x) for x in numerized]
+        values: List[T] = self.tokens[self.keys(numerized)].tolist()
 
         logger.debug("Denumerized list of {length} values", length=len(values))
 
         return values
 
+    def keys(
+        self, numerized: Union[Sequence[float], NDArray[np.float64]]
+    ) -> NDArray[np.int64]:
+        """
+        Return numbers of values given normalized, rounding them to the nearest.
+
+        >>> Numeris(["abcde"]).keys(np.array([[0.0, 0.3], [0.7, 1.0]]))
+        array([[0, 1],
+               [3, 4]])
+        """
+        scaled = np.asarray(numerized, dtype=np.float64) * (self.distinct_size - 1)
+        keys: NDArray[np.int64] = np.floor(scaled + 0.5).astype(np.int64)
+
+        return keys
+
     def normalize_value(self, value: T) -> float:
         """
         Return normalized values for a given value.
@@ -146,8 +141,9 @@ class Numeris(Generic[T]):
         """
         # Denormalize and round value to nearest int
         key = int(val * (self.distinct_size - 1) + 0.5)
+        value: T = self.tokens[key]
 
-        return self.reverse_mapping[key]
+        return value
 
     def categorize(self, val: T) -> List[int]:
         """
@@ -162,25 +158,134 @@ class Numeris(Generic[T]):
 
         return array
 
-    def decategorize(self, val: List[int]) -> T:
+    def decategorize(self, val: Union[Sequence[float], NDArray[np.floating]]) -> T:
         """
-        Return normalized value to original.
+        Return original value of the most probable category.
 
         >>> numeris = Numeris(["abcde"])
         >>> numeris.decategorize([0, 1, 0, 0, 0])
         'b'
         """
-        searched = max(val)
-        idx = val.index(searched)
+        value: T = self.tokens[int(np.argmax(val))]
+
+        return value
 
-        return self.reverse_mapping[idx]
+    def decategorize_batch(self, probabilities: NDArray[np.floating]) -> List[T]:
+        """
+        Return original values of the most probable categories of each row.
+
+        >>> numeris = Numeris(["abc"])
+        >>> numeris.decategorize_batch(np.array([[0.1, 0.7, 0.2], [0.5, 0.2, 0.3]]))
+        ['b', 'a']
+        """
+        values: List[T] = self.tokens[np.argmax(probabilities, axis=-1)].tolist()
+
+        return values
 
     @property
     def distinct_size(self) -> int:
         """
         Count number of distinct values in datasets.
         """
-        return len(self.mapping)
+        return len(self.tokens)
+
+
+class Numeris(Vocabulary[T]):
+    """
+    Keep order of numeric data and allows to perform operation on those.
+
+    Most notably allows to change values back and forth into ordered numerics.
+    Additional values, not present in data, may be provided in vocabulary.
+    """
+
+    def __init__(self, data: List[List[T]], vocabulary: Iterable[T] = ()):
+        self.data: Final[Dataset[T]] = tuple(tuple(d) for d in data)
+        mapping: Final[Dict[T, int]] = {}
+
+        for dataset in (*self.data, vocabulary):
+            for key in dataset:
+                mapping.setdefault(key, len(mapping))
+
+        super().__init__(mapping)
+        self._mapping = mapping
+
+        logger.debug("Found {size} distinct values", size=self.distinct_size)
+
+    def make_series(
+        self, window_size: int = 100, data: Optional[Iterable[Sequence[T]]] = None
+    ) -> Iterator[Series]:
+        """
+        Generate series of overlapping datasets from data using crawling windows.
+
+        Series are generated from all of the data unless subset of it is provided.
+
+        Resulting data will contain input and output where output will be input shifted
+        by one. For instance "abcdefg" with window size 5 will generate 2 datasets, one
+        with input 'abcde' and output 'bcdef' and second with input 'bcdef' and output
+        'cdefg'. Then it replaces these values with ordered numeric values using
+        numerization functions and normalizes them.
+
+        >>> numeris = Numeris(["abcde"])
+        >>> series = numeris.make_series(window_size=3)
+
+        >>> next(series)
+        Series(input=[0.0, 0.25, 0.5], output=[0, 0, 0, 1, 0])
+
+        >>> next(series)
+        Series(input=[0.25, 0.5, 0.75], output=[0, 0, 0, 0, 1])
+
+        >>> next(series)
+        Traceback (most recent call last):
+            ...
+        StopIteration
+        """
+        if data is None:
+            data = self.data
+
+        processed = 0
+        ommited = 0
+        message = "Yielded {series} series of {datasets} datasets so far"
+        with Summary(message) as summary:
+            for dataset in data:
+                numerized = self.numerize(dataset)
+                idx = 0
+                for idx in range(0, len(numerized) - window_size):
+                    ins = numerized[idx : idx + window_size]
+                    out = self.categorize(dataset[idx + window_size])
+                    yield Series(input=ins, output=out)
+
+                    processed += 1
+
+                if not idx:
+                    ommited += 1
+                summary.add(series=max(len(numerized) - window_size, 0), datasets=1)
+
+        logger.info("Yielded {num} series of data total", num=processed)
+        metrics.count("windows", processed)
+        if ommited:
+            logger.warning("Dataset were ommited: {num} in total", num=ommited)
+
+
+def holdout(size: int, fraction: float, seed: Optional[int] = None) -> Set[int]:
+    """
+    Randomly select given fraction of indices, leaving at least one unselected.
+
+    >>> holdout(10, 0.2, seed=0) == holdout(10, 0.2, seed=0)
+    True
+
+    >>> len(holdout(10, 0.2))
+    2
+
+    >>> holdout(1, 0.5)
+    set()
+    """
+    count = min(round(size * fraction), size - 1)
+    if count <= 0:
+        return set()
+
+    rng = np.random.default_rng(seed)
+
+    return {int(i) for i in rng.choice(size, count, replace=False)}
 
 
 class Series(NamedTuple):
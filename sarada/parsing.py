@@ -3,15 +3,47 @@ Parse raw file content into workable streams.
 """
 from __future__ import annotations
 
-from functools import singledispatch
+import itertools
+import queue
+import threading
+import time
+
+from functools import partial, singledispatch
 from pathlib import Path
-from typing import Final, Iterable, Iterator, List, Optional
+from typing import (
+    Dict,
+    Final,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    cast,
+)
 
 from loguru import logger
 from music21 import converter, exceptions21, instrument
 
-from sarada import music21
-from sarada.notebook import Chord, Musical, Note, Notebook, Rest
+from sarada import metrics, music21
+from sarada.fingerprint import Deduplicator, deduplicate
+from sarada.isolation import Isolation, isolated_map
+from sarada.logging import Summary
+from sarada.notebook import (
+    Chord,
+    Musical,
+    Musicals,
+    Note,
+    Notebook,
+    NotebookWriter,
+    NoteSet,
+    Rest,
+    to_musicals,
+)
+
+V = TypeVar("V")  # pylint: disable=invalid-name
 
 supported_extensions: Final = [
     ".abc",
@@ -23,6 +55,35 @@ supported_extensions: Final = [
     ".midi",
 ]
 
+output_suffixes: Final = {
+    "midi": (".midi", ".mid"),
+    "musicxml": (".musicxml", ".xml"),
+    "tokens": (".txt", ".tokens"),
+}
+
+
+class Extraction(NamedTuple):
+    """
+    Parts of scores turned into note sets.
+
+    By default only first part is used. Given instruments, only their parts are
+    used, compared case insensitively.
+    """
+
+    all_parts: bool = False
+    instruments: Tuple[str, ...] = ()
+
+    def wants(self, tag: str) -> bool:
+        """
+        Check if part played by given instrument should be used.
+
+        >>> Extraction(instruments=("Piano",)).wants("piano")
+        True
+        """
+        return not self.instruments or tag.lower() in {
+            name.lower() for name in self.instruments
+        }
+
 
 def extract_notes(
     scores: Iterable[music21.Stream],
@@ -43,6 +104,52 @@ def extract_notes(
             yield (note for note in notes)
 
 
+def extract_parts(
+    scores: Iterable[music21.Stream], extraction: Extraction = Extraction()
+) -> Iterator[NoteSet]:
+    """
+    Extract note sets from given file contents, tagged by instrument.
+
+    Unless all parts are extracted, only the first one is used as in
+    extract_notes. Parts without any notes are skipped.
+    """
+    for score in scores:
+        with metrics.span("extract"):
+            notesets = list(extract_score(score, extraction))
+        metrics.count("notesets", len(notesets))
+        metrics.count("notes", sum(len(noteset.notes) for noteset in notesets))
+        yield from notesets
+
+
+def extract_score(score: music21.Stream, extraction: Extraction) -> Iterator[NoteSet]:
+    """
+    Extract note sets from single score.
+    """
+    every = extraction.all_parts or bool(extraction.instruments)
+    partition = instrument.partitionByInstrument(score)
+    parts = list(partition.parts) if partition else [score]
+
+    for part in parts if every else parts[:1]:
+        tag = instrument_name(part)
+        if not extraction.wants(tag):
+            logger.debug("Skipping part of {tag}", tag=tag)
+            continue
+
+        musicals = to_musicals(part.recurse() if partition else part.flat.notes)
+        if musicals:
+            yield NoteSet(tag, musicals)
+
+
+def instrument_name(stream: music21.Stream) -> str:
+    """
+    Return name of instrument playing given stream, empty if it is unknown.
+    """
+    found = stream.getInstrument(returnDefault=False)
+    name: Optional[str] = found.bestName() if found is not None else None
+
+    return name or ""
+
+
 def create_stream(pitches: Iterable[Musical]) -> music21.Stream:
     """
     Create stream that may be converted to actual music from pitch list.
@@ -83,56 +190,355 @@ def make_rest(rest: Rest) -> music21.Chord:
     return m21rest
 
 
-def read_scores(path: Path, recursive: bool = False) -> Notebook:
+def read_scores(
+    path: Path,
+    recursive: bool = False,
+    deduplicator: Optional[Deduplicator] = None,
+    workers: int = 1,
+    extraction: Extraction = Extraction(),
+) -> Notebook:
     """
     Open file on given path and aggregate them in Notebook instance.
+
+    Given deduplicator, note sets duplicating previous ones are dropped, their
+    fingerprints being computed by given number of worker processes.
     """
     logger.info("Processing files in {path}", path=str(path))
 
-    scores = read_files(path, recursive)
-    notes_source = extract_notes(scores)
+    notesets = read_notesets(path, recursive, extraction)
+    if deduplicator is not None:
+        notesets = deduplicate(notesets, deduplicator, workers)
 
     notes = Notebook()
-    for note in notes_source:
-        notes.add(note)
+    notes.extend(notesets)
 
     logger.info("Finished loading files")
 
     return notes
 
 
+def ingest(
+    path: Path,
+    model_path: Path,
+    recursive: bool = False,
+    deduplicator: Optional[Deduplicator] = None,
+    workers: int = 1,
+    buffer: int = 16,
+    extraction: Extraction = Extraction(),
+    isolation: Optional[Isolation] = None,
+) -> Ingested:
+    """
+    Append note sets read from files on given path to notebook in model folder.
+
+    Note sets are written as soon as they are extracted, while parsing of
+    following files proceeds in background thread with at most buffer note sets
+    in flight, so memory does not grow with size of corpus. Only distinct values
+    are kept, in order of their first appearance.
+    """
+    logger.info("Processing files in {path}", path=str(path))
+
+    notesets = prefetch(read_notesets(path, recursive, extraction, isolation), buffer)
+    if deduplicator is not None:
+        notesets = deduplicate(notesets, deduplicator, workers)
+
+    distinct: Dict[Musical, None] = {}
+    with metrics.stage("ingest"), NotebookWriter(model_path) as writer:
+        for noteset in notesets:
+            writer.append(noteset)
+            distinct.update(dict.fromkeys(noteset.notes))
+
+    logger.info("Stored {num} note sets", num=writer.count)
+
+    return Ingested(writer.count, list(distinct))
+
+
+class Ingested(NamedTuple):
+    """Summary of note sets stored by ingestion."""
+
+    notesets: int
+    distinct: Musicals
+
+
+def read_notesets(
+    path: Path,
+    recursive: bool = False,
+    extraction: Extraction = Extraction(),
+    isolation: Optional[Isolation] = None,
+) -> Iterator[NoteSet]:
+    """
+    Iterate over note sets extracted from files on given path.
+
+    Given isolation settings, files are parsed in worker processes, so that
+    files which hang or exhaust memory are quarantined instead of stopping
+    ingestion. Extraction is then timed as part of parsing.
+    """
+    if isolation is None:
+        notesets = extract_parts(
+            report_progress(read_files(path, recursive), "files"), extraction
+        )
+    else:
+        parse = partial(parse_file, extraction=extraction)
+        files = report_progress(find_files(path, recursive), "files")
+        results = isolated_map(parse, files, isolation, stage="parse")
+        notesets = itertools.chain.from_iterable(results)
+
+    with Summary("Read {notesets} note sets of {notes} notes so far") as summary:
+        for noteset in notesets:
+            summary.add(notesets=1, notes=len(noteset.notes))
+            yield noteset
+
+
+def report_progress(
+    items: Iterable[V], name: str, interval: float = 10.0
+) -> Iterator[V]:
+    """
+    Pass items through, logging their number and rate at given interval.
+    """
+    start = last = time.monotonic()
+    count = 0
+    for item in items:
+        count += 1
+        now = time.monotonic()
+        if now - last >= interval:
+            last = now
+            logger.info(
+                "Processed {count} {name} ({rate:.1f} {name}/s)",
+                count=count,
+                name=name,
+                rate=count / (now - start),
+            )
+        yield item
+
+    elapsed = max(time.monotonic() - start, 1e-9)
+    logger.info(
+        "Processed {count} {name} in {elapsed:.1f}s ({rate:.1f} {name}/s)",
+        count=count,
+        name=name,
+        elapsed=elapsed,
+        rate=count / elapsed,
+    )
+
+
+def prefetch(items: Iterable[V], size: int) -> Iterator[V]:
+    """
+    Produce items in background thread, keeping at most size of them in queue.
+
+    Exceptions raised by producer are raised again in consumer.
+
+    >>> list(prefetch(range(5), 2))
+    [0, 1, 2, 3, 4]
+    """
+    if size <= 0:
+        yield from items
+        return
+
+    channel: queue.Queue[Tuple[bool, object]] = queue.Queue(maxsize=size)
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(channel, (False, item), stop):
+                    return
+        except Exception as ex:  # pylint: disable=broad-except
+            put(channel, (True, ex), stop)
+        else:
+            put(channel, (True, None), stop)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            finished, value = channel.get()
+            if finished:
+                if isinstance(value, Exception):
+                    raise value
+                return
+            yield cast(V, value)
+    finally:
+        stop.set()
+
+
+def put(
+    channel: queue.Queue[Tuple[bool, object]],
+    item: Tuple[bool, object],
+    stop: threading.Event,
+) -> bool:
+    """
+    Put item in queue unless consumer stopped, return whether it was put.
+    """
+    while not stop.is_set():
+        try:
+            channel.put(item, timeout=0.1)
+        except queue.Full:
+            continue
+        return True
+
+    return False
+
+
+def read_score(path: Path) -> Musicals:
+    """
+    Read notes contained in single file.
+
+    Errors are not suppressed, as opposed to reading whole directories.
+    """
+    logger.info("Reading file {path}", path=str(path))
+
+    score: music21.Stream = converter.parseFile(path)
+
+    notes = Notebook()
+    for note in extract_notes([score]):
+        notes.add(note)
+
+    return notes.notes[0] if notes else []
+
+
 def read_files(path: Path, recursive: bool) -> Iterator[music21.Stream]:
     """
     Iterate over content of musical files in provided directory.
     """
+    for filepath in find_files(path, recursive):
+        logger.debug("Opening file {path}", path=filepath)
+        try:
+            with metrics.span("parse"):
+                score: music21.Stream = converter.parseFile(filepath)
+        except IOError as e:
+            logger.warning("Error opening file {path}: {e}", path=str(path), e=str(e))
+            continue
+        except exceptions21.Music21Exception:
+            logger.warning("Could not parse file {path}", path=str(path))
+            continue
+        metrics.count("files")
+        yield score
+
+
+def find_files(path: Path, recursive: bool) -> Iterator[Path]:
+    """
+    Iterate over paths of musical files in provided directory.
+    """
     for filepath in path.iterdir():
         if filepath.is_file() and filepath.suffix in supported_extensions:
-            logger.debug("Opening file {path}", path=filepath)
-            try:
-                score: music21.Stream = converter.parseFile(filepath)
-            except IOError as e:
-                logger.warning(
-                    "Error opening file {path}: {e}", path=str(path), e=str(e)
-                )
-                continue
-            except exceptions21.Music21Exception:
-                logger.warning("Could not parse file {path}", path=str(path))
-                continue
-            yield score
+            yield filepath
         elif recursive and filepath.is_dir():
             logger.debug("Searching {path}", path=filepath)
-            yield from read_files(filepath, recursive=True)
+            yield from find_files(filepath, recursive=True)
         else:
             logger.debug(
                 "File {name} omitted due to unsupported extension", name=filepath
             )
 
 
-def store_score(pitches: Iterable[Musical], path: Path) -> None:
+def read_files_notesets(
+    path: Path,
+    recursive: bool = False,
+    extraction: Extraction = Extraction(),
+    isolation: Optional[Isolation] = None,
+) -> Iterator[Tuple[Path, List[NoteSet]]]:
+    """
+    Iterate over note sets of each file in provided directory, with its path.
+
+    Files which could not be parsed for any reason are skipped, given isolation
+    settings they are parsed in worker processes and quarantined as in case of
+    ingestion.
+    """
+    files = report_progress(find_files(path, recursive), "files")
+    if isolation is not None:
+        parse = partial(parse_named_file, extraction=extraction)
+        yield from isolated_map(parse, files, isolation, stage="parse")
+        return
+
+    for filepath in files:
+        try:
+            with metrics.span("parse"):
+                parsed = parse_named_file(filepath, extraction)
+        except Exception as e:  # pylint: disable=broad-except
+            logger.warning("Could not read file {path}: {e}", path=str(filepath), e=e)
+            continue
+        metrics.count("files")
+        yield parsed
+
+
+def parse_named_file(
+    path: Path, extraction: Extraction = Extraction()
+) -> Tuple[Path, List[NoteSet]]:
     """
-    Store sequence in midi file.
+    Extract note sets from single file, returning them along with its path.
     """
-    logger.info("Storing sequence at {path}", path=path)
-    stream = create_stream(pitches)
-    logger.debug("Saving file in {path}", path=path)
-    stream.write("midi", fp=path)
+    return path, parse_file(path, extraction)
+
+
+def parse_file(path: Path, extraction: Extraction = Extraction()) -> List[NoteSet]:
+    """
+    Extract note sets from single file, errors are not suppressed.
+    """
+    score: music21.Stream = converter.parseFile(path)
+    return list(extract_parts([score], extraction))
+
+
+def store_score(
+    pitches: Iterable[Musical], path: Path, formats: Sequence[str] = ("midi",)
+) -> List[Path]:
+    """
+    Store sequence in file of each of given formats, returning their paths.
+
+    Stream is built once and shared by all formats music21 writes, tokens are
+    written directly, one note per line.
+    """
+    musicals = list(pitches)
+    stream: Optional[music21.Stream] = None
+    paths = []
+
+    for format_ in formats:
+        target = output_path(path, format_)
+        logger.info("Storing sequence at {path}", path=target)
+        if format_ == "tokens":
+            lines = (f"{token(musical)}\n" for musical in musicals)
+            target.write_text("".join(lines), encoding="utf-8")
+        else:
+            if stream is None:
+                stream = create_stream(musicals)
+            stream.write(format_, fp=target)
+        paths.append(target)
+
+    return paths
+
+
+def output_path(path: Path, format_: str) -> Path:
+    """
+    Return path of file in given format, replacing suffix unless it fits.
+
+    >>> str(output_path(Path("out.mid"), "midi"))
+    'out.mid'
+    >>> str(output_path(Path("out.mid"), "musicxml"))
+    'out.musicxml'
+    """
+    suffixes = output_suffixes[format_]
+    return path if path.suffix in suffixes else path.with_suffix(suffixes[0])
+
+
+@singledispatch
+def token(musical: Musical) -> str:
+    """
+    Represent Musical as plain text token of pitches and duration.
+
+    >>> token(Chord(1.0, ("C4", "E4")))
+    'C4.E4:1.0'
+    """
+    raise RuntimeError(f"Dispatch failed for {musical}")
+
+
+@token.register
+def note_token(note: Note) -> str:
+    return f"{note.pitch}:{note.duration}"
+
+
+@token.register
+def chord_token(chord: Chord) -> str:
+    return f"{'.'.join(chord.pitch)}:{chord.duration}"
+
+
+@token.register
+def rest_token(rest: Rest) -> str:
+    return f"rest:{rest.duration}"
@@ -0,0 +1,144 @@
+"""
+Decoding strategies picking next values from predicted probabilities.
+"""
+from __future__ import annotations
+
+from typing import Final, Optional
+
+import numpy as np
+
+from numpy.typing import NDArray
+
+epsilon: Final = 1e-12
+
+
+class Sampler:
+    """
+    Select indices from batch of probability vectors.
+
+    All operations are performed on whole batch at once. With default settings
+    sampler is greedy and always picks most probable value.
+
+    >>> sampler = Sampler()
+    >>> sampler.sample(np.array([[0.1, 0.7, 0.2], [0.5, 0.2, 0.3]]))
+    array([1, 0])
+    """
+
+    def __init__(
+        self,
+        temperature: float = 0.0,
+        top_k: int = 0,
+        top_p: float = 1.0,
+        repetition_penalty: float = 1.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        if temperature < 0:
+            raise ValueError("Temperature must not be negative")
+        if top_k < 0:
+            raise ValueError("Top k must not be negative")
+        if not 0 < top_p <= 1:
+            raise ValueError("Top p must be in range (0, 1]")
+        if repetition_penalty <= 0:
+            raise ValueError("Repetition penalty must be positive")
+
+        self.temperature: Final = temperature
+        self.top_k: Final = top_k
+        self.top_p: Final = top_p
+        self.repetition_penalty: Final = repetition_penalty
+        self.rng: Final = np.random.default_rng(seed)
+
+    def sample(
+        self,
+        probabilities: NDArray[np.float32],
+        history: Optional[NDArray[np.int64]] = None,
+    ) -> NDArray[np.int64]:
+        """
+        Pick single index for each row of probabilities.
+
+        History contains indices recently picked for each row, these are penalized
+        when repetition penalty is set.
+        """
+        logits = np.log(np.maximum(probabilities, epsilon))
+        penalized = self.penalize(logits, history)
+
+        # Logarithm may round nearly equal probabilities to the same value.
+        scores = probabilities if penalized is logits else penalized
+
+        if self.temperature == 0:
+            greedy: NDArray[np.int64] = np.argmax(scores, axis=-1)
+            return greedy
+
+        logits = penalized / self.temperature
+        logits = self.filter_top_k(logits)
+        logits = self.filter_top_p(logits, scores)
+
+        weights = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        cumulative = np.cumsum(weights, axis=-1)
+        thresholds = self.rng.random((len(logits), 1)) * cumulative[:, -1:]
+        picked: NDArray[np.int64] = (cumulative <= thresholds).sum(axis=-1)
+
+        return np.minimum(picked, logits.shape[-1] - 1)
+
+    def penalize(
+        self, logits: NDArray[np.float64], history: Optional[NDArray[np.int64]]
+    ) -> NDArray[np.float64]:
+        """
+        Make values present in history less probable.
+
+        >>> sampler = Sampler(repetition_penalty=2.0)
+        >>> sampler.penalize(np.array([[-1.0, -2.0]]), np.array([[0]]))
+        array([[-2., -2.]])
+        """
+        if history is None or history.size == 0 or self.repetition_penalty == 1:
+            return logits
+
+        repeated = np.zeros(logits.shape, dtype=bool)
+        np.put_along_axis(repeated, history, True, axis=-1)
+        penalized = np.where(
+            logits > 0,
+            logits / self.repetition_penalty,
+            logits * self.repetition_penalty,
+        )
+
+        return np.where(repeated, penalized, logits)
+
+    def filter_top_k(self, logits: NDArray[np.float64]) -> NDArray[np.float64]:
+        """
+        Leave only k most probable values in each row.
+
+        >>> Sampler(top_k=2).filter_top_k(np.array([[1.0, 3.0, 2.0]]))
+        array([[-inf,   3.,   2.]])
+        """
+        if not self.top_k or self.top_k >= logits.shape[-1]:
+            return logits
+
+        kth = np.partition(logits, -self.top_k, axis=-1)[:, -self.top_k, None]
+
+        return np.where(logits < kth, -np.inf, logits)
+
+    def filter_top_p(
+        self,
+        logits: NDArray[np.float64],
+        scores: Optional[NDArray[np.floating]] = None,
+    ) -> NDArray[np.float64]:
+        """
+        Leave smallest set of most probable values exceeding probability p.
+
+        Values are ranked by scores ordered as logits, if given.
+
+        >>> Sampler(top_p=0.5).filter_top_p(np.log(np.array([[0.2, 0.6, 0.2]])))
+        array([[       -inf, -0.51082562,        -inf]])
+        """
+        if self.top_p >= 1:
+            return logits
+
+        order = np.argsort(-(logits if scores is None else scores), axis=-1)
+        ordered = np.take_along_axis(logits, order, axis=-1)
+        weights = np.exp(ordered - ordered[:, :1])
+        probabilities = weights / weights.sum(axis=-1, keepdims=True)
+        preceding = np.cumsum(probabilities, axis=-1) - probabilities
+
+        removed = np.zeros(logits.shape, dtype=bool)
+        np.put_along_axis(removed, order, preceding >= self.top_p, axis=-1)
+
+        return np.where(removed, -np.inf, logits)
@@ -0,0 +1,324 @@
+"""
+Search for best hyperparameters training many models in parallel.
+"""
+from __future__ import annotations
+
+import csv
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import statistics
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import (
+    ContextManager,
+    Dict,
+    Final,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+import tensorflow
+
+from loguru import logger
+from tensorflow.keras import callbacks
+
+from sarada import dataset
+from sarada.neuron import Neuron, batch_size, default_learning_rate, default_units
+from sarada.notebook import Notebook
+
+results_filename: Final = "results.tsv"
+
+Losses = MutableMapping[int, List[float]]
+
+
+class Trial(NamedTuple):
+    """Single set of hyperparameters."""
+
+    number: int
+    window_size: int
+    units: Tuple[int, ...]
+    learning_rate: float
+    batch_size: int
+
+
+class Result(NamedTuple):
+    """Outcome of training model with given hyperparameters."""
+
+    trial: Trial
+    epochs: int
+    best_epoch: int
+    loss: float
+    pruned: bool
+
+
+class Space(NamedTuple):
+    """Values to be checked for each of hyperparameters."""
+
+    window_size: List[int]
+    units: List[List[int]]
+    learning_rate: List[float]
+    batch_size: List[int]
+
+
+def read_space(path: Path) -> Space:
+    """
+    Read search space from json file.
+
+    Missing hyperparameters use single default value.
+    """
+    with open(path, "r", encoding="utf-8") as datafile:
+        data: Dict[str, list] = json.load(datafile)
+
+    unknown = set(data) - set(Space._fields)
+    if unknown:
+        raise ValueError(f"Unknown hyperparameters: {', '.join(sorted(unknown))}")
+
+    return Space(
+        window_size=[int(size) for size in data.get("window_size", [40])],
+        units=[list(units) for units in data.get("units", [default_units])],
+        learning_rate=[
+            float(rate) for rate in data.get("learning_rate", [default_learning_rate])
+        ],
+        batch_size=[int(size) for size in data.get("batch_size", [batch_size])],
+    )
+
+
+def make_trials(
+    space: Space, count: int = 0, seed: Optional[int] = None
+) -> List[Trial]:
+    """
+    Create trials for all combinations or given number of random ones.
+
+    >>> space = Space([10, 20], [[8]], [0.1, 0.01], [16])
+    >>> len(make_trials(space))
+    4
+
+    >>> [trial.number for trial in make_trials(space, count=2, seed=0)]
+    [0, 1]
+    """
+    grid = list(
+        itertools.product(
+            space.window_size, space.units, space.learning_rate, space.batch_size
+        )
+    )
+
+    if 0 < count < len(grid):
+        rng = np.random.default_rng(seed)
+        grid = [grid[i] for i in sorted(rng.choice(len(grid), count, replace=False))]
+
+    return [
+        Trial(number, window, tuple(units), rate, size)
+        for number, (window, units, rate, size) in enumerate(grid)
+    ]
+
+
+def window_path(path: Path, window_size: int) -> Path:
+    """
+    Return directory of dataset for given window size.
+
+    >>> str(window_path(Path("sweep"), 20))
+    'sweep/window-20'
+    """
+    return path / f"window-{window_size}"
+
+
+def prepare(notebook: Notebook, path: Path, trials: Sequence[Trial]) -> None:
+    """
+    Store notebook and build datasets shared by all trials.
+
+    Single dataset is built for each of window sizes.
+    """
+    notebook.store(path)
+    numeris = notebook.numerize()
+
+    for window_size in sorted({trial.window_size for trial in trials}):
+        directory = window_path(path, window_size)
+        directory.mkdir()
+        dataset.build(numeris, directory, window_size, shard_size=1_000_000)
+
+
+def run(
+    path: Path,
+    trials: Sequence[Trial],
+    epochs: int,
+    workers: int = 1,
+    threads: int = 1,
+    validation: float = 0.0,
+    warmup: int = 1,
+) -> List[Result]:
+    """
+    Run trials in parallel processes and store table of results.
+
+    Every process is limited to given number of threads.
+    """
+    context = multiprocessing.get_context("spawn")
+
+    with context.Manager() as manager, ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=limit_threads,
+        initargs=(threads,),
+    ) as executor:
+        losses: Losses = manager.dict()
+        lock = manager.Lock()
+        futures = [
+            executor.submit(
+                run_trial, trial, path, epochs, validation, warmup, losses, lock
+            )
+            for trial in trials
+        ]
+        results = [future.result() for future in futures]
+
+    store_results(results, path)
+
+    return results
+
+
+def limit_threads(threads: int) -> None:
+    """
+    Limit number of threads used by TensorFlow in current process.
+    """
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    tensorflow.config.threading.set_intra_op_parallelism_threads(threads)
+    tensorflow.config.threading.set_inter_op_parallelism_threads(threads)
+
+
+def run_trial(  # pylint: disable=too-many-arguments
+    trial: Trial,
+    path: Path,
+    epochs: int,
+    validation: float,
+    warmup: int,
+    losses: Losses,
+    lock: ContextManager[bool],
+) -> Result:
+    """
+    Train model using hyperparameters of single trial.
+    """
+    logger.info("Starting trial {trial}", trial=trial)
+
+    windows = dataset.read(
+        window_path(path, trial.window_size),
+        batch_size=trial.batch_size,
+        seed=trial.number,
+    )
+    data, held = windows.split(validation, seed=0)
+
+    model = Neuron(
+        trial.window_size,
+        windows.distinct_size,
+        units=trial.units,
+        learning_rate=trial.learning_rate,
+    )
+
+    monitor = "val_loss" if len(held) else "loss"
+    pruner = Pruner(monitor, losses, lock, warmup)
+    progress = model.learn(
+        data,
+        epochs=epochs,
+        validation=held if len(held) else None,
+        checkpoint=path / f"checkpoint-{trial.number}",
+        extra_callbacks=[pruner],
+    )
+
+    logger.info(
+        "Trial {number} finished with loss {loss}",
+        number=trial.number,
+        loss=progress.best_loss,
+    )
+
+    return Result(
+        trial, progress.epochs, progress.best_epoch, progress.best_loss, pruner.pruned
+    )
+
+
+class Pruner(callbacks.Callback):  # type: ignore
+    """
+    Stop trials performing worse than median of other trials at the same epoch.
+
+    Losses are shared between processes, so trials running in parallel are
+    compared as well.
+    """
+
+    def __init__(
+        self,
+        monitor: str,
+        losses: Losses,
+        lock: ContextManager[bool],
+        warmup: int = 1,
+    ) -> None:
+        super().__init__()
+        self.monitor: Final = monitor
+        self.losses: Final = losses
+        self.lock: Final = lock
+        self.warmup: Final = warmup
+        self.pruned = False
+
+    def on_epoch_end(self, epoch: int, logs: Optional[Dict[str, float]] = None) -> None:
+        """
+        Record loss and stop training if it is worse than median.
+        """
+        if logs is None or self.monitor not in logs:
+            return
+
+        loss = logs[self.monitor]
+        with self.lock:
+            others = self.losses.get(epoch, [])
+            self.losses[epoch] = others + [loss]
+
+        if self.should_prune(epoch, loss, others):
+            logger.info("Pruning trial after epoch {epoch}", epoch=epoch + 1)
+            self.pruned = True
+            self.model.stop_training = True
+
+    def should_prune(self, epoch: int, loss: float, others: List[float]) -> bool:
+        """
+        Check if loss is worse than median of other losses after warmup.
+        """
+        if epoch + 1 < self.warmup or len(others) < 2:
+            return False
+
+        return loss > statistics.median(others)
+
+
+def rank(result: Result) -> float:
+    """
+    Return loss by which result is ranked, placing diverged trials last.
+
+    >>> trial = Trial(0, 10, (8,), 0.1, 16)
+    >>> rank(Result(trial, 1, 0, float("nan"), False))
+    inf
+    """
+    return math.inf if math.isnan(result.loss) else result.loss
+
+
+def store_results(results: Sequence[Result], path: Path) -> None:
+    """
+    Write table of results ordered by loss.
+    """
+    with open(path / results_filename, "w", encoding="utf-8", newline="") as datafile:
+        writer = csv.writer(datafile, delimiter="\t")
+        writer.writerow([*Trial._fields, "epochs", "best_epoch", "loss", "pruned"])
+        for result in sorted(results, key=rank):
+            writer.writerow(
+                [
+                    *result.trial[:2],
+                    ",".join(str(width) for width in result.trial.units),
+                    *result.trial[3:],
+                    result.epochs,
+                    result.best_epoch,
+                    result.loss,
+                    result.pruned,
+                ]
+            )
+
+    logger.info("Results stored in {path}", path=str(path / results_filename))
@@ -1,14 +1,21 @@
 from __future__ import annotations
 
+import json
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from os import PathLike
 from pathlib import Path
-from typing import Union
+from tempfile import TemporaryDirectory
+from typing import Callable, Iterator, List, Union
 
 from hypothesis import given
+from hypothesis.strategies import lists
 from hypothesis.strategies._internal.numbers import integers
 from hypothesis_fspaths import fspaths
+from typer.testing import CliRunner
 
-from sarada.console.app import filenames
+from sarada.console.app import app, bounded_map, filenames
 
 max_value = 1000
 
@@ -57,3 +64,37 @@ def test_filenames_single_multiple_files_unique_names(
     path = Path(str(pathstr))
     paths = list(filenames(path, count))
     assert len(set(paths)) == count
+
+
+@given(
+    integers(min_value=1, max_value=5),
+    lists(integers(), min_size=1, max_size=20),
+)
+def test_bounded_map_holds_back_tasks(depth: int, values: List[int]) -> None:
+    pulled = []
+
+    def tasks() -> Iterator[Callable[[], int]]:
+        for value in values:
+            pulled.append(value)
+            yield partial(int, value)
+
+    with ThreadPoolExecutor(2) as executor:
+        results = bounded_map(executor, tasks(), depth)
+        first = next(results)
+        assert len(pulled) <= depth
+        assert [first, *results] == values
+
+
+def test_sweep_rejects_space_without_trials() -> None:
+    with TemporaryDirectory() as tmpdir:
+        space = Path(tmpdir) / "space.json"
+        space.write_text(json.dumps({"window_size": []}), encoding="utf-8")
+        sweep_dir = Path(tmpdir) / "sweep"
+
+        result = CliRunner().invoke(
+            app, ["sweep", tmpdir, str(sweep_dir), "--space", str(space)]
+        )
+
+        assert result.exit_code == 2
+        assert "no trials" in result.output
+        assert not sweep_dir.exists()
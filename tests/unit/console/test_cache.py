@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import os
+
+from fractions import Fraction
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List, Tuple, cast
+
+import numpy as np
+
+from hypothesis import given, settings
+from hypothesis.strategies import lists, one_of
+
+from sarada import augment, dataset
+from sarada.console import cache
+from sarada.console.config import ConfigData
+from sarada.notebook import Musical, Note, Notebook, Pitch, QuarterLength, Rest
+
+from ..strategies import chords, notes, rests
+
+config: ConfigData = {"iterations": 0, "window_size": 4, "transpositions": 1}
+
+
+@given(lists(lists(one_of(notes(), chords(), rests()), max_size=10), max_size=4))
+@settings(deadline=None)
+def test_cached_state_matches_notebook(notesets: List[List[Musical]]) -> None:
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        notebook = Notebook(notes=notesets)
+        notebook.store(path)
+        numeris = augment.numerize(notebook, augment.transforms(1))
+
+        stored = cache.store(path, config, numeris)
+        state = cache.read(path, config)
+
+        assert state is not None
+        assert state.vocabulary.mapping == numeris.mapping
+        assert state.vocabulary.tokens.tolist() == numeris.tokens.tolist()
+        assert state.digest == stored.digest
+        assert np.array_equal(state.tokens, stored.tokens)
+        assert np.array_equal(np.diff(state.starts), [len(n) for n in notesets])
+        assert state.tokens.tolist() == [
+            numeris.mapping[value] for noteset in notesets for value in noteset
+        ]
+
+
+@given(lists(lists(one_of(notes(), chords(), rests()), max_size=10), max_size=4))
+@settings(deadline=None)
+def test_warm_cache_windows_match_series_of_notebook(
+    notesets: List[List[Musical]],
+) -> None:
+    window_size = 3
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        notebook = Notebook(notes=notesets)
+        notebook.store(path)
+        numeris = notebook.numerize()
+        cache.store(path, config, numeris)
+        state = cache.read(path, config)
+
+        assert state is not None
+        windows = dataset.encoded(
+            state.tokens, state.starts, state.vocabulary.distinct_size, window_size
+        )
+        found: List[Tuple[Tuple[float, ...], Tuple[int, ...]]] = []
+        for i in range(len(windows)):
+            inputs, outputs = windows[i]
+            found += zip(map(tuple, inputs[..., 0]), map(tuple, outputs.astype(int)))
+
+    expected = [
+        (tuple(series.input), tuple(series.output))
+        for series in numeris.make_series(window_size)
+    ]
+    assert sorted(found) == sorted(expected)
+
+
+def test_cache_is_outdated_by_notebook_and_augmentation() -> None:
+    notebook = Notebook(notes=[[Rest(QuarterLength(1.0))]])
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        notebook.store(path)
+        cache.store(path, config, notebook.numerize())
+
+        assert cache.read(path, config) is not None
+        assert cache.read(path, {"iterations": 0, "window_size": 4}) is None
+
+        stat = (path / "notebook.dat").stat()
+        os.utime(path / "notebook.dat", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+        assert cache.read(path, config) is None
+
+
+def test_unrepresentable_values_are_not_cached() -> None:
+    half = Note(cast(QuarterLength, Fraction(1, 2)), Pitch("C4"))
+    notebook = Notebook(notes=[[half]])
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        notebook.store(path)
+        state = cache.store(path, config, notebook.numerize())
+
+        assert state.vocabulary.distinct_size == 1
+        assert cache.read(path, config) is None
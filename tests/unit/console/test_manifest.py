@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import json
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from sarada.console import manifest
+from sarada.console.config import ConfigData
+from sarada.neuron import Neuron
+from sarada.notebook import Notebook
+
+config: ConfigData = {"iterations": 0, "window_size": 4}
+
+
+def test_commit_creates_versions_and_prunes_old_ones() -> None:
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        Notebook(notes=[[]]).store(path)
+        neuron = Neuron(4, 3, units=(4,))
+
+        manifest.commit(path, neuron, config, vocabulary="abc")
+        manifest.commit(path, neuron, {"iterations": 1, "window_size": 4})
+        data = manifest.commit(path, neuron, {"iterations": 2, "window_size": 4})
+
+        versions = [p.name for p in (path / manifest.versions_dirname).iterdir()]
+        loaded = manifest.read(path)
+        manifest.validate(path, loaded)
+
+        assert sorted(versions) == ["00002", "00003"]
+        assert loaded == json.loads(json.dumps(data))
+        assert loaded["vocabulary"] == "abc"
+        assert loaded["config"]["iterations"] == 2
+        assert loaded["architecture"]["units"] == [4]
+        assert manifest.model_location(path) == path / "versions/00003/model"
+        assert "notebook.dat" in loaded["files"]
+        assert not manifest.verify(path, loaded)
+
+
+def test_modified_files_are_detected() -> None:
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        Notebook(notes=[[]]).store(path)
+        data = manifest.commit(path, Neuron(4, 3, units=(4,)), config)
+
+        with open(path / "notebook.dat", "ab") as datafile:
+            datafile.write(b"\0")
+
+        with pytest.raises(ValueError):
+            manifest.validate(path, data)
+        assert manifest.verify(path, data) == ["notebook.dat"]
+
+
+def test_unknown_format_is_rejected() -> None:
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        (path / manifest.filename).write_text('{"format": "other", "version": 1}')
+
+        with pytest.raises(ValueError):
+            manifest.read(path)
+
+
+def test_directory_without_manifest_uses_legacy_layout() -> None:
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+
+        assert manifest.model_location(path) == path / "model"
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from hypothesis import given, settings
+from hypothesis.strategies import integers
+
+from sarada import attention
+
+
+@given(integers(min_value=1, max_value=3), integers(min_value=1, max_value=8))
+@settings(max_examples=5, deadline=None)
+def test_cache_matches_model_on_whole_window(blocks: int, window: int) -> None:
+    model = attention.assemble(7, (8,) * blocks, learning_rate=1e-3)
+    values = np.random.default_rng(window).integers(7, size=(3, window)) / 6
+
+    expected = model.predict_on_batch(values[..., np.newaxis])[:, -1]
+    cache = attention.Cache(model, window)
+
+    assert np.allclose(cache.advance(values), expected, atol=1e-5)
+
+
+def test_cache_slides_window_of_single_block() -> None:
+    window = 4
+    model = attention.assemble(7, (8,), learning_rate=1e-3)
+    values = np.random.default_rng(0).integers(7, size=(2, window + 5)) / 6
+
+    cache = attention.Cache(model, window)
+    cache.advance(values[:, :window])
+    for start in range(1, 6):
+        expected = model.predict_on_batch(
+            values[:, start : start + window, np.newaxis]
+        )[:, -1]
+        predicted = cache.advance(values[:, start + window - 1 : start + window])
+
+        assert np.allclose(predicted, expected, atol=1e-5)
+        assert all(key.shape[1] == window for key in cache.keys)
+
+
+@given(integers(min_value=1, max_value=3), integers(min_value=2, max_value=6))
+@settings(max_examples=5, deadline=None)
+def test_cache_matches_model_step_by_step_within_window(
+    blocks: int, window: int
+) -> None:
+    model = attention.assemble(7, (8,) * blocks, learning_rate=1e-3)
+    values = np.random.default_rng(window).integers(7, size=(2, window)) / 6
+
+    cache = attention.Cache(model, window)
+    for end in range(1, window + 1):
+        expected = model.predict_on_batch(values[:, :end, np.newaxis])[:, -1]
+        predicted = cache.advance(values[:, end - 1 : end])
+
+        assert np.allclose(predicted, expected, atol=1e-5)
+
+
+def test_cache_beyond_window_attends_to_sliding_windows() -> None:
+    window = 4
+    model = attention.assemble(7, (8, 8), learning_rate=1e-3)
+    values = np.random.default_rng(2).integers(7, size=(2, window + 5)) / 6
+
+    cache = attention.Cache(model, window)
+    predicted = cache.advance(values[:, :window])
+    for end in range(window + 1, values.shape[1] + 1):
+        predicted = cache.advance(values[:, end - 1 : end])
+    whole = attention.Cache(model, window).advance(values)
+    alone = model.predict_on_batch(values[:, -window:, np.newaxis])[:, -1]
+
+    # Deeper block keys remember values which left window, unlike model
+    assert np.allclose(predicted, whole, atol=1e-5)
+    assert not np.allclose(predicted, alone, atol=1e-5)
+
+
+def test_cache_selects_rows() -> None:
+    model = attention.assemble(5, (8, 8), learning_rate=1e-3)
+    values = np.random.default_rng(1).integers(5, size=(2, 4)) / 4
+    step = np.array([[0.5], [0.5]])
+
+    cache = attention.Cache(model, 4)
+    cache.advance(values)
+    cache.select(np.array([1, 1]))
+    selected = cache.advance(step)
+
+    reference = attention.Cache(model, 4)
+    reference.advance(values[[1]])
+    expected = reference.advance(step[:1])
+
+    assert np.allclose(selected, np.repeat(expected, 2, axis=0), atol=1e-6)
+
+
+def test_model_predicts_every_position() -> None:
+    model = attention.assemble(6, (8, 8), learning_rate=1e-3)
+
+    prediction = model.predict_on_batch(np.zeros((2, 5, 1)))
+
+    assert prediction.shape == (2, 5, 6)
+    assert np.allclose(prediction.sum(axis=-1), 1, atol=1e-5)
+
+
+def test_assemble_requires_equal_widths() -> None:
+    with pytest.raises(ValueError):
+        attention.assemble(6, (8, 16), learning_rate=1e-3)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from typing import List
+
+import numpy as np
+
+from hypothesis import given, settings
+from hypothesis.strategies import integers, lists, sampled_from
+
+from sarada import music21
+from sarada.augment import Transform, numerize, table, transforms, transpose
+from sarada.notebook import Chord, Musical, Note, Notebook, Rest
+
+from .strategies import chords, m21notes, notes, rests
+
+
+@given(notes() | chords() | rests(), integers(min_value=-12, max_value=12))
+def test_transpose_is_reversable(musical: Musical, semitones: int) -> None:
+    moved = transpose(transpose(musical, semitones), -semitones)
+
+    assert type(moved) is type(musical)
+    assert moved.duration == musical.duration
+    if not isinstance(musical, Rest):
+        assert pitch_classes(moved) == pitch_classes(musical)
+
+
+def pitch_classes(musical: Musical) -> List[int]:
+    if isinstance(musical, Chord):
+        pitches = musical.pitch
+    elif isinstance(musical, Note):
+        pitches = (musical.pitch,)
+    else:
+        pitches = ()
+    return [music21.Pitch(pitch).pitchClass for pitch in pitches]
+
+
+@given(
+    lists(lists(m21notes(), min_size=1), min_size=1, max_size=3),
+    integers(min_value=0, max_value=2),
+    lists(sampled_from([50, 200]), max_size=2),
+)
+@settings(deadline=None, max_examples=20)
+def test_numerize_is_closed_under_transforms(
+    note_list: List[List[music21.Note]], transpositions: int, scales: List[int]
+) -> None:
+    notebook = Notebook()
+    for notes_ in note_list:
+        notebook.add(notes_)
+    transformations = transforms(transpositions, scales)
+
+    numeris = numerize(notebook, transformations)
+
+    for noteset in notebook.notes:
+        for musical in noteset:
+            assert all(t.apply(musical) in numeris.mapping for t in transformations)
+
+
+@given(
+    lists(lists(m21notes(), min_size=1), min_size=1, max_size=3),
+    integers(min_value=0, max_value=2),
+)
+@settings(deadline=None, max_examples=20)
+def test_table_maps_to_transformed_values(
+    note_list: List[List[music21.Note]], transpositions: int
+) -> None:
+    notebook = Notebook()
+    for notes_ in note_list:
+        notebook.add(notes_)
+    transformations = transforms(transpositions, [200])
+    numeris = numerize(notebook, transformations)
+
+    mapped = table(numeris, transformations)
+
+    assert mapped.shape == (len(transformations), numeris.distinct_size)
+    for row, transform in enumerate(transformations):
+        for musical in notebook.notes[0]:
+            idx = numeris.mapping[musical]
+            expected = numeris.mapping[transform.apply(musical)]
+            assert mapped[row, idx] == expected
+
+
+def test_identity_table_keeps_values() -> None:
+    notebook = Notebook()
+    notebook.add([music21.Note("C4"), music21.Note("D4")])
+    numeris = numerize(notebook, [Transform()])
+
+    assert (table(numeris, [Transform()]) == np.arange(2)).all()
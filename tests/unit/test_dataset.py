@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List, Tuple
+
+import numpy as np
+
+from hypothesis import given, settings
+from hypothesis.strategies import DataObject, data, floats, integers, lists
+
+from sarada import dataset
+from sarada.numeris import Numeris, holdout
+
+
+@given(
+    lists(lists(integers(min_value=0, max_value=20), max_size=30), max_size=5),
+    integers(min_value=1, max_value=5),
+    integers(min_value=1, max_value=40),
+)
+@settings(deadline=None)
+def test_dataset_contains_all_series(
+    texts: List[List[int]], window_size: int, shard_size: int
+) -> None:
+    numeris = Numeris(texts)
+    expected = sorted(
+        (tuple(series.input), tuple(series.output))
+        for series in numeris.make_series(window_size=window_size)
+    )
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        dataset.build(numeris, path, window_size, shard_size)
+        windows = dataset.read(path, batch_size=4, seed=0)
+
+        found = []
+        for i in range(len(windows)):
+            inputs, outputs = windows[i]
+            for ins, out in zip(inputs[..., 0], outputs):
+                found.append((tuple(ins), tuple(int(o) for o in out)))
+
+    assert sorted(found) == expected
+
+
+def test_dataset_exists_after_build() -> None:
+    numeris = Numeris([[1, 2, 3, 4, 5]])
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        assert not dataset.exists(path)
+
+        dataset.build(numeris, path, window_size=2, shard_size=10)
+
+        assert dataset.exists(path)
+
+
+@given(
+    lists(
+        lists(integers(min_value=0, max_value=5), min_size=3, max_size=8), max_size=8
+    ),
+    floats(min_value=0, max_value=1),
+)
+@settings(deadline=None)
+def test_dataset_split_holds_out_whole_notesets(
+    texts: List[List[int]], fraction: float
+) -> None:
+    numeris = Numeris(texts)
+    window_size = 2
+    held_notesets = holdout(len(texts), fraction, seed=0)
+    expected = sum(len(texts[i]) - window_size for i in held_notesets)
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        dataset.build(numeris, path, window_size, shard_size=10)
+        windows = dataset.read(path)
+
+        kept, held = windows.split(fraction, seed=0)
+
+    assert len(held.index) == expected
+    assert len(kept.index) + len(held.index) == len(windows.index)
+
+
+@given(
+    lists(lists(integers(min_value=0, max_value=20), max_size=30), max_size=5),
+    integers(min_value=1, max_value=5),
+    data(),
+)
+@settings(deadline=None)
+def test_resized_dataset_keeps_targets(
+    texts: List[List[int]], window_size: int, draw: DataObject
+) -> None:
+    context: int = draw.draw(integers(min_value=1, max_value=window_size))
+    numeris = Numeris(texts)
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        dataset.build(numeris, path, window_size, shard_size=10)
+        windows = dataset.read(path, seed=0)
+        resized = windows.resized(context)
+
+        expected: List[Tuple[Tuple[float, ...], Tuple[float, ...]]] = []
+        found: List[Tuple[Tuple[float, ...], Tuple[float, ...]]] = []
+        for i in range(len(windows)):
+            inputs, outputs = windows[i]
+            expected += zip(map(tuple, inputs[:, -context:, 0]), map(tuple, outputs))
+
+            inputs, outputs = resized[i]
+            found += zip(map(tuple, inputs[..., 0]), map(tuple, outputs))
+
+    assert sorted(found) == sorted(expected)
+
+
+@given(lists(lists(integers(min_value=0, max_value=9), max_size=20), max_size=4))
+@settings(deadline=None)
+def test_sequential_windows_target_following_values(texts: List[List[int]]) -> None:
+    numeris = Numeris(texts)
+    windows = dataset.windows(numeris, window_size=3, batch_size=4, seed=0)
+    sequential = windows.sequential()
+
+    for i in range(len(sequential)):
+        inputs, targets = sequential[i]
+        scaled = inputs[..., 0] * max(numeris.distinct_size - 1, 1)
+
+        assert targets.shape == inputs.shape[:2]
+        assert np.array_equal(np.rint(scaled[:, 1:]), targets[:, :-1])
+    assert sequential.split(0.5, seed=0)[1].sequences
+
+
+@given(
+    lists(lists(integers(min_value=0, max_value=9), max_size=20), max_size=4),
+    integers(min_value=1, max_value=4),
+)
+@settings(deadline=None)
+def test_strided_windows_start_every_stride_values(
+    texts: List[List[int]], stride: int
+) -> None:
+    numeris = Numeris(texts)
+    windows = dataset.windows(numeris, window_size=3)
+
+    strided = windows.strided(stride)
+
+    expected = sum(len(range(0, max(len(text) - 3, 0), stride)) for text in texts)
+    assert len(strided.index) == expected
+    for noteset in np.unique(strided.index[:, 2]):
+        offsets = strided.index[strided.index[:, 2] == noteset, 1]
+        assert np.all(np.diff(offsets) == stride)
+
+
+@given(lists(lists(integers(min_value=0, max_value=9), max_size=20), max_size=4))
+@settings(deadline=None)
+def test_encoded_windows_match_single_built_shard(texts: List[List[int]]) -> None:
+    numeris = Numeris(texts)
+
+    windows = dataset.windows(numeris, 3)
+    shard, index = next(dataset.encode(numeris, 3, shard_size=10**9))
+
+    assert np.array_equal(windows.index, index)
+    assert np.array_equal(windows.shards[0], shard)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+
+import numpy as np
+import pytest
+
+from hypothesis import given, settings
+from hypothesis.strategies import floats, integers, lists
+from numpy.typing import NDArray
+
+from sarada import dataset, distillation
+from sarada.distillation import Distillation
+from sarada.neuron import Neuron
+from sarada.numeris import Numeris
+
+
+class CountingNeuron(Neuron):
+    """Neuron predicting probabilities proportional to values of last input."""
+
+    calls = 0
+
+    def predict(self, states: NDArray[np.float64]) -> NDArray[np.float32]:
+        self.calls += 1
+        weights = np.ones((len(states), self.output_length), dtype=np.float32)
+        weights[:, 0] += states[:, -1, 0]
+
+        probabilities: NDArray[np.float32] = weights / weights.sum(
+            axis=-1, keepdims=True
+        )
+        return probabilities
+
+
+@given(
+    lists(floats(min_value=-20, max_value=0), min_size=1, max_size=10),
+    floats(min_value=0.5, max_value=10),
+)
+def test_soften_gives_distribution(logits: List[float], temperature: float) -> None:
+    softened = distillation.soften(np.array([logits]), temperature)
+
+    assert np.isclose(softened.sum(), 1, atol=1e-5)
+    assert softened[0, np.argmax(logits)] == softened.max()
+
+
+def test_soften_keeps_probabilities_at_unit_temperature() -> None:
+    probabilities = np.array([[0.1, 0.2, 0.7]])
+
+    softened = distillation.soften(np.log(probabilities), 1.0)
+
+    assert np.allclose(softened, probabilities)
+
+
+@given(
+    lists(lists(integers(min_value=0, max_value=6), min_size=4), max_size=4),
+    floats(min_value=0, max_value=1),
+)
+@settings(deadline=None)
+def test_distillation_mixes_teacher_and_true_targets(
+    texts: List[List[int]], alpha: float
+) -> None:
+    numeris = Numeris(texts)
+    windows = dataset.windows(numeris, window_size=3, batch_size=4, seed=0)
+    targets = np.log(
+        np.random.default_rng(0).dirichlet(
+            np.ones(numeris.distinct_size), size=len(windows.index)
+        )
+    ).astype(np.float16)
+
+    distilled = Distillation(windows, targets, temperature=1.0, alpha=alpha, seed=0)
+    scale = max(numeris.distinct_size - 1, 1)
+
+    for i in range(len(distilled)):
+        inputs, outputs = distilled[i]
+        positions = np.sort(distilled.order[i * 4 : (i + 1) * 4])
+        tokens = windows.tokens(positions)
+        expected = alpha * np.exp(targets[positions].astype(np.float32))
+        expected[np.arange(len(tokens)), tokens[:, -1]] += 1 - alpha
+
+        assert np.allclose(inputs[..., 0], tokens[:, :-1] / scale)
+        assert np.allclose(outputs, expected, atol=1e-2)
+        assert np.allclose(outputs.sum(axis=-1), 1, atol=1e-2)
+
+
+def test_teacher_targets_are_cached() -> None:
+    numeris = Numeris([[0, 1, 2, 3, 2, 1, 0, 1, 2]])
+    windows = dataset.windows(numeris, window_size=3)
+    teacher = CountingNeuron(3, numeris.distinct_size)
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        targets = distillation.teacher_targets(teacher, windows, path, batch_size=2)
+        calls = teacher.calls
+        cached = distillation.teacher_targets(teacher, windows, path, batch_size=2)
+
+        assert calls == 3
+        assert teacher.calls == calls
+        assert targets.shape == (len(windows.index), numeris.distinct_size)
+        assert np.array_equal(cached, targets)
+
+        teacher.model.set_weights([w + 1 for w in teacher.model.get_weights()])
+        distillation.teacher_targets(teacher, windows, path, batch_size=2)
+
+        assert teacher.calls == 2 * calls
+
+        other = dataset.windows(Numeris([[0, 1, 2, 3, 3, 2, 1, 0, 1]]), 3)
+        distillation.teacher_targets(teacher, other, path, batch_size=2)
+
+        assert teacher.calls == 3 * calls
+
+
+def test_derived_distillation_keeps_teacher_targets() -> None:
+    numeris = Numeris([[0, 1, 2, 3, 2, 1, 0, 1, 2], [3, 2, 1, 0, 1, 2, 3]])
+    windows = dataset.windows(numeris, window_size=3, batch_size=2)
+    targets = np.log(
+        np.random.default_rng(0).dirichlet(
+            np.ones(numeris.distinct_size), size=len(windows.index)
+        )
+    ).astype(np.float16)
+    distilled = Distillation(windows, targets, temperature=1.0, alpha=1.0, seed=0)
+    expected = {
+        tuple(row): np.exp(target.astype(np.float32))
+        for row, target in zip(windows.index[:, :2], targets)
+    }
+
+    kept, held = distilled.split(0.5, seed=0)
+    for derived in (kept, held, kept.strided(2), distilled.resized(2)):
+        assert isinstance(derived, Distillation)
+        for i in range(len(derived)):
+            positions = np.sort(derived.order[i * 2 : (i + 1) * 2])
+            outputs = derived[i][1]
+            for row, output in zip(derived.index[positions, :2], outputs):
+                assert np.allclose(output, expected[tuple(row)], atol=1e-2)
+
+
+def test_distillation_rejects_sequential_windows() -> None:
+    numeris = Numeris([[0, 1, 2, 3, 2, 1, 0]])
+    windows = dataset.windows(numeris, window_size=3)
+    targets = np.zeros((len(windows.index), numeris.distinct_size), np.float16)
+
+    with pytest.raises(ValueError):
+        Distillation(windows, targets).sequential()
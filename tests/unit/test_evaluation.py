@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from typing import List
+
+import numpy as np
+
+from hypothesis import given, settings
+from hypothesis.strategies import integers, lists
+
+from sarada.evaluation import batches, evaluate
+from sarada.neuron import Neuron
+from sarada.notebook import Musical, NoteSet, QuarterLength, Rest
+from sarada.numeris import Numeris
+
+
+@given(
+    lists(lists(integers(min_value=0, max_value=9), max_size=12), max_size=5),
+    integers(min_value=1, max_value=4),
+    integers(min_value=1, max_value=7),
+)
+def test_batches_contain_every_window_once(
+    sequences: List[List[int]], window_size: int, batch_size: int
+) -> None:
+    arrays = [np.array(sequence, dtype=np.int64) for sequence in sequences]
+    expected = [
+        sequence[i : i + window_size + 1]
+        for sequence in sequences
+        for i in range(len(sequence) - window_size)
+    ]
+
+    produced = list(batches(arrays, window_size, batch_size))
+    windows = [row for batch in produced for row in batch.tolist()]
+
+    assert windows == expected
+    assert all(len(batch) <= batch_size for batch in produced)
+
+
+@given(integers(min_value=4, max_value=20))
+@settings(max_examples=3, deadline=None)
+def test_evaluate_counts_tokens(length: int) -> None:
+    vocabulary: List[Musical] = [Rest(QuarterLength(d)) for d in (0.25, 0.5, 1.0)]
+    numeris = Numeris[Musical]([vocabulary])
+    neuron = Neuron(3, numeris.distinct_size, units=(4,))
+    notes = [vocabulary[i % 3] for i in range(length)] + [Rest(QuarterLength(2.0))]
+
+    result = evaluate(neuron, numeris, [NoteSet("", notes)], top_k=(1, 3))
+
+    assert result.tokens == length - 3
+    assert result.unknown == 1
+    assert result.accuracy(1) == 1.0
+    assert 1.0 <= result.perplexity
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from fractions import Fraction
+from typing import List, cast
+
+from hypothesis import given, settings
+from hypothesis.strategies import integers, lists
+
+from sarada.fingerprint import Deduplicator, deduplicate, fingerprint, similarity
+from sarada.notebook import (
+    Chord,
+    Musical,
+    Musicals,
+    Note,
+    NoteSet,
+    Pitch,
+    QuarterLength,
+    Rest,
+)
+
+from .strategies import chords, notes, rests
+
+musicals = lists(notes() | chords() | rests(), min_size=1, max_size=40)
+
+
+@given(musicals)
+def test_exact_duplicates_are_removed(noteset: Musicals) -> None:
+    deduplicator = Deduplicator()
+
+    assert deduplicator.add(fingerprint(noteset))
+    assert not deduplicator.add(fingerprint(list(noteset)))
+    assert deduplicator.exact == 1
+
+
+def test_differently_spelled_notesets_are_exact_duplicates() -> None:
+    triplet = cast(QuarterLength, Fraction(1, 3))
+    first: Musicals = [
+        Note(QuarterLength(0.5), Pitch("C#4")),
+        Chord(QuarterLength(1.0), (Pitch("E4"), Pitch("G4"))),
+        Rest(QuarterLength(1 / 3)),
+    ]
+    second: Musicals = [
+        Note(cast(QuarterLength, Fraction(1, 2)), Pitch("D-4")),
+        Chord(QuarterLength(1.0), (Pitch("G4"), Pitch("F-4"))),
+        Rest(triplet),
+    ]
+    deduplicator = Deduplicator()
+
+    assert deduplicator.add(fingerprint(first))
+    assert not deduplicator.add(fingerprint(second))
+    assert deduplicator.exact == 1
+
+
+@given(lists(notes(), min_size=30, max_size=40, unique=True), integers(0, 29))
+@settings(deadline=None, max_examples=30)
+def test_near_duplicates_are_removed(noteset: List[Musical], idx: int) -> None:
+    changed = noteset[:idx] + noteset[idx + 1 :]
+    deduplicator = Deduplicator(threshold=0.5)
+
+    assert deduplicator.add(fingerprint(noteset))
+    assert not deduplicator.add(fingerprint(changed))
+    assert deduplicator.near == 1
+
+
+@given(lists(rests(), min_size=8, max_size=8), lists(chords(), min_size=8, max_size=8))
+def test_different_notesets_are_kept(first: Musicals, second: Musicals) -> None:
+    deduplicator = Deduplicator()
+
+    assert similarity(fingerprint(first), fingerprint(second)) < 0.5
+    assert deduplicator.add(fingerprint(first))
+    assert deduplicator.add(fingerprint(second))
+
+
+@given(lists(musicals, max_size=5))
+@settings(deadline=None, max_examples=20)
+def test_deduplicate_drops_repeated_notesets(note_lists: List[Musicals]) -> None:
+    notesets = [NoteSet("", notes) for notes in note_lists]
+    unique = list(deduplicate(notesets, Deduplicator(), workers=0))
+
+    assert list(deduplicate(notesets + notesets, Deduplicator(), workers=0)) == unique
+
+
+def test_deduplicate_in_worker_processes() -> None:
+    notesets = [
+        NoteSet("Piano", [Rest(QuarterLength(0.5))] * 8),
+        NoteSet("Piano", [Rest(QuarterLength(1.0))] * 8),
+        NoteSet("Violin", [Rest(QuarterLength(0.5))] * 8),
+    ]
+
+    kept = list(deduplicate(notesets, Deduplicator(), workers=1))
+
+    assert kept == notesets[:2]
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import os
+import time
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+
+from sarada import metrics
+from sarada.isolation import Isolation, Limits, Quarantine, isolated_map
+
+
+def process(path: Path) -> str:
+    if path.name == "hanging":
+        time.sleep(60)
+    if path.name == "broken":
+        raise ValueError("Broken file")
+    if path.name == "huge":
+        return str(len(bytearray(2**31)))
+    return path.name
+
+
+def measure(path: Path) -> str:
+    metrics.count("measured_characters", len(path.name))
+    return path.name
+
+
+def make_files(directory: Path, names: List[str]) -> List[Path]:
+    paths = [directory / name for name in names]
+    for path in paths:
+        path.write_text(path.name, encoding="utf-8")
+    return paths
+
+
+def test_isolated_map_quarantines_failing_files() -> None:
+    with TemporaryDirectory() as tmpdir:
+        directory = Path(tmpdir)
+        paths = make_files(directory, ["a", "hanging", "b", "broken", "huge", "c"])
+        quarantine = Quarantine(directory / "quarantine.json")
+        isolation = Isolation(2, Limits(timeout=2.0, memory=512), quarantine)
+
+        results = list(isolated_map(process, paths, isolation))
+        reloaded = Quarantine(directory / "quarantine.json")
+
+        assert results == ["a", "b", "c"]
+        assert [path for path in paths if path in reloaded] == paths[1:2] + paths[3:5]
+
+
+def test_quarantined_files_are_skipped_until_modified() -> None:
+    with TemporaryDirectory() as tmpdir:
+        directory = Path(tmpdir)
+        first, second = make_files(directory, ["a", "b"])
+        quarantine = Quarantine(directory / "quarantine.json")
+        quarantine.add(first, "Failed before")
+        quarantine.add(second, "Failed before")
+
+        os.utime(second, ns=(0, 0))
+        isolation = Isolation(1, Limits(), quarantine)
+        results = list(isolated_map(process, [first, second], isolation))
+
+        assert results == ["b"]
+        assert first in quarantine
+        assert second not in quarantine
+
+
+def test_metrics_of_workers_reach_parent() -> None:
+    before = metrics.registry.snapshot()
+
+    with TemporaryDirectory() as tmpdir:
+        paths = make_files(Path(tmpdir), ["a", "bb", "ccc"])
+        results = list(isolated_map(measure, paths, Isolation(2), stage="measure"))
+
+    collected = metrics.registry.since(before)
+    assert results == ["a", "bb", "ccc"]
+    assert collected.counters["measured_characters"] == 6
+    assert collected.spans["measure"].calls == 3
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import logging
+
+from typing import List, Tuple
+
+from hypothesis import given
+from hypothesis.strategies import integers, lists
+from loguru import logger
+
+from sarada.logging import InterceptHandler, Summary
+from sarada.numeris import Numeris
+
+
+def capture() -> Tuple[int, List[str]]:
+    messages: List[str] = []
+    handler = logger.add(
+        lambda message: messages.append(str(message).strip()), level="TRACE"
+    )
+    return handler, messages
+
+
+@given(lists(integers(min_value=0, max_value=1000)))
+def test_summary_accumulates_counts(values: List[int]) -> None:
+    summary = Summary("Yielded {series} series", interval=1e9)
+    for value in values:
+        summary.add(series=value)
+
+    assert summary.counts.get("series", 0) == sum(values)
+
+
+def test_summary_logs_at_interval() -> None:
+    handler, messages = capture()
+    try:
+        summary = Summary("Read {notesets} note sets", interval=0.0)
+        summary.add(notesets=1)
+        summary.add(notesets=2)
+    finally:
+        logger.remove(handler)
+
+    assert len(messages) == 2
+    assert messages[0].endswith("Read 1 note sets")
+    assert messages[1].endswith("Read 3 note sets")
+
+
+def test_summary_logs_final_counts_on_exit() -> None:
+    handler, messages = capture()
+    try:
+        with Summary("Read {notesets} note sets", interval=1e9) as summary:
+            summary.add(notesets=1)
+            summary.add(notesets=2)
+            assert not messages
+    finally:
+        logger.remove(handler)
+
+    assert len(messages) == 1
+    assert messages[0].endswith("Read 3 note sets")
+
+
+def test_make_series_logs_final_counts() -> None:
+    handler, messages = capture()
+    try:
+        list(Numeris([list("abcde"), list("abc")]).make_series(window_size=2))
+    finally:
+        logger.remove(handler)
+
+    assert any(
+        message.endswith("Yielded 4 series of 2 datasets so far")
+        for message in messages
+    )
+
+
+def test_summary_flush_without_counts_logs_nothing() -> None:
+    handler, messages = capture()
+    try:
+        Summary("Read {notesets} note sets").flush()
+    finally:
+        logger.remove(handler)
+
+    assert not messages
+
+
+def test_intercepted_records_are_forwarded() -> None:
+    handler, messages = capture()
+    stdlib = logging.getLogger("sarada.tests")
+    stdlib.addHandler(InterceptHandler())
+    stdlib.propagate = False
+    try:
+        stdlib.warning("Forwarded %s", "record")
+    finally:
+        logger.remove(handler)
+        stdlib.handlers = []
+
+    assert len(messages) == 1
+    assert "WARNING" in messages[0]
+    assert messages[0].endswith("Forwarded record")
+
+
+def test_muted_records_are_dropped() -> None:
+    handler, messages = capture()
+    stdlib = logging.getLogger("absl.tests")
+    stdlib.addHandler(InterceptHandler())
+    stdlib.propagate = False
+    try:
+        stdlib.warning("Chatty record")
+    finally:
+        logger.remove(handler)
+        stdlib.handlers = []
+
+    assert not messages
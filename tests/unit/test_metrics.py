@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import List
+
+from hypothesis import given
+from hypothesis.strategies import floats, lists
+
+from sarada import metrics
+from sarada.metrics import Registry, Span
+
+
+@given(lists(floats(min_value=0, max_value=100), min_size=1))
+def test_spans_are_aggregated(durations: List[float]) -> None:
+    registry = Registry()
+    for seconds in durations:
+        registry.observe("parse", seconds)
+
+    span = registry.spans["parse"]
+
+    assert span.calls == len(durations)
+    assert span.longest == max(durations)
+
+
+def test_span_measures_block_even_if_it_fails() -> None:
+    registry = Registry()
+
+    try:
+        with registry.span("fit"):
+            raise ValueError("Failed")
+    except ValueError:
+        pass
+
+    assert registry.spans["fit"].calls == 1
+
+
+def test_prometheus_lists_stages() -> None:
+    registry = Registry()
+    registry.observe("parse", 1.5)
+    registry.count("files", 2)
+
+    lines = registry.prometheus().splitlines()
+
+    assert "sarada_files_total 2" in lines
+    assert 'sarada_span_seconds_total{stage="parse"} 1.5' in lines
+    assert 'sarada_span_calls_total{stage="parse"} 1' in lines
+
+
+def test_json_lines_contain_stages_and_summary() -> None:
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "metrics.jsonl"
+        finish = metrics.setup_metrics(path)
+        with metrics.stage("ingest"):
+            for _ in range(3):
+                with metrics.span("store"):
+                    metrics.count("notes", 3)
+        finish()
+
+        events = [json.loads(line) for line in path.read_text().splitlines()]
+
+    assert [event["type"] for event in events] == ["stage", "summary"]
+    assert events[0]["name"] == "ingest"
+    assert events[0]["spans"]["store"]["calls"] == 3
+    assert events[0]["counters"] == {"notes": 9}
+    assert events[-1]["counters"]["notes"] >= 9
+
+
+def test_merged_snapshot_adds_up() -> None:
+    worker, parent = Registry(), Registry()
+    worker.observe("extract", 2.0)
+    worker.count("notes", 4)
+    parent.observe("extract", 1.0)
+
+    parent.merge(worker.take())
+
+    assert parent.spans["extract"] == Span(2, 3.0, 2.0)
+    assert parent.counters == {"notes": 4}
+    assert not worker.spans and not worker.counters
+
+
+def test_prometheus_file_is_written_on_finish() -> None:
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "metrics.prom"
+        finish = metrics.setup_metrics(path, "prometheus")
+        metrics.count("files")
+        finish()
+
+        assert "sarada_files_total" in path.read_text()
@@ -1,16 +1,34 @@
 from __future__ import annotations
 
+import asyncio
+import os
+
+from contextlib import contextmanager
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import List
+from typing import Iterator, List
 
+import numpy as np
 import pytest
 
 from hypothesis import assume, given, settings
 from hypothesis.strategies import integers, lists
+from tensorflow.keras import callbacks
 
-from sarada.neuron import Neuron
+from sarada import dataset
+from sarada.neuron import Neuron, Recorder
 from sarada.numeris import Numeris
+from sarada.sampling import Sampler
+
+
+@contextmanager
+def chdir(path: str) -> Iterator[None]:
+    current = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(current)
 
 
 @given(lists(lists(integers(), min_size=11), min_size=1))
@@ -38,7 +56,7 @@ def test_prepare_dataset_keeps_data_length(texts: List[List[int]]) -> None:
 def test_make_model(x: int, y: int) -> None:
     neuron = Neuron(x, y)
 
-    assert neuron.model.input_shape[1] == x
+    assert neuron.model.input_shape[1] is None
     assert neuron.model.output_shape[1] == y
 
 
@@ -56,6 +74,159 @@ def test_generate_return_wanted_length(x: int, y: int, z: int) -> None:
     assert len(seq) == z
 
 
+@given(
+    integers(min_value=1, max_value=100),
+    integers(min_value=1, max_value=100),
+    integers(min_value=1, max_value=100),
+)
+@settings(max_examples=2, deadline=None)
+def test_stream_yields_normalized_values(x: int, y: int, z: int) -> None:
+    neuron = Neuron(x, y)
+
+    seq = list(neuron.stream(z))
+
+    assert len(seq) == z
+    assert all(0 <= value <= 1 for value in seq)
+
+
+@given(integers(min_value=1, max_value=200))
+def test_normalized_outputs_map_back_to_the_same_values(size: int) -> None:
+    numeris = Numeris([list(range(size))])
+    neuron = Neuron(3, size)
+
+    indices = np.arange(size)
+
+    assert (numeris.keys(neuron.normalize(indices)) == indices).all()
+
+
+def test_astream_return_wanted_length() -> None:
+    neuron = Neuron(3, 4)
+
+    async def collect() -> List[float]:
+        return [value async for value in neuron.astream(5)]
+
+    assert len(asyncio.run(collect())) == 5
+
+
+def test_generate_with_seed_is_reproducible() -> None:
+    neuron = Neuron(3, 4)
+
+    first = neuron.generate(10, Sampler(temperature=1.0, seed=42))
+    second = neuron.generate(10, Sampler(temperature=1.0, seed=42))
+
+    assert first == second
+
+
+@given(
+    integers(min_value=1, max_value=20),
+    integers(min_value=1, max_value=20),
+    integers(min_value=1, max_value=20),
+    integers(min_value=1, max_value=4),
+)
+@settings(max_examples=2, deadline=None)
+def test_beam_search_return_wanted_length(x: int, y: int, z: int, width: int) -> None:
+    neuron = Neuron(x, y)
+
+    seq = neuron.beam_search(z, width)
+
+    assert len(seq) == z
+    assert all(0 <= value <= 1 for value in seq)
+
+
+def test_beam_search_single_beam_is_greedy() -> None:
+    neuron = Neuron(3, 4)
+
+    greedy = neuron.generate(10, Sampler(seed=7))
+    beam = neuron.beam_search(10, 1, np.random.default_rng(7))
+
+    assert greedy == beam
+
+
+@given(lists(integers(min_value=0, max_value=3), max_size=6))
+@settings(max_examples=5, deadline=None)
+def test_generate_with_primer_return_wanted_length(primer: List[int]) -> None:
+    neuron = Neuron(3, 4)
+
+    seq = neuron.generate(5, primer=[value / 4 for value in primer])
+
+    assert len(seq) == 5
+
+
+def test_generate_with_full_primer_ignores_noise() -> None:
+    neuron = Neuron(3, 4)
+    primer = [0.0, 0.25, 0.5, 0.75]
+
+    first = neuron.generate(5, Sampler(seed=1), primer)
+    second = neuron.generate(5, Sampler(seed=2), primer)
+
+    assert first == second
+
+
+def test_ensemble_averages_predictions() -> None:
+    neurons = [Neuron(3, 4), Neuron(5, 4)]
+    ensemble = Neuron.ensemble(neurons)
+    state = np.random.default_rng(0).random((2, 5, 1))
+
+    expected = (neurons[0].predict(state[:, 2:]) + neurons[1].predict(state)) / 2
+
+    assert ensemble.input_length == 5
+    assert np.allclose(ensemble.predict(state), expected, atol=1e-6)
+
+
+def test_ensemble_requires_same_outputs() -> None:
+    with pytest.raises(ValueError):
+        Neuron.ensemble([Neuron(3, 4), Neuron(3, 5)])
+
+
+def test_learn_with_validation_reports_progress() -> None:
+    numeris = Numeris([[1, 2, 3, 4, 5, 6], [6, 5, 4, 3, 2, 1]])
+    neuron = Neuron(3, numeris.distinct_size)
+
+    with TemporaryDirectory() as tmp_path, chdir(tmp_path):
+        progress = neuron.learn(
+            numeris.make_series(3, numeris.data[:1]),
+            epochs=2,
+            validation=numeris.make_series(3, numeris.data[1:]),
+            patience=1,
+        )
+
+    assert 1 <= progress.epochs <= 2
+    assert 1 <= progress.best_epoch <= progress.epochs
+
+
+def test_learn_validates_every_epoch_with_few_held_out_batches() -> None:
+    numeris = Numeris([[1, 2, 3, 4, 5, 6, 7, 8], [8, 7, 6, 5, 4, 3, 2, 1]])
+    windows = dataset.windows(numeris, window_size=3, batch_size=2)
+    data, held = windows.split(0.5, seed=0)
+    logged: List[List[str]] = []
+    recorder = callbacks.LambdaCallback(
+        on_epoch_end=lambda epoch, logs: logged.append(list(logs))
+    )
+
+    with TemporaryDirectory() as tmp_path, chdir(tmp_path):
+        progress = Neuron(3, numeris.distinct_size).learn(
+            data,
+            epochs=3,
+            validation=held,
+            validation_batches=10,
+            extra_callbacks=[recorder],
+        )
+
+    assert len(held) < 10
+    assert len(logged) == 3
+    assert all("val_loss" in keys for keys in logged)
+    assert progress.epochs == 3
+
+
+def test_recorder_skips_epochs_without_monitored_loss() -> None:
+    recorder = Recorder("val_loss")
+
+    recorder.on_epoch_end(0, {"loss": 1.0})
+    recorder.on_epoch_end(1, {"loss": 0.5, "val_loss": 2.0})
+
+    assert recorder.losses == {1: 2.0}
+
+
 def test_load_save() -> None:
     neuron = Neuron(3, 4)
 
@@ -80,4 +251,96 @@ def test_check_save_size() -> None:
         neuron.save(path)
 
         with pytest.raises(ValueError):
-            Neuron.load(path, 2, 4)
+            Neuron.load(path, 3, 5)
+
+
+def test_load_with_different_window_size() -> None:
+    neuron = Neuron(3, 4)
+
+    with TemporaryDirectory() as tmp_path:
+        path = Path(tmp_path) / "object"
+        neuron.save(path)
+
+        loaded = Neuron.load(path, 7, 4)
+
+    assert loaded.input_length == 7
+    assert len(loaded.generate(2)) == 2
+
+
+def test_resized_shares_model() -> None:
+    neuron = Neuron(3, 4)
+
+    resized = neuron.resized(6)
+
+    assert resized.model is neuron.model
+    assert resized.predict(np.zeros((1, 6, 1))).shape == (1, 4)
+
+
+def test_attention_learns_from_windows_and_generates() -> None:
+    numeris = Numeris([[1, 2, 3, 4, 5, 6], [6, 5, 4, 3, 2, 1]])
+    windows = dataset.windows(numeris, window_size=3, batch_size=2)
+    neuron = Neuron(3, numeris.distinct_size, units=(8,), kind="attention")
+
+    with TemporaryDirectory() as tmp_path, chdir(tmp_path):
+        progress = neuron.learn(windows, epochs=1)
+
+        neuron.save(Path(tmp_path) / "object")
+        loaded = Neuron.load(Path(tmp_path) / "object", 3, numeris.distinct_size)
+
+    assert progress.epochs == 1
+    assert loaded.kind == "attention"
+    assert loaded.architecture()["kind"] == "attention"
+    assert len(loaded.generate(5)) == 5
+    assert len(loaded.beam_search(5, 2)) == 5
+
+
+def test_attention_stream_matches_whole_window_predictions() -> None:
+    neuron = Neuron(3, 5, units=(8,), kind="attention")
+
+    streamed = neuron.generate(6, Sampler(seed=3), primer=[0.0, 0.25, 0.5])
+
+    window = [0.0, 0.25, 0.5]
+    expected = []
+    for _ in range(6):
+        prediction = neuron.predict(np.array(window)[np.newaxis, :, np.newaxis])
+        value = float(neuron.normalize(int(np.argmax(prediction))))
+        expected.append(value)
+        window = window[1:] + [value]
+
+    assert streamed == expected
+
+
+def test_attention_requires_windows() -> None:
+    numeris = Numeris([[1, 2, 3, 4, 5, 6]])
+    neuron = Neuron(3, numeris.distinct_size, kind="attention")
+
+    with pytest.raises(ValueError):
+        neuron.learn(numeris.make_series(3), epochs=1)
+
+
+def test_ensemble_of_attention_and_gru() -> None:
+    neurons = [Neuron(3, 4), Neuron(4, 4, units=(8,), kind="attention")]
+    ensemble = Neuron.ensemble(neurons)
+    state = np.random.default_rng(0).random((2, 4, 1))
+
+    expected = (neurons[0].predict(state[:, 1:]) + neurons[1].predict(state)) / 2
+
+    assert np.allclose(ensemble.predict(state), expected, atol=1e-6)
+
+
+def test_sequence_gru_learns_every_position() -> None:
+    numeris = Numeris([[1, 2, 3, 4, 5, 6, 7, 8], [8, 7, 6, 5, 4, 3, 2, 1]])
+    windows = dataset.windows(numeris, window_size=3, batch_size=2).strided(3)
+    neuron = Neuron(3, numeris.distinct_size, units=(8, 8), kind="gru-sequence")
+
+    with TemporaryDirectory() as tmp_path, chdir(tmp_path):
+        progress = neuron.learn(windows, epochs=1)
+
+        neuron.save(Path(tmp_path) / "object")
+        loaded = Neuron.load(Path(tmp_path) / "object", 3, numeris.distinct_size)
+
+    assert progress.epochs == 1
+    assert neuron.model.output_shape == (None, None, numeris.distinct_size)
+    assert loaded.kind == "gru-sequence"
+    assert loaded.predict(np.zeros((2, 3, 1))).shape == (2, numeris.distinct_size)
+    assert len(loaded.generate(4)) == 4
@@ -3,6 +3,8 @@ Tests for categorization tools.
 """
 from __future__ import annotations
 
+import pickle
+
 from pathlib import Path
 from tempfile import TemporaryDirectory
 from typing import List
@@ -11,7 +13,14 @@ from hypothesis import given
 from hypothesis.strategies import lists
 
 from sarada import music21
-from sarada.notebook import Notebook, Score
+from sarada.notebook import (
+    Notebook,
+    NotebookWriter,
+    NoteSet,
+    Score,
+    filename,
+    to_musicals,
+)
 
 from .strategies import m21notes
 
@@ -75,12 +84,44 @@ def test_notebook_comparison_not_equals(note_list: List[Score]) -> None:
 def test_notebook_save_load_works(note_list: List[Score]) -> None:
     """Test loading and saving results in same object."""
     notebook = Notebook()
+    for i, notes in enumerate(note_list):
+        notebook.add(notes, tag=f"Voice {i}")
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        notebook.store(path)
+        loaded = notebook.read(path)
+
+    assert notebook == loaded
+
+
+@given(lists(lists(m21notes()), min_size=1, max_size=5))
+def test_notebook_reads_legacy_format(note_list: List[Score]) -> None:
+    """Test notebooks stored as single list are still readable."""
+    notebook = Notebook()
     for notes in note_list:
         notebook.add(notes)
 
     with TemporaryDirectory() as tmpdir:
         path = Path(tmpdir)
-        notebook.store(path)
+        with open(path / filename, "wb") as datafile:
+            pickle.dump(notebook.notes, datafile)
         loaded = notebook.read(path)
 
     assert notebook == loaded
+
+
+@given(lists(lists(m21notes()), max_size=5))
+def test_notebook_writer_appends_notesets(note_list: List[Score]) -> None:
+    """Test note sets appended one by one are read in the same order."""
+    notesets = [NoteSet(f"Voice {i}", to_musicals(n)) for i, n in enumerate(note_list)]
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir)
+        with NotebookWriter(path) as writer:
+            for noteset in notesets:
+                writer.append(noteset)
+        loaded = list(Notebook.iterate(path))
+
+    assert writer.count == len(notesets)
+    assert loaded == notesets
@@ -4,6 +4,8 @@ import json
 
 from typing import List
 
+import numpy as np
+
 from hypothesis import assume, given
 from hypothesis.strategies import SearchStrategy, data, integers, lists, text
 
@@ -132,3 +134,26 @@ def test_numeris_series_mappings_recreatable_from_json(texts: List[List[str]]) -
     other = Numeris(json.loads(jdata))
 
     assert original.mapping == other.mapping
+
+
+@given(lists(lists(text(max_size=3)), max_size=5), integers(min_value=0, max_value=4))
+def test_numeris_decategorize_batch_matches_rows(
+    texts: List[List[str]], seed: int
+) -> None:
+    numeris = Numeris(texts)
+    assume(numeris.distinct_size)
+    rng = np.random.default_rng(seed)
+    batch = rng.random((3, numeris.distinct_size))
+
+    decategorized = numeris.decategorize_batch(batch)
+
+    assert decategorized == [numeris.decategorize(row) for row in batch]
+
+
+@given(lists(lists(text(max_size=3)), max_size=5))
+def test_numeris_denumerize_accepts_arrays(texts: List[List[str]]) -> None:
+    numeris = Numeris(texts)
+    assume(numeris.data)
+    data = list(numeris.data[0])
+
+    assert numeris.denumerize(np.array(numeris.numerize(data))) == data
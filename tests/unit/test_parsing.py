@@ -1,14 +1,39 @@
 from __future__ import annotations
 
-from typing import List
+import itertools
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Iterator, List
+
+import pytest
 
 from hypothesis import given
 from hypothesis.strategies import lists
-from music21 import converter
+from music21 import converter, instrument
 
 from sarada import music21
-from sarada.notebook import Chord, Musical, Note
-from sarada.parsing import create_stream, extract_notes
+from sarada.notebook import (
+    Chord,
+    Musical,
+    Note,
+    Notebook,
+    Pitch,
+    QuarterLength,
+    Rest,
+)
+from sarada.parsing import (
+    Extraction,
+    create_stream,
+    extract_notes,
+    extract_parts,
+    ingest,
+    prefetch,
+    read_files_notesets,
+    read_score,
+    store_score,
+    token,
+)
 from tests.unit.strategies import chords, notes, rests
 
 
@@ -53,6 +78,106 @@ def test_extract_note_chords() -> None:
     assert chord.figure == "Gm7"  # type: ignore
 
 
+def test_read_score_returns_notes() -> None:
+    """Check if notes are read from single file."""
+    abc = """
+    X:1
+    T:Notes / pitches
+    M:C
+    L:1/4
+    K:C treble
+    C, D, E, F, | G, A, B, C
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "score.abc"
+        path.write_text(abc, encoding="utf-8")
+
+        musicals = read_score(path)
+
+    assert len(musicals) == 8
+    assert musicals[0] == Note(QuarterLength(1.0), Pitch("C3"))
+
+
+def test_ingest_stores_notesets() -> None:
+    """Check if note sets are appended to notebook along with distinct values."""
+    abc = """
+    X:1
+    T:Notes / pitches
+    M:C
+    L:1/4
+    K:C treble
+    C, D, E, F, | G, A, B, C
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        music_dir = Path(tmpdir) / "music"
+        music_dir.mkdir()
+        (music_dir / "first.abc").write_text(abc, encoding="utf-8")
+        (music_dir / "second.abc").write_text(abc, encoding="utf-8")
+
+        ingested = ingest(music_dir, Path(tmpdir), buffer=1)
+        notebook = Notebook.read(Path(tmpdir))
+
+    assert ingested.notesets == len(notebook) == 2
+    assert ingested.distinct == list(dict.fromkeys(notebook.notes[0]))
+
+
+def test_notesets_are_grouped_by_files() -> None:
+    abc = """
+    X:1
+    T:Notes / pitches
+    M:C
+    L:1/4
+    K:C treble
+    C, D, E, F, | G, A, B, C
+    """
+
+    with TemporaryDirectory() as tmpdir:
+        music_dir = Path(tmpdir)
+        (music_dir / "valid.abc").write_text(abc, encoding="utf-8")
+        (music_dir / "broken.mxl").write_text("not a score", encoding="utf-8")
+
+        files = list(read_files_notesets(music_dir))
+
+    assert [(path.name, len(notesets)) for path, notesets in files] == [
+        ("valid.abc", 1)
+    ]
+
+
+def test_extract_parts_tags_instruments() -> None:
+    """Check if every part is extracted and tagged with its instrument."""
+    score = music21.Score()
+    for name, pitch in (("Flute", "C5"), ("Oboe", "E4")):
+        part = music21.Part()
+        part.insert(0, instrument.fromString(name))
+        part.append(music21.Note(pitch))
+        score.insert(0, part)
+
+    everything = list(extract_parts([score], Extraction(all_parts=True)))
+    oboe = list(extract_parts([score], Extraction(instruments=("oboe",))))
+    first = list(extract_parts([score]))
+
+    assert [noteset.tag for noteset in everything] == ["Flute", "Oboe"]
+    assert oboe == everything[1:]
+    assert first == everything[:1]
+
+
+def test_prefetch_raises_producer_errors() -> None:
+    def failing() -> Iterator[int]:
+        yield 1
+        raise IOError("Broken")
+
+    with pytest.raises(IOError, match="Broken"):
+        list(prefetch(failing(), 1))
+
+
+def test_prefetch_bounds_infinite_producer() -> None:
+    items = prefetch(itertools.count(), 1)
+
+    assert list(itertools.islice(items, 3)) == [0, 1, 2]
+
+
 @given(lists(notes() | chords() | rests()))
 def test_create_stream_length(musicals: List[Musical]) -> None:
     stream = create_stream(musicals)
@@ -83,3 +208,33 @@ def test_create_stream_notes_offsets_notes(pitches: List[Musical]) -> None:
     nxt: music21.Note
     for prv, nxt in zip(stream.notes[:-1], stream.notes[1:]):
         assert nxt.offset - prv.offset > 0
+
+
+@given(lists(notes() | chords() | rests(), max_size=20))
+def test_tokens_keep_one_note_per_line(musicals: List[Musical]) -> None:
+    with TemporaryDirectory() as tmpdir:
+        (path,) = store_score(musicals, Path(tmpdir) / "out.mid", ["tokens"])
+        lines = path.read_text().splitlines()
+
+    assert path.name == "out.txt"
+    assert lines == [token(musical) for musical in musicals]
+
+
+def test_store_score_writes_each_format() -> None:
+    musicals: List[Musical] = [
+        Note(QuarterLength(1.0), Pitch("C4")),
+        Chord(QuarterLength(0.5), (Pitch("E4"), Pitch("G4"))),
+    ]
+
+    with TemporaryDirectory() as tmpdir:
+        paths = store_score(
+            musicals, Path(tmpdir) / "out.mid", ["midi", "musicxml", "tokens"]
+        )
+        names = [path.name for path in paths]
+        midi = read_score(paths[0])
+        xml = read_score(paths[1])
+
+    assert names == ["out.mid", "out.musicxml", "out.txt"]
+    expected = ["C4", ("E4", "G4")]
+    for read in (midi, xml):
+        assert [m.pitch for m in read if not isinstance(m, Rest)] == expected
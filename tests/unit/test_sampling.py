@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from typing import List
+
+import numpy as np
+import pytest
+
+from hypothesis import given
+from hypothesis.strategies import floats, integers, lists
+
+from sarada.sampling import Sampler
+
+probabilities = lists(
+    lists(floats(min_value=0.01, max_value=1.0), min_size=5, max_size=5),
+    min_size=1,
+    max_size=8,
+)
+
+
+@given(probabilities)
+def test_greedy_sampling_picks_most_probable(rows: List[List[float]]) -> None:
+    batch = np.array(rows)
+    sampler = Sampler()
+
+    assert (sampler.sample(batch) == np.argmax(batch, axis=-1)).all()
+
+
+@given(probabilities, integers(min_value=1, max_value=5), integers(min_value=0))
+def test_top_k_sampling_picks_from_k_most_probable(
+    rows: List[List[float]], k: int, seed: int
+) -> None:
+    batch = np.array(rows)
+    sampler = Sampler(temperature=1.0, top_k=k, seed=seed)
+
+    picked = sampler.sample(batch)
+
+    kth = np.sort(batch, axis=-1)[:, -k]
+    assert (batch[np.arange(len(batch)), picked] >= kth).all()
+
+
+@given(probabilities, integers(min_value=0))
+def test_top_p_sampling_keeps_most_probable(rows: List[List[float]], seed: int) -> None:
+    batch = np.array(rows)
+    sampler = Sampler(temperature=1.0, top_p=1e-6, seed=seed)
+
+    picked = sampler.sample(batch)
+
+    best = batch.max(axis=-1)
+    assert (batch[np.arange(len(batch)), picked] == best).all()
+
+
+@given(probabilities, integers(min_value=0))
+def test_sampling_is_reproducible_with_seed(rows: List[List[float]], seed: int) -> None:
+    batch = np.array(rows)
+
+    first = Sampler(temperature=1.5, top_k=3, top_p=0.9, seed=seed).sample(batch)
+    second = Sampler(temperature=1.5, top_k=3, top_p=0.9, seed=seed).sample(batch)
+
+    assert (first == second).all()
+
+
+def test_greedy_sampling_distinguishes_tiny_probabilities() -> None:
+    batch = np.array([[1e-13, 2e-13, 0.0]])
+
+    assert Sampler().sample(batch)[0] == 1
+
+
+def test_top_p_sampling_ranks_tiny_probabilities() -> None:
+    batch = np.array([[1e-13, 2e-13, 0.0]] * 10)
+    sampler = Sampler(temperature=1.0, top_p=1e-6, seed=0)
+
+    assert (sampler.sample(batch) == 1).all()
+
+
+def test_repetition_penalty_avoids_repeated_values() -> None:
+    batch = np.array([[0.5, 0.4, 0.1]])
+    sampler = Sampler(repetition_penalty=2.0)
+
+    assert sampler.sample(batch, np.array([[0]]))[0] == 1
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"temperature": -1.0},
+        {"top_k": -1},
+        {"top_p": 0.0},
+        {"top_p": 1.5},
+        {"repetition_penalty": 0.0},
+    ],
+)
+def test_sampler_rejects_invalid_options(options: dict) -> None:  # type: ignore
+    with pytest.raises(ValueError):
+        Sampler(**options)
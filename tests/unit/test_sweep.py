@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+import math
+import statistics
+import threading
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Dict, List
+
+import pytest
+
+from hypothesis import given
+from hypothesis.strategies import floats, integers, just, lists
+
+from sarada.neuron import default_units
+from sarada.sweep import Pruner, Result, Space, Trial, make_trials, rank, read_space
+
+
+def test_read_space_uses_defaults() -> None:
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "space.json"
+        path.write_text(json.dumps({"window_size": [10, 20]}), encoding="utf-8")
+
+        space = read_space(path)
+
+    assert space.window_size == [10, 20]
+    assert space.units == [list(default_units)]
+
+
+def test_read_space_rejects_unknown() -> None:
+    with TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "space.json"
+        path.write_text(json.dumps({"layers": [1]}), encoding="utf-8")
+
+        with pytest.raises(ValueError):
+            read_space(path)
+
+
+@given(
+    lists(integers(min_value=1), min_size=1, max_size=3, unique=True),
+    lists(floats(min_value=0, exclude_min=True), min_size=1, max_size=3, unique=True),
+    integers(min_value=0, max_value=10),
+)
+def test_make_trials_are_unique(
+    windows: List[int], rates: List[float], count: int
+) -> None:
+    space = Space(windows, [[8]], rates, [16])
+
+    trials = make_trials(space, count, seed=0)
+
+    expected = len(windows) * len(rates)
+    assert len(trials) == (count if 0 < count < expected else expected)
+    assert len({trial[1:] for trial in trials}) == len(trials)
+
+
+@given(
+    floats(min_value=0, max_value=10),
+    lists(floats(min_value=0, max_value=10), min_size=2),
+)
+def test_pruner_prunes_worse_than_median(loss: float, others: List[float]) -> None:
+    losses: Dict[int, List[float]] = {}
+    pruner = Pruner("loss", losses, threading.Lock(), warmup=1)
+
+    pruned = pruner.should_prune(0, loss, others)
+
+    assert pruned == (loss > statistics.median(others))
+
+
+def test_pruner_waits_for_warmup() -> None:
+    losses: Dict[int, List[float]] = {}
+    pruner = Pruner("loss", losses, threading.Lock(), warmup=3)
+
+    assert not pruner.should_prune(1, 10.0, [1.0, 2.0, 3.0])
+    assert pruner.should_prune(2, 10.0, [1.0, 2.0, 3.0])
+
+
+@given(lists(floats(min_value=0, max_value=10) | just(math.nan), min_size=1))
+def test_results_with_nan_loss_are_ranked_last(losses: List[float]) -> None:
+    trial = Trial(0, 10, (8,), 0.1, 16)
+    results = [Result(trial, 1, 0, loss, False) for loss in losses]
+
+    ranked = [result.loss for result in sorted(results, key=rank)]
+    finite = sorted(loss for loss in losses if not math.isnan(loss))
+
+    assert ranked[: len(finite)] == finite
+    assert all(math.isnan(loss) for loss in ranked[len(finite) :])